@@ -0,0 +1,34 @@
+"""Embeddings das startups
+
+Revision ID: 7f3a9c1d2e4b
+Revises: 2c27dfefd871
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3a9c1d2e4b'
+down_revision: Union[str, Sequence[str], None] = '2c27dfefd871'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Vetores float32 little-endian (ver backend/app/vector_type.py)
+    op.create_table('startup_embeddings',
+    sa.Column('empresa_id', sa.BigInteger(), nullable=False),
+    sa.Column('vetor', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['empresa_id'], ['startups.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('empresa_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('startup_embeddings')
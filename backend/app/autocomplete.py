@@ -0,0 +1,163 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from unidecode import unidecode
+
+# Índice de prefixos para o autocomplete da caixa de busca: um array ordenado de
+# chaves normalizadas, consultado com bisect. Cada nome entra uma vez por
+# início de palavra ("cyberguard pro", "pro"), para "pro" sugerir "CyberGuard Pro".
+#
+# Ordem das sugestões: prefixo no início do nome, depois popularidade, depois
+# ordem alfabética. A popularidade de um setor é o número de empresas nele; as
+# empresas não têm sinal de popularidade no índice (o store só guarda nome e
+# campos categóricos), então empatam e ficam em ordem alfabética.
+#
+# O índice vive no estado publicado do SearchEngine e as escritas o atualizam
+# com with_company/without_company (cópias, como o resto do estado), em vez de
+# remontá-lo na primeira sugestão depois de cada escrita.
+
+AUTOCOMPLETE_LIMIT = 8
+# Bônus de score para o prefixo que casa com o começo do nome
+NAME_START_BONUS = 1e9
+
+
+def normalize_prefix(text: str) -> str:
+    return " ".join(unidecode(text or "").lower().split())
+
+
+def _sectors(company: Any) -> set:
+    return {company.setor_principal, company.setor_secundario} - {None, ""}
+
+
+def _without(items: list, removed: List[int]) -> list:
+    """Cópia de `items` sem as posições (ordenadas) de `removed`."""
+    result = list(items)
+    for position in reversed(removed):
+        del result[position]
+    return result
+
+
+class PrefixIndex:
+
+    def __init__(self, entries: List[Tuple[str, float, str, str, Optional[int]]], sector_counts: Optional[Counter] = None):
+        # (chave, score, tipo, texto, id) ordenado por chave
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [entry[0] for entry in entries]
+        self.scores = np.array([entry[1] for entry in entries], dtype=np.float64)
+        self.suggestions = [(entry[2], entry[3], entry[4]) for entry in entries]
+        # Empresas por setor: o score das entradas de setor
+        self.sector_counts = sector_counts if sector_counts is not None else Counter()
+
+    @classmethod
+    def from_companies(cls, companies: List[Any]):
+        entries = []
+        sectors = Counter()
+        for company in companies:
+            if company is None:
+                continue
+            cls._add_entries(entries, company.nome_da_empresa, 0.0, "empresa", company.id)
+            sectors.update(_sectors(company))
+        for sector, count in sectors.items():
+            cls._add_entries(entries, sector, float(count), "setor", None)
+        return cls(entries, sectors)
+
+    def with_company(self, company: Any) -> "PrefixIndex":
+        """Cópia com o nome da empresa incluído e os setores dela contados."""
+        added = []
+        self._add_entries(added, company.nome_da_empresa, 0.0, "empresa", company.id)
+        return self._edited(company, 1, [], added)
+
+    def without_company(self, company: Any) -> "PrefixIndex":
+        """Cópia sem o nome da empresa e com os setores dela descontados."""
+        removed = self._positions(company.nome_da_empresa, ("empresa", company.nome_da_empresa, company.id))
+        return self._edited(company, -1, removed, [])
+
+    def _edited(self, company: Any, sector_delta: int, removed: List[int], added: list) -> "PrefixIndex":
+        # O score de um setor muda com a contagem: as entradas dele saem e voltam com o novo valor
+        sector_counts = Counter(self.sector_counts)
+        for sector in _sectors(company):
+            if sector_counts[sector]:
+                removed += self._positions(sector, ("setor", sector, None))
+            sector_counts[sector] += sector_delta
+            if sector_counts[sector] > 0:
+                self._add_entries(added, sector, float(sector_counts[sector]), "setor", None)
+            else:
+                del sector_counts[sector]
+
+        removed = sorted(set(removed))
+        keep = np.ones(len(self.keys), dtype=bool)
+        keep[removed] = False
+        index = PrefixIndex.__new__(PrefixIndex)
+        index.keys = _without(self.keys, removed)
+        index.suggestions = _without(self.suggestions, removed)
+        index.sector_counts = sector_counts
+
+        added.sort(key=lambda entry: entry[0])
+        positions = [bisect_left(index.keys, entry[0]) for entry in added]
+        # De trás para frente: as posições calculadas antes continuam valendo
+        for position, entry in zip(reversed(positions), reversed(added)):
+            index.keys.insert(position, entry[0])
+            index.suggestions.insert(position, (entry[2], entry[3], entry[4]))
+        index.scores = np.insert(self.scores[keep], positions, [entry[1] for entry in added]).astype(np.float64)
+        return index
+
+    def _positions(self, text: str, suggestion: Tuple[str, str, Optional[int]]) -> List[int]:
+        """Posições das entradas de `suggestion` (uma por início de palavra de `text`)."""
+        positions = []
+        words = normalize_prefix(text).split()
+        for position in range(len(words)):
+            key = " ".join(words[position:])
+            i = bisect_left(self.keys, key)
+            while i < len(self.keys) and self.keys[i] == key:
+                if self.suggestions[i] == suggestion:
+                    positions.append(i)
+                i += 1
+        return positions
+
+    @staticmethod
+    def _add_entries(entries, text: str, score: float, kind: str, company_id: Optional[int]):
+        words = normalize_prefix(text).split()
+        for position in range(len(words)):
+            bonus = NAME_START_BONUS if position == 0 else 0.0
+            entries.append((" ".join(words[position:]), score + bonus, kind, text, company_id))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def search(self, prefix: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[Tuple[str, str, Optional[int]]]:
+        """Até `limit` sugestões (tipo, texto, id) cujo nome tem uma palavra começando por `prefix`."""
+        prefix = normalize_prefix(prefix)
+        if not prefix or limit <= 0:
+            return []
+
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + "\uffff", lo=start)
+        if start == end:
+            return []
+
+        scores = self.scores[start:end]
+        # Um mesmo nome pode casar por mais de uma palavra: pega folga e deduplica
+        wanted = min(len(scores), limit * 4)
+        if wanted < len(scores):
+            kth_score = -np.partition(-scores, wanted - 1)[wanted - 1]
+            above = np.flatnonzero(scores > kth_score)
+            # No empate do corte ficam as primeiras em ordem alfabética
+            tied = np.flatnonzero(scores == kth_score)[:wanted - len(above)]
+            candidates = np.concatenate([above, tied])
+        else:
+            candidates = np.arange(len(scores))
+        # Score decrescente; empate pela chave (alfabética), que é a ordem do array
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+
+        results, seen = [], set()
+        for offset in candidates:
+            suggestion = self.suggestions[start + offset]
+            if suggestion in seen:
+                continue
+            seen.add(suggestion)
+            results.append(suggestion)
+            if len(results) == limit:
+                break
+        return results
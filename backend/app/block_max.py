@@ -0,0 +1,106 @@
+import os
+from typing import Tuple
+
+import numpy as np
+
+# Top-k por block-max MaxScore sobre listas invertidas da matriz TF-IDF.
+#
+# As linhas são divididas em blocos de `block_rows` linhas consecutivas. Para
+# cada (termo, bloco) em que o termo aparece guarda-se o maior peso dele no
+# bloco; com os pesos q_t da query, Σ q_t * max(t, bloco) é um limite superior
+# do cosseno de qualquer empresa do bloco. O SearchEngine lê os blocos em ordem
+# decrescente de limite e para quando nem o limite alcança o k-ésimo score já
+# encontrado (ver SearchEngine._block_max_top_k).
+#
+# Só as postings dos termos da query são lidas, e o cosseno de cada linha lida
+# é exato: os mesmos produtos, somados na mesma ordem de termos do produto
+# esparso da busca exaustiva.
+
+SEARCH_RETRIEVAL = os.getenv("SEARCH_RETRIEVAL", "exhaustive")
+RETRIEVAL_MODES = ("exhaustive", "maxscore")
+# Blocos menores dão limites mais justos, ao custo de mais entradas por termo
+BLOCK_MAX_ROWS = int(os.getenv("SEARCH_BLOCK_MAX_ROWS", "128"))
+
+
+def validate_retrieval(retrieval: str) -> str:
+    if retrieval not in RETRIEVAL_MODES:
+        raise ValueError(f"SEARCH_RETRIEVAL desconhecido: {retrieval!r} (use 'exhaustive' ou 'maxscore').")
+    return retrieval
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenação de arange(start, end) de cada par, sem laço em Python."""
+    lengths = ends - starts
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(int(lengths.sum()), dtype=np.int64)
+
+
+class BlockMaxIndex:
+    """
+    Postings por termo (linhas em ordem crescente) e, por termo, uma entrada
+    por bloco com ocorrência: o bloco, onde as postings dele começam e o maior
+    peso. É uma cópia da matriz (CSC): montada sob demanda e descartada a cada
+    escrita, como as sub-matrizes por fase.
+    """
+
+    def __init__(self, company_vectors, block_rows: int = BLOCK_MAX_ROWS):
+        postings = company_vectors.tocsc(copy=True)
+        # Linhas removidas ficam com peso 0 até a compactação
+        postings.eliminate_zeros()
+        postings.sort_indices()
+        self.block_rows = block_rows
+        self.n_rows, n_terms = company_vectors.shape
+        n_blocks = max(1, -(-self.n_rows // block_rows))
+
+        self.rows = postings.indices
+        self.weights = postings.data
+        terms = np.repeat(np.arange(n_terms, dtype=np.int64), np.diff(postings.indptr))
+        keys = terms * n_blocks + self.rows // block_rows
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+
+        self.entry_block = (keys[starts] % n_blocks).astype(np.int32)
+        # Postings da entrada i: entry_start[i]:entry_start[i + 1]
+        self.entry_start = np.append(starts, len(keys)).astype(np.int64)
+        self.entry_max = np.maximum.reduceat(self.weights, starts) if len(starts) else np.empty(0)
+        # Entradas do termo t: entry_ptr[t]:entry_ptr[t + 1]
+        self.entry_ptr = np.searchsorted(keys[starts] // n_blocks, np.arange(n_terms + 1)).astype(np.int64)
+
+    def block_bounds(self, columns: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Blocos com algum termo da query e o limite superior do cosseno em cada um."""
+        starts, ends = self.entry_ptr[columns], self.entry_ptr[columns + 1]
+        entries = _ranges(starts, ends)
+        term_weights = np.repeat(weights, ends - starts)
+        blocks, inverse = np.unique(self.entry_block[entries], return_inverse=True)
+        return blocks, np.bincount(inverse, weights=self.entry_max[entries] * term_weights, minlength=len(blocks))
+
+    def score_blocks(self, columns: np.ndarray, weights: np.ndarray, blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Linhas dos `blocks` (em ordem crescente) com algum termo da query e o
+        cosseno exato de cada uma.
+        """
+        entries, term_weights = [], []
+        for column, weight in zip(columns, weights):
+            first, last = self.entry_ptr[column], self.entry_ptr[column + 1]
+            term_blocks = self.entry_block[first:last]
+            positions = np.searchsorted(term_blocks, blocks)
+            found = positions < len(term_blocks)
+            found[found] = term_blocks[positions[found]] == blocks[found]
+            entries.append(first + positions[found])
+            term_weights.append(np.full(int(found.sum()), weight))
+        entries = np.concatenate(entries)
+        if not len(entries):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        starts, ends = self.entry_start[entries], self.entry_start[entries + 1]
+        postings = _ranges(starts, ends)
+        # Termo a termo, na ordem das colunas: a soma por linha segue a mesma ordem do produto esparso
+        products = self.weights[postings] * np.repeat(np.concatenate(term_weights), ends - starts)
+        rows, inverse = np.unique(self.rows[postings], return_inverse=True)
+        return rows.astype(np.int64), np.bincount(inverse, weights=products, minlength=len(rows))
+
+    def memory_bytes(self) -> int:
+        arrays = (self.rows, self.weights, self.entry_block, self.entry_start, self.entry_max, self.entry_ptr)
+        return sum(array.nbytes for array in arrays)
+
+    def stats(self) -> dict:
+        return {"postings": len(self.rows), "entries": len(self.entry_block), "block_rows": self.block_rows}
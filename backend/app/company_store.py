@@ -0,0 +1,160 @@
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# O índice guarda só o que a busca lê de cada empresa: id, nome (autocomplete)
+# e os campos categóricos (fase para filtrar, setores/fase para as facetas),
+# estes como códigos inteiros sobre uma tabela de valores internados. O texto
+# normalizado do fuzzy fica em SearchEngine.company_texts. O registro completo
+# (solução, CNPJ, contatos...) é lido do banco só para os ids devolvidos.
+
+CATEGORICAL_FIELDS = ("setor_principal", "setor_secundario", "fase_da_startup")
+
+
+class CompanyRecord:
+    """Vista leve de uma linha do índice, com os atributos que o ORM também tem."""
+
+    __slots__ = ("id", "nome_da_empresa", "setor_principal", "setor_secundario", "fase_da_startup")
+
+    def __init__(self, id: int, nome_da_empresa: Optional[str], setor_principal, setor_secundario, fase_da_startup):
+        self.id = id
+        self.nome_da_empresa = nome_da_empresa
+        self.setor_principal = setor_principal
+        self.setor_secundario = setor_secundario
+        self.fase_da_startup = fase_da_startup
+
+    def __repr__(self) -> str:
+        return f"CompanyRecord(id={self.id}, nome_da_empresa={self.nome_da_empresa!r})"
+
+
+class CompanyStore:
+    """
+    Colunas por linha do índice: ids (int64, -1 = linha removida), nomes e um
+    código int32 por campo categórico (-1 = linha removida). Cada valor
+    distinto de setor/fase existe uma vez só, em `values[campo]`.
+
+    As escritas vêm com o write lock do engine; as buscas só leem.
+    """
+
+    __slots__ = ("ids", "names", "codes", "values", "_code_by_value")
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.names: List[Optional[str]] = []
+        self.codes: Dict[str, np.ndarray] = {field: np.empty(0, dtype=np.int32) for field in CATEGORICAL_FIELDS}
+        self.values: Dict[str, List[Any]] = {field: [] for field in CATEGORICAL_FIELDS}
+        self._code_by_value: Dict[str, Dict[Any, int]] = {field: {} for field in CATEGORICAL_FIELDS}
+
+    @classmethod
+    def from_companies(cls, companies: Iterable[Any]) -> "CompanyStore":
+        """
+        Store com uma linha por empresa (objetos do ORM, linhas de uma consulta
+        ou qualquer um com os mesmos atributos). Percorre `companies` uma vez
+        só, sem guardar os objetos: serve para um cursor em streaming.
+        """
+        store = cls()
+        ids = array("q")
+        codes = {field: array("i") for field in CATEGORICAL_FIELDS}
+        for company in companies:
+            ids.append(company.id)
+            store.names.append(company.nome_da_empresa)
+            for field in CATEGORICAL_FIELDS:
+                codes[field].append(store._intern(field, getattr(company, field)))
+        store.ids = np.array(ids, dtype=np.int64)
+        for field in CATEGORICAL_FIELDS:
+            store.codes[field] = np.array(codes[field], dtype=np.int32)
+        return store
+
+    def _intern(self, field: str, value: Any) -> int:
+        code_by_value = self._code_by_value[field]
+        code = code_by_value.get(value)
+        if code is None:
+            code = code_by_value[value] = len(self.values[field])
+            self.values[field].append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def copy(self) -> "CompanyStore":
+        """Cópia independente, para uma escrita: as buscas em andamento continuam lendo este."""
+        store = CompanyStore()
+        store.ids = self.ids.copy()
+        store.names = list(self.names)
+        store.codes = {field: codes.copy() for field, codes in self.codes.items()}
+        store.values = {field: list(values) for field, values in self.values.items()}
+        store._code_by_value = {field: dict(codes) for field, codes in self._code_by_value.items()}
+        return store
+
+    def append(self, company: Any) -> int:
+        """Acrescenta uma linha no fim e devolve o número dela."""
+        self.ids = np.append(self.ids, np.int64(company.id))
+        self.names.append(company.nome_da_empresa)
+        for field in CATEGORICAL_FIELDS:
+            self.codes[field] = np.append(self.codes[field], np.int32(self._intern(field, getattr(company, field))))
+        return len(self.ids) - 1
+
+    def kill(self, row: int):
+        """Marca a linha como removida; ela some fisicamente em `filter`."""
+        self.ids[row] = -1
+        self.names[row] = None
+        for codes in self.codes.values():
+            codes[row] = -1
+
+    def alive(self) -> np.ndarray:
+        return self.ids >= 0
+
+    def filter(self, keep: np.ndarray) -> "CompanyStore":
+        """
+        Novo store só com as linhas de `keep`, re-internando os valores (na
+        ordem de primeira aparição, como num store montado do zero).
+        """
+        store = CompanyStore()
+        store.ids = self.ids[keep]
+        store.names = [name for name, k in zip(self.names, keep) if k]
+        for field in CATEGORICAL_FIELDS:
+            codes = self.codes[field][keep]
+            used, first_rows = np.unique(codes, return_index=True)
+            order = used[np.argsort(first_rows)]
+            remap = np.full(len(self.values[field]), -1, dtype=np.int32)
+            remap[order] = np.arange(len(order), dtype=np.int32)
+            store.values[field] = [self.values[field][code] for code in order]
+            store._code_by_value[field] = {value: code for code, value in enumerate(store.values[field])}
+            store.codes[field] = remap[codes] if len(codes) else codes
+        return store
+
+    def value(self, field: str, row: int) -> Any:
+        return self.values[field][self.codes[field][row]]
+
+    def record(self, row: int) -> Optional[CompanyRecord]:
+        """CompanyRecord da linha (None se ela foi removida)."""
+        company_id = int(self.ids[row])
+        if company_id < 0:
+            return None
+        return CompanyRecord(
+            company_id, self.names[row], *(self.value(field, row) for field in CATEGORICAL_FIELDS)
+        )
+
+    def records(self) -> List[Optional[CompanyRecord]]:
+        return [self.record(row) for row in range(len(self.ids))]
+
+    def rows_by_value(self, field: str) -> Dict[Any, np.ndarray]:
+        """{valor: linhas (em ordem)} do campo, sem as linhas removidas."""
+        codes = self.codes[field]
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+        values = self.values[field]
+        return {
+            values[int(group_codes[0])]: rows.astype(np.int64)
+            for rows, group_codes in zip(np.split(order, bounds), np.split(sorted_codes, bounds))
+            if len(rows) and group_codes[0] >= 0
+        }
+
+    def memory_bytes(self) -> int:
+        """Aproximado: arrays, strings dos nomes e dos valores internados."""
+        total = self.ids.nbytes + sum(codes.nbytes for codes in self.codes.values())
+        total += sum(len(name) for name in self.names if name)
+        total += sum(len(str(value)) for values in self.values.values() for value in values)
+        return total
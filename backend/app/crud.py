@@ -1,6 +1,14 @@
+import io
+import numpy as np
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Optional, Sequence, Tuple
 from . import models, schemas, security # Importamos security para o hashing
+from .vector_type import encode_vector
+
+# Embeddings enviados por ida ao banco na regravação completa
+EMBEDDINGS_BATCH_SIZE = 5000
+# Linhas por ida ao banco no build do índice de busca em streaming
+INDEX_STREAM_BATCH_SIZE = 2000
 
 # --- Funções CRUD para Empresa ---
 
@@ -22,6 +30,38 @@ def get_all_empresas(db: Session,  skip: int = 0, limit: Optional[int] = None):
         query = query.limit(limit)
     return query.all()
 
+def get_empresas_by_ids(db: Session, empresa_ids: Sequence[int]):
+    """
+    Busca várias empresas numa única consulta (WHERE id IN (...)), devolvidas
+    na ordem de `empresa_ids`. Ids que não existem mais são omitidos.
+
+    """
+    if not empresa_ids:
+        return []
+    by_id = {e.id: e for e in db.query(models.Empresa).filter(models.Empresa.id.in_(list(empresa_ids))).all()}
+    return [by_id[empresa_id] for empresa_id in empresa_ids if empresa_id in by_id]
+
+def stream_empresas_for_index(db: Session, batch_size: int = INDEX_STREAM_BATCH_SIZE):
+    """
+    Só as colunas que o índice de busca lê, em ordem de id, em lotes de
+    `batch_size` de um cursor no servidor (yield_per liga o stream_results).
+    Devolve linhas, não objetos do ORM: nada entra no identity map da sessão,
+    e a tabela nunca fica inteira em memória.
+
+    """
+    return (
+        db.query(
+            models.Empresa.id,
+            models.Empresa.nome_da_empresa,
+            models.Empresa.solucao,
+            models.Empresa.setor_principal,
+            models.Empresa.setor_secundario,
+            models.Empresa.fase_da_startup,
+        )
+        .order_by(models.Empresa.id)
+        .yield_per(batch_size)
+    )
+
 def update_empresa_link(db: Session, empresa_id: int, link: str):
     """
     Atualiza o campo link_apresentacao de uma empresa específica.
@@ -58,6 +98,53 @@ def update_empresa_telefone_contato(db: Session, db_empresa: models.Empresa, tel
 
 
 
+# --- Funções CRUD para Embeddings ---
+
+def replace_empresa_embeddings(db: Session, empresa_ids: Sequence[int], vectors: np.ndarray) -> int:
+    """
+    Regrava todos os embeddings numa transação (refresh completo do corpus).
+    No PostgreSQL usa um COPY por lote; nos outros bancos, um executemany por lote.
+    Retorna o número de vetores gravados.
+    """
+    table = models.EmpresaEmbedding.__table__
+    db.execute(table.delete())
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Cursor cru do psycopg2 (copy_expert), fechado ao fim mesmo se um lote falhar
+        with db.connection().connection.cursor() as cursor:
+            for start in range(0, len(empresa_ids), EMBEDDINGS_BATCH_SIZE):
+                buffer = io.StringIO()
+                for empresa_id, vector in zip(empresa_ids[start:start + EMBEDDINGS_BATCH_SIZE], vectors[start:start + EMBEDDINGS_BATCH_SIZE]):
+                    # bytea em hex; no formato texto do COPY a barra precisa ser escapada
+                    buffer.write(f"{int(empresa_id)}\t\\\\x{encode_vector(vector).hex()}\n")
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY {table.name} (empresa_id, vetor) FROM STDIN", buffer)
+    else:
+        for start in range(0, len(empresa_ids), EMBEDDINGS_BATCH_SIZE):
+            db.execute(
+                table.insert(),
+                [
+                    {"empresa_id": int(empresa_id), "vetor": vector}
+                    for empresa_id, vector in zip(
+                        empresa_ids[start:start + EMBEDDINGS_BATCH_SIZE], vectors[start:start + EMBEDDINGS_BATCH_SIZE]
+                    )
+                ],
+            )
+
+    db.commit()
+    return len(empresa_ids)
+
+def get_empresa_embeddings(db: Session) -> Tuple[np.ndarray, np.ndarray]:
+    """Todos os embeddings como (ids, matriz float32 linhas x dimensões)."""
+    table = models.EmpresaEmbedding.__table__
+    rows = db.execute(table.select().order_by(table.c.empresa_id)).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    return np.array([row.empresa_id for row in rows], dtype=np.int64), np.vstack([row.vetor for row in rows])
+
+
+
+
 # --- Funções CRUD para Usuário ---
 
 def get_user_by_email(db: Session, email: str):
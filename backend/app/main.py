@@ -1,5 +1,4 @@
 import uvicorn
-import nltk
 import warnings
 
 from .routers import empresa_router, upload_router 
@@ -8,11 +7,13 @@ warnings.filterwarnings(
     message="The parameter 'token_pattern' will not be used since 'tokenizer' is not None", 
     category=UserWarning
 )
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from contextlib import asynccontextmanager
+import asyncio
+import time
 
 # --- para StaticFiles ---
 import os
@@ -21,6 +22,14 @@ from fastapi.staticfiles import StaticFiles
 # -----
 
 from .search_engine import SearchEngine
+from .nlp_resources import nlp_resources
+from .search_executor import search_executor, SearchQueueFull
+from .semantic_index import SemanticIndexUnavailable, SEMANTIC_NPROBE
+from .autocomplete import AUTOCOMPLETE_LIMIT
+from .rankers import validate_fields
+from .search_metrics import SearchTrace, search_metrics
+from .search_snapshot import load_or_build_rows, load_published, snapshot_changed, SEARCH_SNAPSHOT_DIR, SEARCH_SNAPSHOT_POLL_SECONDS
+from .search_rebuild import SearchIndexRebuilder, RebuildInProgress, SEARCH_REBUILD_INTERVAL_SECONDS
 from .database import engine,  get_db, table_registry # Base,
 from . import models, security, schemas, crud
 from .routers import upload_router, empresa_router
@@ -42,9 +51,71 @@ os.makedirs(STATIC_DIR, exist_ok=True)
 search_engine_instance: Optional[SearchEngine] = None
 
 
+def stream_all_companies():
+    """
+    Empresas em streaming (só as colunas indexadas, em ordem de id) numa sessão
+    própria, fechada ao fim da leitura (roda fora do event loop).
+    """
+    db = next(get_db())
+    try:
+        yield from crud.stream_empresas_for_index(db)
+    finally:
+        db.close()
+
+
+def load_companies_by_ids(company_ids: List[int]) -> List[models.Empresa]:
+    """
+    Registros completos das empresas devolvidas pela busca, na ordem dos ids,
+    numa única consulta e numa sessão própria (roda fora do event loop). O
+    índice só guarda id, nome e setor/fase de cada empresa.
+    """
+    if not company_ids:
+        return []
+    db = next(get_db())
+    try:
+        return crud.get_empresas_by_ids(db, company_ids)
+    finally:
+        db.close()
+
+
+def load_published_snapshot() -> Optional[SearchEngine]:
+    """
+    Adota o snapshot publicado por outro worker (roda fora do event loop). A
+    geração é aceita como publicada, mesmo que o banco já tenha mudado: senão o
+    worker releria a tabela a cada poll sem nunca trocar de índice.
+    """
+    return load_published(SEARCH_SNAPSHOT_DIR, stream_all_companies())
+
+
+def set_search_engine(new_engine: Optional[SearchEngine]):
+    # Uma atribuição só: cada busca usa a referência que pegou ao começar
+    global search_engine_instance
+    search_engine_instance = new_engine
+
+
+search_index_rebuilder = SearchIndexRebuilder(stream_all_companies, set_search_engine, SEARCH_SNAPSHOT_DIR)
+
+
+async def watch_search_snapshot():
+    """
+    Com vários workers compartilhando SEARCH_SNAPSHOT_DIR, cada um confere
+    periodicamente o ponteiro CURRENT e troca de índice quando outro processo
+    publica uma nova geração.
+    """
+    while True:
+        await asyncio.sleep(SEARCH_SNAPSHOT_POLL_SECONDS)
+        try:
+            if snapshot_changed(search_engine_instance, SEARCH_SNAPSHOT_DIR) and not search_index_rebuilder.running:
+                new_engine = await asyncio.to_thread(load_published_snapshot)
+                if new_engine is not None:
+                    search_index_rebuilder.install(new_engine)
+                    print(f"Índice de busca trocado para a geração {new_engine.snapshot_generation}.")
+        except Exception as e:
+            print(f"Erro ao verificar o snapshot do índice: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global search_engine_instance
     
     # --- CORREÇÃO: INVERSÃO DE LÓGICA ---
     # Bloco 1: CRIAR as tabelas primeiro.
@@ -58,34 +129,44 @@ async def lifespan(app: FastAPI):
         # Se isto falhar (ex: má conexão), a app não deve arrancar.
         raise RuntimeError(f"Falha na criação das tabelas: {e}")
         
-    # Bloco 2: LER as tabelas (agora que existem) para o NLTK.
-    print("Verificando e baixando recursos do NLTK...")
+    # Bloco 2: LER as tabelas (agora que existem) para o índice de busca.
+    # Os recursos do NLTK vêm só de NLTK_DATA/diretórios do repo, sem rede, e
+    # são carregados no primeiro uso (um snapshot com stems salvos nem chega a usá-los).
     try:
-        nltk.download('punkt', quiet=True) 
-        nltk.download('stopwords', quiet=True)
-        nltk.download('rslp', quiet=True) 
-        print("Recursos do NLTK prontos com sucesso!")
-        
-        db = next(get_db())
+        nlp_resources.check()
 
-        # USANDO CRUD
-        all_companies_list = crud.get_all_empresas(db)
-        
-        # (Agora 'all_companies_list' será uma lista vazia [] caso não exista antes, 
-        # o que está correto)
-        
-        if all_companies_list:
-            search_engine_instance = SearchEngine(all_companies_list)
+        # USANDO CRUD: as empresas vêm de um cursor em lotes, sem materializar a
+        # tabela; a sessão é fechada ao fim da leitura. Usa o snapshot em
+        # SEARCH_SNAPSHOT_DIR quando ele está em dia com o banco.
+        build_start = time.perf_counter()
+        initial_engine = load_or_build_rows(stream_all_companies())
+
+        if initial_engine.row_count:
+            search_index_rebuilder.install(initial_engine, time.perf_counter() - build_start)
             print("Índice TF-IDF criado com sucesso!")
         else:
             print("Banco de dados vazio, SearchEngine iniciado sem dados.")
+        # O lifespan fica suspenso no yield enquanto a aplicação roda: sem o del,
+        # este engine continuaria vivo depois de trocado por um rebuild
+        del initial_engine
         
     except Exception as e:
         print(f"Erro na inicialização do NLTK/TF-IDF: {e}")
         raise RuntimeError(f"Falha na inicialização: {e}")
     # --- FIM DA CORREÇÃO ---
+
+    snapshot_watcher = asyncio.create_task(watch_search_snapshot()) if SEARCH_SNAPSHOT_DIR else None
+    scheduled_rebuild = (
+        asyncio.create_task(search_index_rebuilder.run_periodically()) if SEARCH_REBUILD_INTERVAL_SECONDS > 0 else None
+    )
         
     yield
+
+    for task in (snapshot_watcher, scheduled_rebuild):
+        if task is not None:
+            task.cancel()
+    search_index_rebuilder.shutdown()
+    search_executor.shutdown()
     print("Aplicação encerrada.")
 
 
@@ -164,31 +245,311 @@ def list_all_companies(
     return results
 
 
+@app.get("/companies/autocomplete", response_model=List[schemas.AutocompleteSuggestion], status_code=status.HTTP_200_OK)
+async def autocomplete_companies(
+    prefix: str,
+    limit: int = Query(default=AUTOCOMPLETE_LIMIT, ge=1, le=50),
+    current_user: schemas.User = Depends(security.get_current_user)
+):
+    """
+    Sugestões de nomes de empresa e setores enquanto o usuário digita.
+    Consulta só o índice de prefixos em memória (sem TF-IDF nem fuzzy), no
+    executor de busca como os outros endpoints: nada roda no event loop.
+    """
+    engine = search_engine_instance
+
+    if engine is None:
+        raise HTTPException(
+             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
+             detail="O serviço de busca ainda não foi inicializado ou falhou ao carregar o índice."
+        )
+
+    try:
+        suggestions = await search_executor.run(engine.autocomplete, prefix, limit)
+    except SearchQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitas buscas em andamento. Tente novamente em instantes."
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="A busca excedeu o tempo limite."
+        )
+
+    return [
+        {"tipo": tipo, "texto": texto, "id": company_id}
+        for tipo, texto, company_id in suggestions
+    ]
+
+
 @app.get("/optimized_search", response_model=List[schemas.Empresa], status_code=status.HTTP_200_OK)
-def optimized_search_companies(
+async def optimized_search_companies(
     query: str,
+    response: Response,
     fase: Optional[str] = None,
+    campos: Optional[List[str]] = Query(default=None),
+    corrigir: bool = False,
+    debug: bool = False,
     current_user: schemas.User = Depends(security.get_current_user)
 ):
-    global search_engine_instance
+    """
+    `campos` (ex.: ?campos=setor_principal&campos=setor_secundario) restringe a
+    busca a esses campos quando SEARCH_RANKER=fields. Com `corrigir=true`,
+    palavras com erro de digitação são trocadas pelo termo mais próximo do
+    vocabulário indexado. Com `debug=true`, a resposta traz a duração de cada
+    estágio em Server-Timing e as contagens de linhas em X-Search-Rows.
+    """
+    engine = search_engine_instance
     
-    if search_engine_instance is None:
+    if engine is None:
         raise HTTPException(
              status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
              detail="O serviço de busca ainda não foi inicializado ou falhou ao carregar o índice."
         )
 
-    results = search_engine_instance.optimized_search(query=query, fase=fase)
+    try:
+        campos = validate_fields(campos)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # Criado aqui para que o total inclua a espera na fila do executor
+    trace = SearchTrace("optimized_search")
+
+    # Roda no executor dedicado da busca, não no threadpool compartilhado
+    try:
+        results = await search_executor.run(
+            engine.optimized_search, query=query, fase=fase, fields=campos, spelling=corrigir, trace=trace
+        )
+    except SearchQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitas buscas em andamento. Tente novamente em instantes."
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="A busca excedeu o tempo limite."
+        )
+
+    # Só os ids do top-k vão ao banco, numa consulta
+    results = await asyncio.to_thread(load_companies_by_ids, [company.id for company in results])
+
+    debug_headers = {"Server-Timing": trace.server_timing(), "X-Search-Rows": trace.rows_header()} if debug else {}
 
     if not results:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Nenhuma startup encontrada com a sua pesquisa."
+            detail="Nenhuma startup encontrada com a sua pesquisa.",
+            headers=debug_headers or None,
         )
-    
+
+    response.headers.update(debug_headers)
     return results
 
 
+@app.get("/optimized_search/facets", response_model=schemas.FacetedSearchResult, status_code=status.HTTP_200_OK)
+async def optimized_search_with_facets(
+    query: str,
+    fase: Optional[str] = None,
+    limit: int = Query(default=5, ge=1, le=50),
+    campos: Optional[List[str]] = Query(default=None),
+    corrigir: bool = False,
+    current_user: schemas.User = Depends(security.get_current_user)
+):
+    """
+    Mesma busca de /optimized_search, com o total de empresas encontradas e a
+    contagem por setor principal, setor secundário e fase sobre todas elas.
+    Sem resultados, devolve listas e contagens vazias (sem 404).
+    """
+    engine = search_engine_instance
+
+    if engine is None:
+        raise HTTPException(
+             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
+             detail="O serviço de busca ainda não foi inicializado ou falhou ao carregar o índice."
+        )
+
+    try:
+        campos = validate_fields(campos)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        scored, total, facets = await search_executor.run(
+            engine.faceted_search, query=query, fase=fase, limit=limit, fields=campos, spelling=corrigir
+        )
+    except SearchQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitas buscas em andamento. Tente novamente em instantes."
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="A busca excedeu o tempo limite."
+        )
+
+    companies = await asyncio.to_thread(load_companies_by_ids, [company_id for company_id, _ in scored])
+    return {"results": companies, "total": total, "facets": facets}
+
+
+@app.get("/semantic_search", response_model=List[schemas.Empresa], status_code=status.HTTP_200_OK)
+async def semantic_search_companies(
+    query: str,
+    fase: Optional[str] = None,
+    nprobe: int = Query(default=SEMANTIC_NPROBE, ge=1, le=1024),
+    current_user: schemas.User = Depends(security.get_current_user)
+):
+    """
+    Busca por similaridade semântica (LSA) em vez de termos em comum.
+    `nprobe` controla quantas listas do índice são visitadas: mais recall, mais latência.
+    """
+    engine = search_engine_instance
+
+    if engine is None:
+        raise HTTPException(
+             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
+             detail="O serviço de busca ainda não foi inicializado ou falhou ao carregar o índice."
+        )
+
+    try:
+        scored = await search_executor.run(engine.semantic_search, query=query, fase=fase, nprobe=nprobe)
+    except SemanticIndexUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="O índice semântico ainda não foi montado; ele fica pronto no próximo rebuild."
+        )
+    except SearchQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitas buscas em andamento. Tente novamente em instantes."
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="A busca excedeu o tempo limite."
+        )
+
+    companies = await asyncio.to_thread(load_companies_by_ids, [company_id for company_id, _ in scored])
+    if not companies:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Nenhuma startup encontrada com a sua pesquisa."
+        )
+    return companies
+
+
+@app.post("/optimized_search/batch", response_model=List[schemas.BatchSearchResult], status_code=status.HTTP_200_OK)
+async def optimized_search_batch(
+    request: schemas.BatchSearchRequest,
+    current_user: schemas.User = Depends(security.get_current_user)
+):
+    """
+    Várias buscas numa única requisição (ex.: uma por tese de investidor).
+    Itens sem resultado voltam com a lista vazia, sem 404.
+    """
+    engine = search_engine_instance
+
+    if engine is None:
+        raise HTTPException(
+             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
+             detail="O serviço de busca ainda não foi inicializado ou falhou ao carregar o índice."
+        )
+
+    try:
+        batch_results = await search_executor.run(
+            engine.batch_search, [(item.query, item.fase, item.limit) for item in request.items]
+        )
+    except SearchQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitas buscas em andamento. Tente novamente em instantes."
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="A busca excedeu o tempo limite."
+        )
+
+    # Uma consulta só para todos os itens (ids repetidos entre itens vêm uma vez)
+    company_ids = list(dict.fromkeys(company_id for hits in batch_results for company_id, _ in hits))
+    companies_by_id = {company.id: company for company in await asyncio.to_thread(load_companies_by_ids, company_ids)}
+    return [
+        {
+            "query": item.query,
+            "fase": item.fase,
+            "results": [companies_by_id[company_id] for company_id, _ in hits if company_id in companies_by_id],
+        }
+        for item, hits in zip(request.items, batch_results)
+    ]
+
+
+@app.get("/optimized_search/cache", status_code=status.HTTP_200_OK)
+def optimized_search_cache_stats(
+    current_user: schemas.User = Depends(security.get_current_user)
+):
+    """Contadores do cache de resultados da busca (para dimensionar tamanho e TTL)."""
+    if search_engine_instance is None:
+        raise HTTPException(
+             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
+             detail="O serviço de busca ainda não foi inicializado ou falhou ao carregar o índice."
+        )
+    return {"generation": search_engine_instance.generation, **search_engine_instance.result_cache.stats()}
+
+
+@app.get("/optimized_search/executor", status_code=status.HTTP_200_OK)
+def optimized_search_executor_stats(
+    current_user: schemas.User = Depends(security.get_current_user)
+):
+    """Profundidade da fila, buscas em execução, timeouts e recusas do executor de busca."""
+    return search_executor.stats()
+
+
+@app.get("/optimized_search/metrics", status_code=status.HTTP_200_OK)
+def optimized_search_metrics(
+    current_user: schemas.User = Depends(security.get_current_user)
+):
+    """
+    Histogramas (desde o início do processo) da duração de cada estágio da
+    busca e das linhas em cada etapa (candidatos, pontuadas no fuzzy,
+    devolvidas), por tipo de busca.
+    """
+    return search_metrics.snapshot()
+
+
+@app.get("/optimized_search/index", status_code=status.HTTP_200_OK)
+def optimized_search_index_status(
+    current_user: schemas.User = Depends(security.get_current_user)
+):
+    """Geração do índice servido, duração do último build, número de empresas, ranker e estado do rebuild."""
+    engine = search_engine_instance
+    return {
+        **search_index_rebuilder.stats(),
+        "ranker": engine.ranker.name if engine is not None else None,
+        "nlp": nlp_resources.stats(),
+    }
+
+
+@app.post("/optimized_search/reindex", status_code=status.HTTP_202_ACCEPTED)
+async def optimized_search_reindex(
+    current_user: schemas.User = Depends(security.get_current_admin_user)
+):
+    """
+    Reconstrói o índice a partir do banco em segundo plano. O índice atual
+    continua atendendo até o novo ser trocado; acompanhe por GET /optimized_search/index.
+    Só para os administradores de ADMIN_EMAILS (403 para os demais).
+    """
+    try:
+        search_index_rebuilder.start()
+    except RebuildInProgress:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Já existe um rebuild do índice em andamento."
+        )
+    return search_index_rebuilder.stats()
+
+
 # --- ADICIONADO: Montar o diretório estático ---
 
 app.mount(f"/{STATIC_DIR}", StaticFiles(directory=STATIC_DIR), name="static")
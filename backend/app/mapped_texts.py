@@ -0,0 +1,70 @@
+import mmap
+from typing import Iterator, List, Sequence
+
+import numpy as np
+
+# Textos pré-processados do fuzzy vindos de um snapshot: o texts.bin fica
+# mapeado (as páginas são compartilhadas entre os workers, como os arrays da
+# matriz) e cada texto só vira str quando uma busca o lê.
+
+
+def map_file(path: str):
+    """Conteúdo do arquivo mapeado só para leitura (b"" se ele estiver vazio: mmap não aceita tamanho 0)."""
+    with open(path, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b""
+
+
+class MappedTexts(Sequence):
+    """
+    Lista de textos somente-leitura sobre bytes UTF-8 + offsets (texto i =
+    blob[offsets[i]:offsets[i + 1]]). As escritas do engine não alteram o
+    mapeamento: `+ [texto]` e `cleared(row)` devolvem uma cópia leve com as
+    linhas acrescentadas e as zeradas guardadas à parte.
+    """
+
+    __slots__ = ("_blob", "_offsets", "_appended", "_cleared")
+
+    def __init__(self, blob, offsets: np.ndarray, appended: List[str] = (), cleared: frozenset = frozenset()):
+        self._blob = blob
+        self._offsets = offsets
+        self._appended = list(appended)
+        self._cleared = cleared
+
+    @property
+    def _mapped_rows(self) -> int:
+        return len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        return self._mapped_rows + len(self._appended)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        if row >= self._mapped_rows:
+            return self._appended[row - self._mapped_rows]
+        if row in self._cleared:
+            return ""
+        return self._blob[self._offsets[row]:self._offsets[row + 1]].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def __add__(self, texts: List[str]) -> "MappedTexts":
+        return MappedTexts(self._blob, self._offsets, self._appended + list(texts), self._cleared)
+
+    def cleared(self, row: int) -> "MappedTexts":
+        """Cópia com o texto da linha vazio (linha removida)."""
+        if row >= self._mapped_rows:
+            appended = list(self._appended)
+            appended[row - self._mapped_rows] = ""
+            return MappedTexts(self._blob, self._offsets, appended, self._cleared)
+        return MappedTexts(self._blob, self._offsets, self._appended, self._cleared | {row})
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, Text, BigInteger
+import numpy as np
+from sqlalchemy import Column, Integer, String, Text, BigInteger, ForeignKey
 from sqlalchemy.orm import Mapped, mapped_column, registry
 from sqlalchemy.types import Integer 
 #from .database import Base
 from .database import table_registry
+from .vector_type import Vector
 
 # --- CORREÇÃO DE COMPATIBILIDADE (SQLite/PostgreSQL) ---
 
@@ -50,6 +52,16 @@ class Empresa:
     #def __repr__(self):
     #    return f"<Empresa(nome='{self.nome_da_empresa}', setor='{self.setor_principal}')>"
 
+@table_registry.mapped_as_dataclass
+class EmpresaEmbedding:
+    __tablename__ = "startup_embeddings"
+
+    # Um vetor por empresa (espaço LSA do índice de busca), regravado pelo rebuild
+    # que publica um snapshot novo (ver search_rebuild.rebuild_snapshot)
+    empresa_id: Mapped[int] = mapped_column(PG_BIGINT, ForeignKey("startups.id", ondelete="CASCADE"), primary_key=True)
+    vetor: Mapped[np.ndarray] = mapped_column(Vector())
+
+
 @table_registry.mapped_as_dataclass
 class Usuario:
     __tablename__ = "usuarios"
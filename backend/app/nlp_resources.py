@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from typing import Any, List, Optional, Set, Tuple
+
+import nltk
+
+# Recursos do NLTK usados pela busca, carregados sem rede: só dos diretórios
+# declarados em NLTK_DATA (separados por os.pathsep, como no próprio NLTK) e
+# dos diretórios empacotados com o repositório. Nada é baixado em runtime; a
+# imagem Docker já traz os dados em /app/nltk_data.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BUNDLED_NLTK_DIRS = [os.path.join(REPO_ROOT, "nltk_data"), os.path.join(REPO_ROOT, "portuguese")]
+
+# nome para o nltk.download -> caminho dentro de NLTK_DATA
+NLTK_RESOURCES = {
+    "stopwords": "corpora/stopwords",
+    "rslp": "stemmers/rslp",
+}
+
+# NOVAS STOP WORDS: 'peça' ('peca'), 'faça' (stem: 'faz'), e termos de query
+CORP_AND_COMMON_STOP_WORDS = {'empresa', 'ltda', 's.a', 'eireli', 'companhia', 'solucoes', 'inovacao', 'tecnologia', 'group', 'grupo', 'de', 'a', 'o', 'e', 'do', 'da', 'dos', 'as', 'os',
+    'um', 'uma', 'uns', 'umas', 'para', 'na', 'no', 'em', 'por', 'foco', 'quer', 'busco', 'ramo', 'com', 'eu', 'tu', 'ele', 'ela', 'documento', 'fazer', 'quero', 'um', 'peca', 'faz', 'que'}
+
+
+class NLPResourceError(RuntimeError):
+    """Recurso do NLTK ausente nos diretórios declarados."""
+
+
+def nltk_data_paths() -> List[str]:
+    declared = [p for p in os.getenv("NLTK_DATA", "").split(os.pathsep) if p]
+    return declared + [p for p in BUNDLED_NLTK_DIRS if os.path.isdir(p) and p not in declared]
+
+
+class NLPResources:
+    """
+    Stop words e stemmer RSLP em português, carregados no primeiro uso (e uma
+    vez só). Se faltar algum recurso, falha na hora com NLPResourceError
+    dizendo o que falta e onde foi procurado, em vez de tentar baixar.
+    """
+
+    def __init__(self, paths: Optional[List[str]] = None):
+        self._paths = paths
+        self._lock = threading.Lock()
+        self._loaded: Optional[Tuple[Set[str], Any]] = None
+        self.init_seconds: Optional[float] = None
+
+    @property
+    def paths(self) -> List[str]:
+        return self._paths if self._paths is not None else nltk_data_paths()
+
+    def get(self) -> Tuple[Set[str], Any]:
+        """(stop words, stemmer), carregando na primeira chamada."""
+        loaded = self._loaded
+        if loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    self._loaded = self._load()
+                loaded = self._loaded
+        return loaded
+
+    def check(self):
+        """Só confere se os arquivos existem (sem carregar nada); para falhar já no startup."""
+        paths = self.paths
+        missing = []
+        for name, resource in NLTK_RESOURCES.items():
+            try:
+                nltk.data.find(resource, paths=paths)
+            except LookupError:
+                missing.append(name)
+        if missing:
+            raise NLPResourceError(
+                f"Recursos do NLTK ausentes: {', '.join(missing)}. Procurado em: {paths or '(nenhum diretório)'}. "
+                f"Defina NLTK_DATA ou rode: python -c \"import nltk; "
+                + "; ".join(f"nltk.download('{name}', download_dir='<NLTK_DATA>')" for name in missing)
+                + "\""
+            )
+
+    def _load(self):
+        start = time.perf_counter()
+        self.check()
+        # Só os diretórios declarados: sem varrer ~/nltk_data, /usr/share etc.
+        nltk.data.path[:] = self.paths
+
+        from nltk.corpus import stopwords
+        from nltk.stem import RSLPStemmer
+
+        stop_words = set(stopwords.words('portuguese'))
+        stop_words.update(CORP_AND_COMMON_STOP_WORDS)
+        stemmer = RSLPStemmer()
+
+        self.init_seconds = time.perf_counter() - start
+        print(f"Recursos do NLTK carregados em {self.init_seconds * 1000:.0f}ms de {self.paths}.")
+        return stop_words, stemmer
+
+    def stats(self) -> dict:
+        return {"loaded": self._loaded is not None, "init_seconds": self.init_seconds, "paths": self.paths}
+
+
+nlp_resources = NLPResources()
@@ -0,0 +1,445 @@
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from unidecode import unidecode
+
+from .search_metrics import NO_TRACE
+
+# Rankers do primeiro estágio da busca: recebem os termos já analisados da
+# query (ver SearchEngine._query_terms) e devolvem as linhas candidatas e uma
+# relevância na escala do cosseno. O SearchEngine multiplica a relevância por
+# `weight`, soma o fuzzy (se o ranker usa) e aplica o mesmo corte
+# MIN_FINAL_SCORE para qualquer ranker.
+#
+# `fit(engine, companies)` recebe os objetos completos (na ordem das linhas)
+# quando o índice é montado a partir deles, ou None quando o engine refaz o fit
+# sobre as próprias linhas (o ranker já passou por `compact`). O ranker não deve
+# guardar os objetos: só o que ele próprio precisa deles.
+#
+# Escolhido por deploy com SEARCH_RANKER ("tfidf", o padrão, "bm25" ou "fields").
+
+SEARCH_RANKER = os.getenv("SEARCH_RANKER", "tfidf")
+
+BM25_K1 = float(os.getenv("SEARCH_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("SEARCH_BM25_B", "0.75"))
+# Relevância BM25 é normalizada pelo score máximo possível da query
+BM25_WEIGHT = float(os.getenv("SEARCH_BM25_WEIGHT", "100"))
+BM25_MIN_RELEVANCE = float(os.getenv("SEARCH_BM25_MIN_RELEVANCE", "0.05"))
+
+# Campos indexados separadamente pelo ranker "fields", com o peso de cada um
+# (SEARCH_FIELD_WEIGHTS="nome_da_empresa:3,solucao:1,..."; campo ausente = 0)
+INDEXED_FIELDS = ("nome_da_empresa", "solucao", "setor_principal", "setor_secundario")
+DEFAULT_FIELD_WEIGHTS = "nome_da_empresa:1.5,solucao:1,setor_principal:1,setor_secundario:0.75"
+# Sem o fuzzy, só a relevância precisa passar de MIN_FINAL_SCORE: com 200, um
+# campo de peso 1 precisa de cosseno > 0.35
+FIELD_WEIGHT = float(os.getenv("SEARCH_FIELD_WEIGHT", "200"))
+FIELD_MIN_RELEVANCE = float(os.getenv("SEARCH_FIELD_MIN_RELEVANCE", "0.015"))
+
+
+def parse_field_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        field, _, weight = item.partition(":")
+        field = field.strip()
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Campo desconhecido em SEARCH_FIELD_WEIGHTS: {field!r} (use {', '.join(INDEXED_FIELDS)}).")
+        weights[field] = float(weight)
+    return {field: weights.get(field, 0.0) for field in INDEXED_FIELDS}
+
+
+FIELD_WEIGHTS = parse_field_weights(os.getenv("SEARCH_FIELD_WEIGHTS", DEFAULT_FIELD_WEIGHTS))
+
+
+def validate_fields(fields: Optional[Sequence[str]]) -> Optional[Tuple[str, ...]]:
+    """Normaliza a restrição de campos de uma busca (None = todos)."""
+    if not fields:
+        return None
+    unknown = [field for field in fields if field not in INDEXED_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconhecidos: {', '.join(unknown)}. Use {', '.join(INDEXED_FIELDS)}.")
+    return tuple(field for field in INDEXED_FIELDS if field in fields)
+
+
+def empty_candidates() -> Tuple[np.ndarray, np.ndarray]:
+    return np.empty(0, dtype=np.int64), np.empty(0)
+
+
+class TfidfCosineRanker:
+    """Cosseno TF-IDF (o caminho original): produto esparso da query com company_vectors."""
+
+    name = "tfidf"
+    # Texto único: o fuzzy sobre o texto inteiro complementa o cosseno
+    fuzzy = True
+
+    def __init__(self, weight: float):
+        self.weight = weight
+
+    def fit(self, engine, companies: Optional[List[Any]] = None):
+        pass
+
+    def add(self, engine, company, company_text: str):
+        pass
+
+    def remove(self, row: int):
+        pass
+
+    def compact(self, alive: np.ndarray):
+        pass
+
+    def memory_bytes(self) -> int:
+        return 0
+
+    def candidates(self, engine, query_terms: List[str], fase: Optional[str], fields=None, trace=NO_TRACE) -> Tuple[np.ndarray, np.ndarray]:
+        with trace.stage("vectorize"):
+            query_vector = engine._terms_vector(query_terms)
+        # O produto esparso pontua todas as linhas (da fase)
+        trace.count("evaluated", len(engine._fase_rows.get(fase, ())) if fase else engine.company_vectors.shape[0])
+        with trace.stage("cosine"):
+            return engine._candidates(query_vector, fase)
+
+
+class BM25Ranker:
+    """
+    Okapi BM25 sobre o mesmo tokenizer e vocabulário do TF-IDF.
+
+    Guarda as contagens (documentos x termos) e, a partir delas, listas
+    invertidas em arrays NumPy (formato CSC: termo -> linhas, pesos BM25 já com
+    a normalização pelo tamanho do documento). Uma query só toca as postings dos
+    seus termos, sem vetor de scores do tamanho do corpus.
+    """
+
+    name = "bm25"
+    fuzzy = True
+
+    def __init__(self, weight: float = BM25_WEIGHT, k1: float = BM25_K1, b: float = BM25_B, min_relevance: float = BM25_MIN_RELEVANCE):
+        self.weight = weight
+        self.k1 = k1
+        self.b = b
+        self.min_relevance = min_relevance
+        self._lock = threading.Lock()
+        self._counts: Optional[sp.csr_matrix] = None
+        self._postings = None
+
+    def fit(self, engine, companies: Optional[List[Any]] = None):
+        # Contagens montadas no warm, a partir dos textos normalizados do
+        # estado que o engine vai publicar (ver SearchEngine._publish)
+        with self._lock:
+            self._counts = None
+            self._postings = None
+
+    def warm(self, engine):
+        """
+        Monta o que faltar (contagens, postings) para o estado fixado pelo
+        engine; chamado antes de cada publicação, então as buscas já encontram
+        as postings prontas.
+        """
+        with self._lock:
+            if self._counts is None:
+                # Linhas removidas têm texto vazio e viram linhas sem termos
+                self._counts = self._count_rows(engine, engine.company_texts)
+            if self._postings is None:
+                self._postings = self._build_postings(self._counts)
+
+    def add(self, engine, company, company_text: str):
+        with self._lock:
+            if self._counts is None:
+                return
+            self._counts = sp.vstack([self._counts, self._count_rows(engine, [company_text])], format="csr")
+            self._postings = None
+
+    def remove(self, row: int):
+        with self._lock:
+            if self._counts is None:
+                return
+            if not self._counts.data.flags.writeable:
+                self._counts = self._counts.copy()
+            self._counts.data[self._counts.indptr[row]:self._counts.indptr[row + 1]] = 0
+            self._postings = None
+
+    def compact(self, alive: np.ndarray):
+        with self._lock:
+            if self._counts is None:
+                return
+            self._counts = self._counts[alive]
+            self._counts.eliminate_zeros()
+            self._postings = None
+
+    @staticmethod
+    def _count_rows(engine, company_texts: List[Optional[str]]) -> sp.csr_matrix:
+        """Contagens de termos do vocabulário congelado; None vira uma linha vazia."""
+        vocabulary = engine.tfidf_vectorizer.vocabulary_
+        indptr, indices, data = [0], [], []
+        for text in company_texts:
+            if text is not None:
+                counts = Counter(vocabulary[t] for t in engine._analyzer(text) if t in vocabulary)
+                for column in sorted(counts):
+                    indices.append(column)
+                    data.append(counts[column])
+            indptr.append(len(indices))
+        return sp.csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(company_texts), len(vocabulary)),
+        )
+
+    def _ensure_postings(self, engine):
+        postings = self._postings
+        if postings is not None:
+            return postings
+
+        # Só chega aqui uma busca que começou durante uma escrita (o add já
+        # invalidou as postings, o warm ainda não rodou): espera a escrita,
+        # na mesma ordem de locks dela (write_lock -> este), e usa o que o
+        # warm montou para o estado publicado
+        with engine._write_lock, engine._reading(engine._published):
+            self.warm(engine)
+            return self._postings
+
+    def _build_postings(self, counts: sp.csr_matrix):
+        """Pesos BM25 por (documento, termo), reorganizados por termo."""
+        document_lengths = np.asarray(counts.sum(axis=1)).ravel()
+        alive = document_lengths > 0
+        n_documents = max(int(alive.sum()), 1)
+        average_length = document_lengths[alive].mean() if alive.any() else 1.0
+
+        document_frequencies = np.bincount(counts.indices[counts.data > 0], minlength=counts.shape[1])
+        idf = np.log(1 + (n_documents - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+        tf = counts.data
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        length_norm = self.k1 * (1 - self.b + self.b * document_lengths[rows] / average_length)
+        weights = (idf[counts.indices] * tf * (self.k1 + 1) / (tf + length_norm)).astype(np.float32)
+
+        by_term = sp.csr_matrix((weights, counts.indices, counts.indptr), shape=counts.shape).tocsc()
+        by_term.eliminate_zeros()
+        return by_term.indptr, by_term.indices.astype(np.int64), by_term.data, idf
+
+    def memory_bytes(self) -> int:
+        arrays = list(self._postings or ())
+        if self._counts is not None:
+            arrays += [self._counts.data, self._counts.indices, self._counts.indptr]
+        return sum(array.nbytes for array in arrays)
+
+    def candidates(self, engine, query_terms: List[str], fase: Optional[str], fields=None, trace=NO_TRACE) -> Tuple[np.ndarray, np.ndarray]:
+        with trace.stage("bm25"):
+            return self._score(engine, query_terms, fase)
+
+    def _score(self, engine, query_terms: List[str], fase: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        vocabulary = engine.tfidf_vectorizer.vocabulary_
+        term_ids = [vocabulary[t] for t in query_terms if t in vocabulary]
+        if not term_ids:
+            return empty_candidates()
+
+        indptr, posting_rows, posting_weights, idf = self._ensure_postings(engine)
+        if len(indptr) != len(vocabulary) + 1:
+            # Postings de outro vocabulário: um refit foi publicado depois que esta busca começou
+            return empty_candidates()
+        terms, query_counts = np.unique(term_ids, return_counts=True)
+
+        rows = np.concatenate([posting_rows[indptr[t]:indptr[t + 1]] for t in terms])
+        if len(rows) == 0:
+            return empty_candidates()
+        weights = np.concatenate([posting_weights[indptr[t]:indptr[t + 1]] * q for t, q in zip(terms, query_counts)])
+
+        # Soma por documento só sobre as postings tocadas
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        # Normaliza pelo máximo teórico da query (todos os termos com tf saturado)
+        relevance = scores / float((idf[terms] * query_counts * (self.k1 + 1)).sum())
+
+        keep = relevance >= self.min_relevance
+        if fase:
+            keep &= np.isin(unique_rows, engine._fase_rows.get(fase, np.empty(0, dtype=np.int64)))
+        return unique_rows[keep], relevance[keep]
+
+
+class FieldWeightedRanker:
+    """
+    Uma matriz TF-IDF por campo (nome, solução, setores), todas com o
+    vocabulário e o IDF do vetorizador do engine, lado a lado numa só matriz
+    (empresas x campos*termos). A query entra repetida em cada bloco,
+    multiplicada pelo peso do campo: um único produto esparso dá a soma
+    ponderada dos cossenos por campo. Campos fora de `fields` ficam com peso 0
+    e seus blocos nem entram na conta.
+
+    Como o nome tem o próprio peso, este ranker dispensa o fuzzy.
+    """
+
+    name = "fields"
+    fuzzy = False
+
+    def __init__(self, weight: float = FIELD_WEIGHT, field_weights: Optional[Dict[str, float]] = None, min_relevance: float = FIELD_MIN_RELEVANCE):
+        self.weight = weight
+        self.field_weights = dict(field_weights or FIELD_WEIGHTS)
+        self.min_relevance = min_relevance
+        self._lock = threading.Lock()
+        # Texto normalizado de cada campo por linha ("" = linha removida): o
+        # store do engine não guarda a solução, e a matriz é refeita a partir
+        # daqui na compactação
+        self._texts: Dict[str, List[str]] = {field: [] for field in INDEXED_FIELDS}
+        self._matrix: Optional[sp.csr_matrix] = None
+        # IDF com que a matriz foi pesada (a compactação troca o do engine)
+        self._idf: Optional[np.ndarray] = None
+
+    def fit(self, engine, companies: Optional[List[Any]] = None):
+        # Como no BM25, a matriz por campo é montada no warm
+        with self._lock:
+            if companies is not None:
+                self._texts = {field: [self.field_text(c, field) for c in companies] for field in INDEXED_FIELDS}
+            self._matrix = None
+
+    def warm(self, engine):
+        """
+        Deixa a matriz pronta para o estado fixado pelo engine: montada do zero
+        depois de um fit, ou só repesada se a compactação trocou o IDF.
+        """
+        idf = engine.tfidf_vectorizer.idf_
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = self._field_rows(engine, self._texts)
+            elif self._idf is not idf and not np.array_equal(self._idf, idf):
+                self._matrix = self._reweighted(self._matrix, self._idf, idf)
+            self._idf = idf
+
+    def add(self, engine, company, company_text: str):
+        with self._lock:
+            texts = {field: [self.field_text(company, field)] for field in INDEXED_FIELDS}
+            for field, text in texts.items():
+                self._texts[field].extend(text)
+            if self._matrix is None:
+                return
+            self._matrix = sp.vstack([self._matrix, self._field_rows(engine, texts)], format="csr")
+
+    def remove(self, row: int):
+        with self._lock:
+            for texts in self._texts.values():
+                texts[row] = ""
+            if self._matrix is None:
+                return
+            if not self._matrix.data.flags.writeable:
+                self._matrix = self._matrix.copy()
+            self._matrix.data[self._matrix.indptr[row]:self._matrix.indptr[row + 1]] = 0
+
+    def compact(self, alive: np.ndarray):
+        with self._lock:
+            self._texts = {
+                field: [text for text, keep in zip(texts, alive) if keep] for field, texts in self._texts.items()
+            }
+            if self._matrix is None:
+                return
+            # Só as linhas vivas; o IDF novo entra no warm (ver _reweighted), sem re-tokenizar os textos
+            self._matrix = self._matrix[alive]
+            self._matrix.eliminate_zeros()
+
+    @staticmethod
+    def _reweighted(matrix: sp.csr_matrix, old_idf: np.ndarray, new_idf: np.ndarray) -> sp.csr_matrix:
+        """
+        tf * idf_antigo -> tf * idf_novo em cada bloco, depois renormaliza (L2)
+        cada linha de cada bloco: o mesmo que o transform do vetorizador novo
+        daria (ver SearchEngine.compact).
+        """
+        n_terms = len(new_idf)
+        matrix = matrix.copy()
+        terms = matrix.indices % n_terms
+        matrix.data *= new_idf[terms] / old_idf[terms]
+
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        blocks = rows * len(INDEXED_FIELDS) + matrix.indices // n_terms
+        norms = np.sqrt(np.bincount(blocks, weights=matrix.data ** 2, minlength=matrix.shape[0] * len(INDEXED_FIELDS)))
+        norms[norms == 0] = 1.0
+        matrix.data /= norms[blocks]
+        return matrix
+
+    @staticmethod
+    def field_text(company, field: str) -> str:
+        return unidecode(getattr(company, field, None) or "").lower()
+
+    @staticmethod
+    def _field_rows(engine, texts: Dict[str, List[str]]) -> sp.csr_matrix:
+        vectorizer = engine.tfidf_vectorizer
+        blocks = [vectorizer.transform(texts[field]) for field in INDEXED_FIELDS]
+        return sp.hstack(blocks, format="csr", dtype=np.float64)
+
+    def _ensure_matrix(self, engine) -> sp.csr_matrix:
+        matrix = self._matrix
+        if matrix is not None:
+            return matrix
+        # Busca que começou durante uma compactação: espera o warm da escrita
+        with engine._write_lock, engine._reading(engine._published):
+            self.warm(engine)
+            return self._matrix
+
+    def _view(self, engine, active: Tuple[str, ...], fase: Optional[str]):
+        """
+        Sub-matriz com só os blocos dos campos ativos (e só as linhas da fase),
+        guardada no cache do estado do engine fixado pela busca: as linhas da
+        fase são as daquele estado.
+        """
+        key = ("fields", active, fase)
+        cache = engine._fase_matrices
+        view = cache.get(key)
+        if view is not None:
+            return view
+
+        matrix = self._ensure_matrix(engine)
+        n_terms = len(engine.tfidf_vectorizer.vocabulary_)
+        if matrix.shape[1] != n_terms * len(INDEXED_FIELDS):
+            # Outro vocabulário (ver candidates): nada a recortar
+            return matrix
+        if fase:
+            rows = engine._fase_rows.get(fase, np.empty(0, dtype=np.int64))
+            # A matriz do ranker segue as escritas e pode estar à frente ou atrás do estado
+            matrix = matrix[rows[rows < matrix.shape[0]]]
+        if len(active) < len(INDEXED_FIELDS):
+            columns = np.concatenate([
+                np.arange(n_terms) + INDEXED_FIELDS.index(field) * n_terms for field in active
+            ])
+            matrix = matrix.tocsc()[:, columns].tocsr()
+        cache[key] = matrix
+        return matrix
+
+    def memory_bytes(self) -> int:
+        matrices = [self._matrix] if self._matrix is not None else []
+        total = sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in matrices)
+        return total + sum(len(text) for texts in self._texts.values() for text in texts)
+
+    def candidates(self, engine, query_terms: List[str], fase: Optional[str], fields: Optional[Sequence[str]] = None, trace=NO_TRACE) -> Tuple[np.ndarray, np.ndarray]:
+        active = tuple(
+            field for field in (fields or INDEXED_FIELDS) if self.field_weights.get(field, 0.0) > 0
+        )
+        if not active:
+            return empty_candidates()
+        if fase and len(engine._fase_rows.get(fase, ())) == 0:
+            return empty_candidates()
+
+        with trace.stage("vectorize"):
+            query_vector = engine._terms_vector(query_terms)
+            weights = np.array([self.field_weights[field] for field in active])
+            # [w1*q | w2*q | ...]: um bloco da query por campo ativo
+            weighted_query = sp.hstack([query_vector * w for w in weights], format="csr")
+
+        view = self._view(engine, active, fase)
+        if view.shape[1] != weighted_query.shape[1]:
+            # Matriz de outro vocabulário: um refit foi publicado depois que esta busca começou
+            return empty_candidates()
+        with trace.stage("cosine"):
+            # Soma ponderada dos cossenos por campo
+            relevance = view.dot(weighted_query.T).toarray().ravel()
+        hits = np.flatnonzero(relevance >= self.min_relevance)
+        rows = engine._fase_rows[fase][hits] if fase else hits
+        return rows, relevance[hits]
+
+
+def make_ranker(name: str, tfidf_weight: float) -> Any:
+    if name == TfidfCosineRanker.name:
+        return TfidfCosineRanker(tfidf_weight)
+    if name == BM25Ranker.name:
+        return BM25Ranker()
+    if name == FieldWeightedRanker.name:
+        return FieldWeightedRanker()
+    raise ValueError(f"SEARCH_RANKER desconhecido: {name!r} (use 'tfidf', 'bm25' ou 'fields').")
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, EmailStr, field_validator, HttpUrl, constr,  AnyHttpUrl,ConfigDict
 import re
-from typing import Optional
+from typing import Dict, List, Optional
 
 class UserBase(BaseModel):
     email: str
@@ -189,4 +189,43 @@ class SchemaTelefoneUpdate(BaseModel):
     def validate_telefone(cls, v):
         # Reutiliza o validador principal
         return Empresa.validate_telefone(v)
-    
\ No newline at end of file
+
+
+# --- Busca em lote ---
+
+class BatchSearchItem(BaseModel):
+    """Uma busca dentro de POST /optimized_search/batch"""
+    query: str
+    fase: Optional[str] = None
+    limit: int = Field(default=5, ge=1, le=50)
+
+
+class BatchSearchRequest(BaseModel):
+    """Schema para POST /optimized_search/batch"""
+    items: List[BatchSearchItem] = Field(min_length=1, max_length=100)
+
+
+class BatchSearchResult(BaseModel):
+    """Resultado de um item da busca em lote (na mesma ordem do pedido)"""
+    query: str
+    fase: Optional[str] = None
+    results: List[Empresa]
+
+
+# --- Busca com facetas ---
+
+class FacetedSearchResult(BaseModel):
+    """Resposta de GET /optimized_search/facets"""
+    results: List[Empresa]
+    total: int
+    # {"setor_principal": {"Agrotech": 3, ...}, "setor_secundario": {...}, "fase_da_startup": {...}}
+    facets: Dict[str, Dict[str, int]]
+
+
+# --- Autocomplete ---
+
+class AutocompleteSuggestion(BaseModel):
+    """Sugestão de GET /companies/autocomplete"""
+    tipo: str  # "empresa" ou "setor"
+    texto: str
+    id: Optional[int] = None
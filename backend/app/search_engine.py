@@ -1,100 +1,1136 @@
-import nltk
 from unidecode import unidecode
-from nltk.corpus import stopwords
 from nltk.tokenize import wordpunct_tokenize
-from nltk.stem import RSLPStemmer 
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Any
-from fuzzywuzzy import fuzz
+from typing import Iterable, List, Any, Optional, Tuple
+from collections import Counter
+from array import array
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+import numpy as np
+import scipy.sparse as sp
+import threading
+import hashlib
+import json
+import os
 import inspect
+from contextlib import contextmanager
+
+from .nlp_resources import nlp_resources
+from .search_cache import QueryResultCache
+from .search_executor import fuzzy_chunk_scores, search_executor
+from .mapped_texts import MappedTexts
+from .semantic_index import SemanticIndex, SemanticIndexUnavailable, SEMANTIC_NPROBE
+from .autocomplete import PrefixIndex, AUTOCOMPLETE_LIMIT
+from .rankers import make_ranker, validate_fields, SEARCH_RANKER
+from .spelling import SpellingIndex
+from .search_metrics import NO_TRACE, SearchTrace, search_metrics
+from .company_store import CATEGORICAL_FIELDS, CompanyRecord, CompanyStore
+from .block_max import BlockMaxIndex, SEARCH_RETRIEVAL, validate_retrieval
+
+# --- Memo de stems ---
+STEM_CACHE_SIZE = int(os.getenv("SEARCH_STEM_CACHE_SIZE", "200000"))
+STEM_CACHE_PATH = os.getenv("SEARCH_STEM_CACHE_PATH")
+
+
+def _normalize_token(token: str) -> Optional[str]:
+    """Regra original do tokenizer para um token: stem, o próprio token ou descarte (None)."""
+    # Stop words e stemmer só são carregados no primeiro token fora do memo
+    stop_words_pt, stemmer = nlp_resources.get()
+    if token in stop_words_pt or len(token) <= 1:
+        return None
+    if token.isalpha():
+        return stemmer.stem(token)
+    if token.isalnum():
+        return token
+    return None
+
+
+class StemCache:
+    """
+    Memo limitado token -> stem (ou None para tokens descartados), compartilhado
+    pela indexação e pelas consultas. Quando cheio, descarta as entradas mais
+    antigas. A leitura não usa lock; só a inserção é serializada.
+    """
+
+    def __init__(self, maxsize: int = STEM_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._stems = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[str]:
+        try:
+            stem = self._stems[token]
+            self.hits += 1
+            return stem
+        except KeyError:
+            pass
+
+        self.misses += 1
+        stem = _normalize_token(token)
+        with self._lock:
+            if len(self._stems) >= self.maxsize:
+                # dict preserva a ordem de inserção: a primeira chave é a mais antiga
+                self._stems.pop(next(iter(self._stems)), None)
+            self._stems[token] = stem
+        return stem
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._stems),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _fingerprint(self) -> str:
+        # Stems salvos com outra lista de stop words não valem mais
+        stop_words_pt, _ = nlp_resources.get()
+        return hashlib.sha1(" ".join(sorted(stop_words_pt)).encode("utf-8")).hexdigest()
+
+    def save(self, path: str):
+        """Grava a tabela de stems (JSON) para que o próximo build já comece aquecido."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"stop_words": self._fingerprint(), "stems": self._stems}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """Carrega uma tabela salva com save(). Retorna quantas entradas foram aproveitadas."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if saved.get("stop_words") != self._fingerprint():
+            return 0
+
+        with self._lock:
+            for token, stem in saved.get("stems", {}).items():
+                if len(self._stems) >= self.maxsize:
+                    break
+                self._stems.setdefault(token, stem)
+        return len(self._stems)
+
+
+stem_cache = StemCache()
 
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
-    nltk.download('rslp', quiet=True)
-except Exception:
-    pass
-
-def initialize_nlp_resources():
-    global stemmer, stop_words_pt
-    try:
-        stemmer = RSLPStemmer()
-        stop_words_pt = set(stopwords.words('portuguese'))
-    except LookupError:
-        nltk.download('rslp', quiet=True)
-        stemmer = RSLPStemmer()
-        stop_words_pt = set(stopwords.words('portuguese'))
-    
-    # NOVAS STOP WORDS: 'peça' ('peca'), 'faça' (stem: 'faz'), e termos de query
-    CORP_AND_COMMON_STOP_WORDS = {'empresa', 'ltda', 's.a', 'eireli', 'companhia', 'solucoes', 'inovacao', 'tecnologia', 'group', 'grupo', 'de', 'a', 'o', 'e', 'do', 'da', 'dos', 'as', 'os', 
-        'um', 'uma', 'uns', 'umas', 'para', 'na', 'no', 'em', 'por', 'foco', 'quer', 'busco', 'ramo', 'com', 'eu', 'tu', 'ele', 'ela', 'documento', 'fazer', 'quero', 'um', 'peca', 'faz', 'que'}
-    stop_words_pt.update(CORP_AND_COMMON_STOP_WORDS)
-    
-initialize_nlp_resources()
 
 def custom_tokenizer(text):
     text = unidecode(text).lower()
-    tokens = wordpunct_tokenize(text)
-    final_tokens = []
-    for t in tokens:
-        if t in stop_words_pt or len(t) <= 1:
-            continue
-        if t.isalpha():
-            final_tokens.append(stemmer.stem(t))
-        elif t.isalnum(): 
-            final_tokens.append(t)
-    return final_tokens
+    get_stem = stem_cache.get
+    return [stem for stem in map(get_stem, wordpunct_tokenize(text)) if stem is not None]
+
+
+# --- Atualização incremental do índice ---
+# Fração de termos (dos documentos adicionados desde o último fit) que não
+# existem no vocabulário congelado. Acima disso o índice é refeito do zero.
+VOCABULARY_DRIFT_THRESHOLD = 0.20
+# Número mínimo de termos observados antes de avaliar o drift (evita refit por
+# causa de uma única empresa com vocabulário novo).
+MIN_DRIFT_TERMS = 200
+# Fração de linhas removidas/substituídas que dispara a compactação da matriz.
+COMPACTION_THRESHOLD = 0.25
+
+# --- Pontuação ---
+RELEVANCE_THRESHOLD = 0.015  # cosseno mínimo para um candidato ser considerado
+TFIDF_WEIGHT = 400
+FUZZY_WEIGHT = 0.50
+MIN_FINAL_SCORE = 70.0
+# Campos contados nas facetas do faceted_search
+FACET_FIELDS = CATEGORICAL_FIELDS
+# A partir de quantos candidatos o fuzzy usa todos os núcleos (workers=-1)
+FUZZY_PARALLEL_MIN_CANDIDATES = 2000
+
+# --- Shards ---
+# > 1 divide as linhas em K shards pontuados em paralelo (só no ranker tfidf);
+# cada shard devolve o próprio top-k e os resultados são mesclados.
+SEARCH_SHARDS = int(os.getenv("SEARCH_SHARDS", "1"))
+# Abaixo disso despachar para o pool custa mais do que pontuar de uma vez
+SHARD_MIN_ROWS = int(os.getenv("SEARCH_SHARD_MIN_ROWS", "20000"))
+
+# --- Top-k com poda (SEARCH_RETRIEVAL="maxscore", só no ranker tfidf) ---
+# Blocos lidos na primeira rodada; cada rodada seguinte lê o dobro
+BLOCK_MAX_FIRST_BLOCKS = int(os.getenv("SEARCH_BLOCK_MAX_FIRST_BLOCKS", "8"))
+# Folga nos limites superiores contra arredondamento de ponto flutuante
+BLOCK_MAX_SLACK = 1e-9
+
+
+def normalize_query(query: str) -> str:
+    """Query sem acentos, minúscula e com espaços colapsados (também é a chave do cache)."""
+    return " ".join(unidecode(query).lower().split())
+
+
+def build_company_text(company) -> str:
+    """Texto indexado de uma empresa (nome, solução e setores, normalizado)."""
+    return unidecode(f"{company.nome_da_empresa} {company.solucao} {company.setor_principal} {company.setor_secundario}").lower()
+
+
+def fit_tfidf(company_texts: List[str]) -> Tuple[TfidfVectorizer, sp.csr_matrix, np.ndarray]:
+    """
+    Mesmo resultado de TfidfVectorizer(tokenizer=custom_tokenizer,
+    ngram_range=(1, 2)).fit_transform: vocabulário em ordem alfabética, IDF
+    suavizado e linhas normalizadas (L2). Devolve (vetorizador, matriz,
+    frequências de documento).
+
+    O sklearn guarda a coluna de cada ocorrência numa lista de ints do Python
+    até o fim do fit. Aqui as contagens de cada documento vão direto para
+    arrays int32 (8 bytes por termo distinto do documento), com colunas
+    provisórias na ordem de aparição; uma segunda passada, sobre esses arrays,
+    troca as colunas pela ordem alfabética e aplica o IDF.
+    """
+    analyzer = TfidfVectorizer(tokenizer=custom_tokenizer, ngram_range=(1, 2)).build_analyzer()
+    columns_by_term = {}
+    indptr, indices, counts = array("q", [0]), array("i"), array("i")
+    for text in company_texts:
+        document = Counter(columns_by_term.setdefault(term, len(columns_by_term)) for term in analyzer(text))
+        indices.extend(document.keys())
+        counts.extend(document.values())
+        indptr.append(len(indices))
+
+    terms = sorted(columns_by_term)
+    sorted_column = np.empty(len(terms), dtype=np.int32)
+    sorted_column[np.fromiter((columns_by_term[t] for t in terms), dtype=np.int64, count=len(terms))] = np.arange(len(terms))
+    vocabulary = {term: column for column, term in enumerate(terms)}
+    del columns_by_term, terms
+
+    company_vectors = sp.csr_matrix(
+        (np.array(counts, dtype=np.float64), sorted_column[np.array(indices, dtype=np.int64)], np.array(indptr, dtype=np.int64)),
+        shape=(len(company_texts), len(vocabulary)),
+    )
+    del indptr, indices, counts
+    company_vectors.sort_indices()
+
+    n_documents = company_vectors.shape[0]
+    document_frequencies = np.bincount(company_vectors.indices, minlength=len(vocabulary))
+    idf = np.log((1 + n_documents) / (1 + document_frequencies)) + 1
+    company_vectors.data *= idf[company_vectors.indices]
+    row_norms = np.sqrt(np.asarray(company_vectors.multiply(company_vectors).sum(axis=1)).ravel())
+    row_norms[row_norms == 0] = 1.0
+    company_vectors.data /= np.repeat(row_norms, np.diff(company_vectors.indptr))
+
+    return make_tfidf_vectorizer(vocabulary, idf), company_vectors, document_frequencies
+
+
+def make_tfidf_vectorizer(vocabulary: dict, idf: np.ndarray) -> TfidfVectorizer:
+    """Vetorizador já ajustado com este vocabulário e IDF, sem refazer o fit."""
+    tfidf_vectorizer = TfidfVectorizer(tokenizer=custom_tokenizer, ngram_range=(1, 2))
+    # Como depois de um fit: vocabulary_ sem cópia (o parâmetro `vocabulary` duplicaria o dict)
+    tfidf_vectorizer.idf_ = idf
+    tfidf_vectorizer.vocabulary_ = vocabulary
+    return tfidf_vectorizer
+
+
+class IndexState:
+    """
+    Tudo o que uma busca lê do índice. Uma escrita monta um estado novo, sem
+    alterar o publicado, e o publica com uma única atribuição; cada busca fixa
+    o estado no início (SearchEngine._reading) e lê só dele. Assim ela nunca
+    vê uma matriz com linhas que o store ou os textos ainda não têm.
+
+    `cache` guarda o que é derivado deste estado e montado sob demanda
+    (sub-matrizes por fase, shards, block-max): morre com ele. O índice
+    semântico é caro demais para isso: é ajustado no build (ver
+    SearchEngine.fit_semantic_index) e passa de um estado para o seguinte. O
+    de prefixos é montado junto com o estado e cada escrita o atualiza; o de
+    correção também, e só é refeito quando muda o vocabulário (um fit novo).
+    """
+
+    __slots__ = (
+        "companies", "company_texts", "tfidf_vectorizer", "analyzer", "company_vectors", "document_frequencies",
+        "row_by_id", "fase_rows", "semantic_index", "prefix_index", "spelling_index", "generation", "cache",
+    )
+
+    def __init__(self, companies: CompanyStore, company_texts: List[str], tfidf_vectorizer, company_vectors, document_frequencies, generation: int, semantic_index: Optional[SemanticIndex] = None):
+        self.companies = companies
+        self.company_texts = company_texts
+        self.tfidf_vectorizer = tfidf_vectorizer
+        self.analyzer = tfidf_vectorizer.build_analyzer() if tfidf_vectorizer is not None else None
+        self.company_vectors = company_vectors
+        self.document_frequencies = document_frequencies
+        self.row_by_id = {company_id: row for row, company_id in enumerate(companies.ids.tolist())}
+        # Linhas de cada fase_da_startup, para filtrar antes de pontuar
+        self.fase_rows = companies.rows_by_value("fase_da_startup")
+        # Índice denso (LSA + IVF), na mesma numeração de linhas
+        self.semantic_index = semantic_index
+        # Nomes e setores para o autocomplete
+        self.prefix_index = PrefixIndex.from_companies(companies.records())
+        # Deleções do vocabulário para corrigir a query (spelling=True)
+        self.spelling_index = (
+            SpellingIndex.from_vocabulary(tfidf_vectorizer.vocabulary_, document_frequencies)
+            if tfidf_vectorizer is not None else None
+        )
+        self.generation = generation
+        self.cache = {}
+
+    def replace(self, **changes) -> "IndexState":
+        """Novo estado com os campos trocados, a geração seguinte e o cache vazio."""
+        state = IndexState.__new__(IndexState)
+        for name in self.__slots__:
+            setattr(state, name, changes.get(name, getattr(self, name)))
+        if "tfidf_vectorizer" in changes:
+            state.analyzer = state.tfidf_vectorizer.build_analyzer()
+        state.generation = self.generation + 1
+        state.cache = {}
+        return state
+
+
+def _state_attribute(name: str):
+    """Atributo do estado fixado pela busca da thread (ou do último publicado)."""
+    return property(lambda self: getattr(self._current(), name))
 
 
 class SearchEngine:
-    
-    def __init__(self, all_companies_list: List[Any]):
-        self.all_companies_list = all_companies_list
-        self.tfidf_vectorizer = None
-        self.company_vectors = None
-        
-        if self.all_companies_list:
-            company_texts = [
-                unidecode(f"{c.nome_da_empresa} {c.solucao} {c.setor_principal} {c.setor_secundario}").lower()
-                for c in self.all_companies_list
-            ]
-            
-            self.tfidf_vectorizer = TfidfVectorizer(tokenizer=custom_tokenizer, ngram_range=(1, 2))
-            self.company_vectors = self.tfidf_vectorizer.fit_transform(company_texts)
+
+    # Leituras do índice: sempre de um único IndexState (ver _reading)
+    companies = _state_attribute("companies")
+    # Texto pré-processado para o fuzzy (default_process), calculado uma vez
+    company_texts = _state_attribute("company_texts")
+    tfidf_vectorizer = _state_attribute("tfidf_vectorizer")
+    company_vectors = _state_attribute("company_vectors")
+    document_frequencies = _state_attribute("document_frequencies")
+    # Incrementada a cada escrita; invalida o cache de resultados
+    generation = _state_attribute("generation")
+    _analyzer = _state_attribute("analyzer")
+    _row_by_id = _state_attribute("row_by_id")
+    _fase_rows = _state_attribute("fase_rows")
+    semantic_index = _state_attribute("semantic_index")
+    prefix_index = _state_attribute("prefix_index")
+    spelling_index = _state_attribute("spelling_index")
+    # Sub-matrizes por fase (e demais estruturas derivadas), descartadas a cada escrita
+    _fase_matrices = _state_attribute("cache")
+
+    def __init__(self, all_companies_list: Iterable[Any], ranker: str = SEARCH_RANKER, shards: int = SEARCH_SHARDS, retrieval: str = SEARCH_RETRIEVAL):
+        self._init_runtime(ranker, shards, retrieval)
+        self._fit(all_companies_list)
+
+    @classmethod
+    def from_state(cls, all_companies_list: List[Any], company_texts: List[str], tfidf_vectorizer, company_vectors, document_frequencies, semantic_index: Optional[SemanticIndex] = None, ranker: str = SEARCH_RANKER, shards: int = SEARCH_SHARDS, retrieval: str = SEARCH_RETRIEVAL):
+        """Monta um engine a partir de um estado já ajustado (ex.: snapshot em disco), sem refazer o fit."""
+        engine = cls.__new__(cls)
+        engine._init_runtime(ranker, shards, retrieval)
+        engine._install(
+            CompanyStore.from_companies(all_companies_list), company_texts, tfidf_vectorizer, company_vectors,
+            document_frequencies, all_companies_list, semantic_index,
+        )
+        return engine
+
+    @property
+    def row_count(self) -> int:
+        """Empresas vivas no índice (sem contar linhas removidas ainda não compactadas)."""
+        return len(self._row_by_id)
+
+    @property
+    def block_max_index(self) -> Optional[BlockMaxIndex]:
+        return self._current().cache.get("block_max")
+
+
+    def _init_runtime(self, ranker: str = SEARCH_RANKER, shards: int = SEARCH_SHARDS, retrieval: str = SEARCH_RETRIEVAL):
+        # Primeiro estágio da busca (cosseno TF-IDF ou BM25)
+        self.ranker = make_ranker(ranker, TFIDF_WEIGHT)
+        self.shards = max(1, shards)
+        # "exhaustive" pontua todas as linhas; "maxscore" lê só os blocos que podem entrar no top-k
+        self.retrieval = validate_retrieval(retrieval)
+        # Serializa as escritas (add/update/remove/refit). Cada escrita publica
+        # um IndexState novo com uma única atribuição de _published; as buscas
+        # fixam o estado que leram no início (_reading).
+        self._write_lock = threading.RLock()
+        self._published: Optional[IndexState] = None
+        self._local = threading.local()
+        self.result_cache = QueryResultCache()
+        # Snapshot em disco de onde este índice veio (ou para onde foi salvo)
+        self.snapshot_path = None
+        self.snapshot_generation = 0
+
+    def _current(self) -> IndexState:
+        return getattr(self._local, "state", None) or self._published
+
+    @contextmanager
+    def _reading(self, state: Optional[IndexState] = None):
+        """
+        Fixa um estado para tudo o que esta thread ler do engine até o fim do
+        bloco: o informado, o já fixado por um bloco externo ou o publicado.
+        """
+        previous = getattr(self._local, "state", None)
+        self._local.state = state or previous or self._published
+        try:
+            yield self._local.state
+        finally:
+            self._local.state = previous
+
+    def _fit(self, all_companies_list: Iterable[Any]):
+        """
+        Ajusta o vocabulário e o IDF do zero sobre as empresas informadas. Elas
+        são lidas uma vez só e não ficam guardadas: pode ser um cursor (ver
+        crud.stream_empresas_for_index).
+        """
+        self._fit_texts(*self._read_rows(all_companies_list))
+
+    def _read_rows(self, rows: Iterable[Any]) -> Tuple[CompanyStore, List[str]]:
+        """
+        Uma passada pelas empresas: o store, o texto normalizado de cada uma e o
+        estado por linha do ranker (via ranker.add, ex.: os textos por campo).
+        """
+        company_texts: List[str] = []
+        # Ranker vazio; o fit do _install (sem companies) mantém o que veio pelos add
+        self.ranker.fit(self, [])
+
+        def consume():
+            for company in rows:
+                company_text = build_company_text(company)
+                company_texts.append(default_process(company_text))
+                self.ranker.add(self, company, company_text)
+                yield company
+
+        return CompanyStore.from_companies(consume()), company_texts
+
+    def _fit_texts(self, companies: CompanyStore, company_texts: List[str]):
+        if not len(companies):
+            self._install(CompanyStore(), [], None, None, None)
+            print("Aviso: SearchEngine inicializado sem dados.")
+            return
+
+        tfidf_vectorizer, company_vectors, document_frequencies = fit_tfidf(company_texts)
+        self._install(companies, company_texts, tfidf_vectorizer, company_vectors, document_frequencies)
+
+    def _install(self, companies: CompanyStore, company_texts, tfidf_vectorizer, company_vectors, document_frequencies, source_companies: Optional[List[Any]] = None, semantic_index: Optional[SemanticIndex] = None):
+        """
+        `source_companies` (objetos completos, na ordem das linhas) só é lido
+        aqui, pelos rankers que precisam de mais do que o store guarda; o
+        índice não mantém referência a eles.
+        """
+        previous = self._published
+        # Só id, nome e códigos de setor/fase por linha (ver company_store.py)
+        # Textos de um snapshot ficam mapeados: copiar para uma lista decodificaria todos
+        if not isinstance(company_texts, MappedTexts):
+            company_texts = list(company_texts)
+        state = IndexState(
+            companies, company_texts, tfidf_vectorizer, company_vectors, document_frequencies,
+            previous.generation + 1 if previous is not None else 1, semantic_index,
+        )
+        self._removed_rows = 0
+        self._drift_terms = 0
+        self._drift_oov_terms = 0
+        self.ranker.fit(self, source_companies)
+        self._publish(state)
+
+    def _publish(self, state: IndexState):
+        """
+        Publica o estado com as estruturas do ranker (postings do BM25, matriz
+        por campo) já montadas para ele: o custo fica na escrita ou no load,
+        nunca na primeira busca depois deles.
+        """
+        if hasattr(self.ranker, "warm") and state.tfidf_vectorizer is not None:
+            with self._reading(state):
+                self.ranker.warm(self)
+        self._published = state
+
+    def facet_counts(self, rows: np.ndarray) -> dict:
+        """
+        {campo: {valor: quantidade}} sobre as linhas informadas, em ordem
+        decrescente de quantidade: um np.bincount nos códigos do store
+        (linhas removidas têm código -1).
+        """
+        facets = {}
+        companies = self.companies
+        for field in FACET_FIELDS:
+            codes = companies.codes[field][rows]
+            values = companies.values[field]
+            counts = np.bincount(codes[codes >= 0], minlength=len(values))
+            facets[field] = {values[code]: int(counts[code]) for code in np.argsort(-counts, kind="stable") if counts[code]}
+        return facets
+
+    def _fase_matrix(self, fase: str):
+        matrix = self._fase_matrices.get(fase)
+        if matrix is None:
+            matrix = self.company_vectors[self._fase_rows[fase]]
+            self._fase_matrices[fase] = matrix
+        return matrix
+
+    # --- Escrita incremental ---
+    # Nada do estado publicado é alterado no lugar: cada escrita copia o que
+    # muda (store, textos, pesos da matriz; o vstack do add já copiava a
+    # matriz inteira) e publica o estado novo no fim, de uma vez.
+
+    def add(self, company: Any):
+        """Indexa uma nova empresa sem refazer o fit (vocabulário e IDF congelados)."""
+        with self._write_lock:
+            state = self._published
+            if company.id in state.row_by_id:
+                self.update(company)
+                return
+
+            if state.tfidf_vectorizer is None:
+                self._fit([company])
+                return
+
+            self._publish(self._appended(state, company))
+            self._maybe_reindex()
+
+    def update(self, company: Any):
+        """Substitui a linha de uma empresa já indexada (ou a adiciona, se não existir)."""
+        with self._write_lock:
+            state = self._published
+            row = state.row_by_id.get(company.id)
+            if row is None:
+                self.add(company)
+                return
+            # Remoção e inclusão num estado só: nenhuma busca vê a empresa sumir entre as duas
+            self._publish(self._appended(self._tombstoned(state, row), company))
+            self._maybe_reindex()
+
+    def remove(self, company_id: int) -> bool:
+        """Remove uma empresa do índice. Retorna False se ela não estava indexada."""
+        with self._write_lock:
+            state = self._published
+            row = state.row_by_id.get(company_id)
+            if row is None:
+                return False
+            self._publish(self._tombstoned(state, row))
+            self._maybe_reindex()
+            return True
+
+    def _appended(self, state: IndexState, company: Any) -> IndexState:
+        """Estado novo (ainda não publicado) com a empresa numa linha nova no fim."""
+        company_text = build_company_text(company)
+        # Mesma forma que o fit tokeniza (ver _read_rows): senão a linha incremental diverge da de um fit novo
+        processed_text = default_process(company_text)
+        row_vector = self._vectorize(processed_text)
+        companies = state.companies.copy()
+        row = companies.append(company)
+        # Cópia: também a torna gravável quando veio de um snapshot mapeado
+        document_frequencies = np.array(state.document_frequencies)
+        document_frequencies[row_vector.indices] += 1
+        fase_rows = dict(state.fase_rows)
+        fase_rows[company.fase_da_startup] = np.append(
+            fase_rows.get(company.fase_da_startup, np.empty(0, dtype=np.int64)), row
+        )
+        self.ranker.add(self, company, company_text)
+        if state.semantic_index is not None:
+            state.semantic_index.add(row_vector)
+
+        return state.replace(
+            companies=companies,
+            company_texts=state.company_texts + [processed_text],
+            company_vectors=sp.vstack([state.company_vectors, row_vector], format="csr"),
+            document_frequencies=document_frequencies,
+            row_by_id={**state.row_by_id, company.id: row},
+            fase_rows=fase_rows,
+            prefix_index=state.prefix_index.with_company(company),
+        )
+
+    def _tombstoned(self, state: IndexState, row: int) -> IndexState:
+        """
+        Estado novo (ainda não publicado) com a linha zerada (numa cópia dos
+        pesos): com score 0 ela nunca passa do RELEVANCE_THRESHOLD. A remoção
+        física fica para a compactação.
+        """
+        vectors = state.company_vectors
+        start, end = vectors.indptr[row], vectors.indptr[row + 1]
+        document_frequencies = np.array(state.document_frequencies)
+        document_frequencies[vectors.indices[start:end]] -= 1
+        data = vectors.data.copy()
+        data[start:end] = 0.0
+
+        prefix_index = state.prefix_index.without_company(state.companies.record(row))
+        companies = state.companies.copy()
+        row_by_id = dict(state.row_by_id)
+        row_by_id.pop(int(companies.ids[row]), None)
+        companies.kill(row)
+        company_texts = state.company_texts
+        if isinstance(company_texts, MappedTexts):
+            company_texts = company_texts.cleared(row)
         else:
-             print("Aviso: SearchEngine inicializado sem dados.")
+            company_texts = list(company_texts)
+            company_texts[row] = ""
 
-    def optimized_search(self, query: str, fase: str = None, limit: int = 5):
-        if self.tfidf_vectorizer is None or self.company_vectors is None:
+        self._removed_rows += 1
+        self.ranker.remove(row)
+        if state.semantic_index is not None:
+            state.semantic_index.remove(row)
+
+        return state.replace(
+            companies=companies,
+            company_texts=company_texts,
+            # Índices e indptr não mudam: compartilhados com a matriz anterior
+            company_vectors=sp.csr_matrix((data, vectors.indices, vectors.indptr), shape=vectors.shape),
+            document_frequencies=document_frequencies,
+            row_by_id=row_by_id,
+            prefix_index=prefix_index,
+        )
+
+    def _vectorize(self, text: str):
+        """
+        Equivalente a tfidf_vectorizer.transform([text]) para um documento,
+        contabilizando os termos fora do vocabulário para medir o drift.
+        """
+        vocabulary = self.tfidf_vectorizer.vocabulary_
+        terms = self._analyzer(text)
+
+        self._drift_terms += len(terms)
+        self._drift_oov_terms += sum(1 for t in terms if t not in vocabulary)
+        return self._terms_vector(terms)
+
+    def _terms_vector(self, terms: List[str]):
+        """Vetor TF-IDF (L2) de uma lista de termos já analisados; termos fora do vocabulário são ignorados."""
+        tfidf_vectorizer = self.tfidf_vectorizer
+        vocabulary = tfidf_vectorizer.vocabulary_
+        counts = Counter(vocabulary[t] for t in terms if t in vocabulary)
+        columns = np.array(sorted(counts), dtype=np.int32)
+        data = np.array([counts[c] for c in columns], dtype=np.float64) * tfidf_vectorizer.idf_[columns]
+        norm = np.linalg.norm(data)
+        if norm > 0:
+            data /= norm
+        return sp.csr_matrix(
+            (data, columns, np.array([0, len(columns)], dtype=np.int32)),
+            shape=(1, len(vocabulary)),
+        )
+
+    def vocabulary_drift(self) -> float:
+        """Fração de termos fora do vocabulário desde o último fit."""
+        return self._drift_oov_terms / self._drift_terms if self._drift_terms else 0.0
+
+    def _maybe_reindex(self):
+        if self._drift_terms >= MIN_DRIFT_TERMS and self.vocabulary_drift() > VOCABULARY_DRIFT_THRESHOLD:
+            self.refit()
+        elif self._removed_rows > COMPACTION_THRESHOLD * len(self.companies):
+            self.compact()
+
+    def refit(self):
+        """
+        Refaz o fit completo (novo vocabulário) com as empresas ativas, a partir
+        dos textos normalizados já guardados (sem voltar ao banco).
+        """
+        with self._write_lock:
+            alive = self.companies.alive()
+            if not alive.any():
+                self._fit([])
+                return
+            had_semantic_index = self.semantic_index is not None
+            self.ranker.compact(alive)
+            self._fit_texts(self.companies.filter(alive), [t for t, keep in zip(self.company_texts, alive) if keep])
+            # Vocabulário novo invalida a projeção do LSA: refeito aqui, na escrita, e não na próxima busca
+            if had_semantic_index:
+                self.fit_semantic_index()
+
+    def compact(self):
+        """
+        Remove fisicamente as linhas apagadas e recalcula o IDF a partir das
+        frequências de documento mantidas incrementalmente, sem re-tokenizar.
+        """
+        with self._write_lock:
+            state = self._published
+            if state.tfidf_vectorizer is None:
+                return
+
+            alive = state.companies.alive()
+            if not alive.any():
+                self._fit([])
+                return
+
+            vectors = state.company_vectors[alive]
+            vectors.eliminate_zeros()
+
+            # Mesma fórmula do TfidfVectorizer (smooth_idf=True)
+            n_documents = int(alive.sum())
+            old_idf = state.tfidf_vectorizer.idf_
+            new_idf = np.log((1 + n_documents) / (1 + state.document_frequencies)) + 1
+
+            # tf * idf_antigo -> tf * idf_novo, depois renormaliza as linhas (L2)
+            vectors.data *= new_idf[vectors.indices] / old_idf[vectors.indices]
+            row_norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+            row_norms[row_norms == 0] = 1.0
+            vectors.data /= np.repeat(row_norms, np.diff(vectors.indptr))
+
+            self.ranker.compact(alive)
+            companies = state.companies.filter(alive)
+            self._removed_rows = 0
+            semantic_index = state.semantic_index
+            self._publish(state.replace(
+                companies=companies,
+                company_texts=[t for t, keep in zip(state.company_texts, alive) if keep],
+                # Vetorizador novo (mesmo vocabulário): as buscas no estado anterior seguem com o IDF antigo
+                tfidf_vectorizer=make_tfidf_vectorizer(state.tfidf_vectorizer.vocabulary_, new_idf),
+                company_vectors=vectors,
+                row_by_id={company_id: row for row, company_id in enumerate(companies.ids.tolist())},
+                fase_rows=companies.rows_by_value("fase_da_startup"),
+                # Mesma renumeração de linhas, sem refazer o SVD nem o k-means
+                semantic_index=semantic_index.compact(alive) if semantic_index is not None else None,
+            ))
+
+    def fit_semantic_index(self):
+        """
+        Ajusta o índice semântico (LSA + IVF) sobre a matriz publicada. Leva
+        segundos num corpus grande: roda no build/rebuild (ver search_snapshot),
+        nunca numa busca, e o resultado vai para o snapshot.
+        """
+        with self._write_lock:
+            state = self._published
+            if state.company_vectors is None:
+                return
+            self._publish(state.replace(semantic_index=SemanticIndex.fit(state.company_vectors)))
+
+    def optimized_search(self, query: str, fase: str = None, limit: int = 5, fields: Optional[List[str]] = None, spelling: bool = False, trace: Optional[SearchTrace] = None):
+        """
+        Empresas encontradas (CompanyRecord: id, nome, setores e fase), em
+        ordem de score; o registro completo vem do banco pelos ids. As durações
+        de cada estágio e as contagens de linhas vão para search_metrics; passe
+        um `trace` para lê-las depois (ex.: header de debug).
+        """
+        trace = trace or SearchTrace("optimized_search")
+        with self._reading():
+            scored = self._scored_search(query, fase, limit, fields, spelling, trace)
+            with trace.stage("hydrate"):
+                companies = [self._company_by_id(company_id) for company_id, _ in scored]
+        search_metrics.record(trace)
+        return [company for company in companies if company is not None]
+
+    def _company_by_id(self, company_id: int) -> Optional[CompanyRecord]:
+        row = self._row_by_id.get(company_id)
+        return None if row is None else self.companies.record(row)
+
+    def scored_search(self, query: str, fase: str = None, limit: int = 5, fields: Optional[List[str]] = None, spelling: bool = False, trace: Optional[SearchTrace] = None) -> List[Tuple[int, float]]:
+        """
+        Busca com cache: devolve pares (id da empresa, score final) em ordem
+        decrescente. `fields` restringe a busca a alguns campos (só com o
+        ranker "fields"; os demais indexam um texto único e a ignoram).
+        Com `spelling`, tokens fora do vocabulário são trocados pelo termo
+        mais próximo antes da vetorização.
+        """
+        trace = trace or SearchTrace("scored_search")
+        with self._reading():
+            results = self._scored_search(query, fase, limit, fields, spelling, trace)
+        search_metrics.record(trace)
+        return results
+
+    def _scored_search(self, query: str, fase: Optional[str], limit: int, fields, spelling: bool, trace: SearchTrace) -> List[Tuple[int, float]]:
+        fields = validate_fields(fields)
+        if self.tfidf_vectorizer is None or self.company_vectors is None or limit <= 0:
             return []
 
-        normalized_query = unidecode(query).lower()
-        query_vector = self.tfidf_vectorizer.transform([normalized_query])
-        cosine_scores = cosine_similarity(query_vector, self.company_vectors).flatten()
-        
-        scored_companies = []
-        RELEVANCE_THRESHOLD = 0.015
-
-        for i, score in enumerate(cosine_scores):
-            company = self.all_companies_list[i]
-            
-            if score < RELEVANCE_THRESHOLD: 
-                continue
-                
-            if fase and company.fase_da_startup != fase:
+        with trace.stage("normalize"):
+            normalized_query = normalize_query(query)
+        cache_key = (normalized_query, fase, limit)
+        if fields is not None or spelling:
+            cache_key += (fields, spelling)
+        generation = self.generation
+        cached = self.result_cache.get(cache_key, generation)
+        if cached is not None:
+            trace.cache_hit = True
+            trace.count("returned", len(cached))
+            return list(cached)
+
+        results = self._score(normalized_query, fase, limit, fields, spelling, trace)
+        self.result_cache.put(cache_key, generation, tuple(results))
+        return results
+
+    def faceted_search(self, query: str, fase: str = None, limit: int = 5, fields: Optional[List[str]] = None, spelling: bool = False, trace: Optional[SearchTrace] = None) -> Tuple[List[Tuple[int, float]], int, dict]:
+        """
+        Como scored_search, mais o total de empresas encontradas e as contagens
+        por setor/fase sobre todas elas (não só as `limit` primeiras).
+        """
+        trace = trace or SearchTrace("faceted_search")
+        with self._reading():
+            result = self._faceted_search(query, fase, limit, fields, spelling, trace)
+        search_metrics.record(trace)
+        return result
+
+    def _faceted_search(self, query: str, fase: Optional[str], limit: int, fields, spelling: bool, trace: SearchTrace):
+        fields = validate_fields(fields)
+        if self.tfidf_vectorizer is None or self.company_vectors is None or limit <= 0:
+            return [], 0, {field: {} for field in FACET_FIELDS}
+
+        with trace.stage("normalize"):
+            normalized_query = normalize_query(query)
+        cache_key = ("facets", normalized_query, fase, limit, fields, spelling)
+        generation = self.generation
+        cached = self.result_cache.get(cache_key, generation)
+        if cached is not None:
+            results, total, facets = cached
+            trace.cache_hit = True
+            trace.count("returned", len(results))
+            return list(results), total, facets
+
+        rows, final_scores = self._all_matches(normalized_query, fase, fields, spelling, trace)
+        with trace.stage("top_k"):
+            top_rows, top_scores = top_k(rows, final_scores, limit)
+        ids = self.companies.ids
+        results = [(int(ids[r]), float(score)) for r, score in zip(top_rows, top_scores)]
+        trace.count("returned", len(results))
+        with trace.stage("facets"):
+            facets = self.facet_counts(rows)
+
+        self.result_cache.put(cache_key, generation, (tuple(results), len(rows), facets))
+        return results, len(rows), facets
+
+    def autocomplete(self, prefix: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[Tuple[str, str, Optional[int]]]:
+        """Sugestões (tipo, texto, id) de nomes de empresa e setores para um prefixo digitado."""
+        with self._reading() as state:
+            return state.prefix_index.search(prefix, limit)
+
+    def semantic_search(self, query: str, fase: str = None, limit: int = 5, nprobe: int = SEMANTIC_NPROBE) -> List[Tuple[int, float]]:
+        """
+        Busca densa (LSA + IVF): pares (id da empresa, similaridade) em ordem
+        decrescente. `nprobe` troca recall por latência.
+        """
+        with self._reading():
+            return self._semantic_search(query, fase, limit, nprobe)
+
+    def _semantic_search(self, query: str, fase: Optional[str], limit: int, nprobe: int) -> List[Tuple[int, float]]:
+        if self.tfidf_vectorizer is None or self.company_vectors is None or limit <= 0:
+            return []
+
+        normalized_query = normalize_query(query)
+        cache_key = ("semantic", normalized_query, fase, limit, nprobe)
+        generation = self.generation
+        cached = self.result_cache.get(cache_key, generation)
+        if cached is not None:
+            return list(cached)
+
+        index = self.semantic_index
+        if index is None:
+            raise SemanticIndexUnavailable()
+        allowed_rows = self._fase_rows.get(fase, np.empty(0, dtype=np.int64)) if fase else None
+        rows, scores = index.search(self.tfidf_vectorizer.transform([normalized_query]), nprobe, allowed_rows)
+        ids = self.companies.ids
+        # O índice denso é atualizado pelas escritas: pode já ter linhas que este estado não tem
+        in_range = rows < len(ids)
+        rows, scores = top_k(rows[in_range], scores[in_range], limit)
+        results = [(int(ids[row]), float(score)) for row, score in zip(rows, scores)]
+
+        self.result_cache.put(cache_key, generation, tuple(results))
+        return results
+
+    def _query_terms(self, normalized_query: str, spelling: bool = False) -> List[str]:
+        """Termos da query (unigramas e bigramas de stems), como o analyzer do vetorizador."""
+        if not spelling:
+            return self._analyzer(normalized_query)
+
+        stems = self.spelling_index.correct_all(custom_tokenizer(normalized_query))
+        low, high = self.tfidf_vectorizer.ngram_range
+        return [" ".join(stems[i:i + n]) for n in range(low, high + 1) for i in range(len(stems) - n + 1)]
+
+    def _block_max_index(self) -> BlockMaxIndex:
+        cache = self._fase_matrices
+        index = cache.get("block_max")
+        if index is None:
+            with self._write_lock:
+                index = cache.get("block_max")
+                if index is None:
+                    index = cache["block_max"] = BlockMaxIndex(self.company_vectors)
+        return index
+
+    def batch_search(self, items: List[Tuple[str, Optional[str], int]]) -> List[List[Tuple[int, float]]]:
+        """
+        Várias buscas (query, fase, limit) de uma vez: as que não estão no cache
+        são vetorizadas numa única chamada de transform e pontuadas com um único
+        produto esparso matriz x matriz. Devolve uma lista de resultados por item,
+        na mesma ordem.
+        """
+        trace = SearchTrace("batch_search")
+        with self._reading():
+            results = self._batch_search(items, trace)
+        search_metrics.record(trace)
+        return results
+
+    def _batch_search(self, items: List[Tuple[str, Optional[str], int]], trace: SearchTrace) -> List[List[Tuple[int, float]]]:
+        results: List[List[Tuple[int, float]]] = [[] for _ in items]
+        if self.tfidf_vectorizer is None or self.company_vectors is None:
+            return results
+
+        generation = self.generation
+        pending = []
+        for position, (query, fase, limit) in enumerate(items):
+            if limit <= 0:
                 continue
+            with trace.stage("normalize"):
+                normalized_query = normalize_query(query)
+            cached = self.result_cache.get((normalized_query, fase, limit), generation)
+            if cached is not None:
+                results[position] = list(cached)
+            else:
+                pending.append((position, normalized_query, fase, limit))
+
+        if not pending:
+            return results
+
+        if self.ranker.name != "tfidf":
+            # O produto matriz x matriz só vale para o cosseno TF-IDF
+            for position, normalized_query, fase, limit in pending:
+                results[position] = self._score(normalized_query, fase, limit, trace=trace)
+                self.result_cache.put((normalized_query, fase, limit), generation, tuple(results[position]))
+            return results
+
+        with trace.stage("vectorize"):
+            query_vectors = self.tfidf_vectorizer.transform([normalized_query for _, normalized_query, _, _ in pending])
+        with trace.stage("cosine"):
+            # (empresas x queries), esparso: só existem os pares com algum termo em comum
+            scores = self.company_vectors.dot(query_vectors.T).tocsc()
+
+        for column, (position, normalized_query, fase, limit) in enumerate(pending):
+            start, end = scores.indptr[column], scores.indptr[column + 1]
+            rows, cosine_scores = scores.indices[start:end], scores.data[start:end]
+
+            keep = cosine_scores >= RELEVANCE_THRESHOLD
+            if fase:
+                keep &= np.isin(rows, self._fase_rows.get(fase, np.empty(0, dtype=np.int64)))
+            trace.count("candidates", int(keep.sum()))
+            results[position] = self._rank(normalized_query, rows[keep].astype(np.int64), cosine_scores[keep], limit, trace)
+            trace.count("returned", len(results[position]))
+            self.result_cache.put((normalized_query, fase, limit), generation, tuple(results[position]))
+
+        return results
+
+    def _score(self, normalized_query: str, fase: Optional[str], limit: int, fields: Optional[Tuple[str, ...]] = None, spelling: bool = False, trace=NO_TRACE) -> List[Tuple[int, float]]:
+        if self._block_max():
+            with trace.stage("analyze"):
+                query_terms = self._query_terms(normalized_query, spelling)
+            top_rows, top_scores = self._block_max_top_k(normalized_query, query_terms, fase, limit, trace)
+        else:
+            rows, final_scores = self._all_matches(normalized_query, fase, fields, spelling, trace, limit)
+            with trace.stage("top_k"):
+                top_rows, top_scores = top_k(rows, final_scores, limit)
+        trace.count("returned", len(top_rows))
+
+        ids = self.companies.ids
+        return [(int(ids[r]), float(score)) for r, score in zip(top_rows, top_scores)]
+
+    def _all_matches(self, normalized_query: str, fase: Optional[str], fields, spelling: bool, trace, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Linhas (e scores finais) que passam do corte; com shards e `limit`, só o top-k de cada shard."""
+        with trace.stage("analyze"):
+            query_terms = self._query_terms(normalized_query, spelling)
+        if self._sharded():
+            with trace.stage("shards"):
+                return self._shard_matches(normalized_query, query_terms, fase, limit)
+
+        candidate_rows, relevance = self.ranker.candidates(self, query_terms, fase, fields, trace=trace)
+        trace.count("candidates", len(candidate_rows))
+        return self._matches(normalized_query, candidate_rows, relevance, trace)
+
+    def _block_max(self) -> bool:
+        # As postings são da matriz TF-IDF: só valem para o cosseno (e dispensam os shards)
+        return self.retrieval == "maxscore" and self.ranker.name == "tfidf"
+
+    def _fase_mask(self, fase: str) -> np.ndarray:
+        """Máscara booleana das linhas da fase, descartada a cada escrita como as sub-matrizes."""
+        key = ("mask", fase)
+        mask = self._fase_matrices.get(key)
+        if mask is None:
+            mask = np.zeros(len(self.companies), dtype=bool)
+            mask[self._fase_rows.get(fase, np.empty(0, dtype=np.int64))] = True
+            self._fase_matrices[key] = mask
+        return mask
+
+    def _block_max_top_k(self, normalized_query: str, query_terms: List[str], fase: Optional[str], limit: int, trace=NO_TRACE) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mesmo top-k de _all_matches + top_k, lendo só parte das postings.
+
+        O score final de uma linha é no máximo cosseno * peso + 100 * FUZZY_WEIGHT;
+        com o limite do cosseno por bloco, isso limita o score de todo o bloco.
+        Os blocos são lidos em rodadas, em ordem decrescente de limite, e a
+        leitura para quando o limite do próximo fica abaixo do k-ésimo score
+        final já encontrado (ou não passa de MIN_FINAL_SCORE). Empate com o
+        k-ésimo ainda é lido, por causa do desempate pela linha.
+        """
+        top_rows, top_scores = np.empty(0, dtype=np.int64), np.empty(0)
+        with trace.stage("vectorize"):
+            query_vector = self._terms_vector(query_terms)
+        columns, weights = query_vector.indices, query_vector.data
+        if not len(columns) or (fase and not len(self._fase_rows.get(fase, ()))):
+            return top_rows, top_scores
+
+        index = self._block_max_index()
+        fuzzy_bound = 100 * FUZZY_WEIGHT if self.ranker.fuzzy else 0.0
+        with trace.stage("block_bounds"):
+            blocks, bounds = index.block_bounds(columns, weights)
+            bounds = bounds * self.ranker.weight + fuzzy_bound + BLOCK_MAX_SLACK
+            viable = bounds > MIN_FINAL_SCORE
+            order = np.argsort(-bounds[viable], kind="stable")
+            blocks, bounds = blocks[viable][order], bounds[viable][order]
+        allowed = self._fase_mask(fase) if fase else None
+
+        # Menor score final que ainda entra no top-k
+        threshold = MIN_FINAL_SCORE
+        start, batch, evaluated, candidates = 0, BLOCK_MAX_FIRST_BLOCKS, 0, 0
+        while start < len(blocks):
+            # bounds é decrescente: os blocos que ainda alcançam o threshold são um prefixo
+            end = min(start + batch, int(np.searchsorted(-bounds, -threshold, side="right")))
+            if end <= start:
+                break
+            with trace.stage("postings"):
+                rows, cosine_scores = index.score_blocks(columns, weights, np.sort(blocks[start:end]))
+            evaluated += len(rows)
+
+            keep = cosine_scores >= RELEVANCE_THRESHOLD
+            keep &= cosine_scores * self.ranker.weight + fuzzy_bound + BLOCK_MAX_SLACK >= threshold
+            if allowed is not None:
+                keep &= allowed[rows]
+            candidates += int(keep.sum())
+            # O corte do fuzzy sai do melhor TF-IDF da rodada, como nos shards:
+            # só descarta quem já não passaria de MIN_FINAL_SCORE
+            matched_rows, final_scores = self._matches(normalized_query, rows[keep], cosine_scores[keep], trace)
+            with trace.stage("top_k"):
+                top_rows, top_scores = top_k(
+                    np.concatenate([top_rows, matched_rows]), np.concatenate([top_scores, final_scores]), limit
+                )
+            if len(top_rows) == limit:
+                threshold = max(threshold, float(top_scores[-1]))
+            start, batch = end, batch * 2
+
+        trace.count("evaluated", evaluated)
+        trace.count("candidates", candidates)
+        return top_rows, top_scores
+
+    def _sharded(self) -> bool:
+        # Os shards fatiam company_vectors: só valem para o cosseno TF-IDF
+        return self.shards > 1 and self.ranker.name == "tfidf" and len(self.companies) >= SHARD_MIN_ROWS
+
+    def _shard_views(self, fase: Optional[str]) -> List[Tuple[np.ndarray, Any]]:
+        """
+        (linhas globais, sub-matriz) de cada shard: fatias contíguas da matriz
+        (ou da sub-matriz da fase), descartadas a cada escrita como as de fase.
+        """
+        key = ("shards", fase)
+        views = self._fase_matrices.get(key)
+        if views is None:
+            if fase:
+                rows = self._fase_rows.get(fase, np.empty(0, dtype=np.int64))
+                matrix = self._fase_matrix(fase) if len(rows) else None
+            else:
+                rows = np.arange(self.company_vectors.shape[0])
+                matrix = self.company_vectors
+            bounds = np.linspace(0, len(rows), self.shards + 1).astype(np.int64)
+            views = [(rows[start:end], matrix[start:end]) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+            self._fase_matrices[key] = views
+        return views
+
+    def _shard_matches(self, normalized_query: str, query_terms: List[str], fase: Optional[str], limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Como _candidates + _matches, shard a shard no pool de shards. Com
+        `limit`, cada shard já devolve só o próprio top-k: o top-k global está
+        contido na união deles (mesmo desempate pela linha global).
+        """
+        query_vector = self._terms_vector(query_terms)
+        state = self._current()
+
+        def score_shard(view):
+            rows, matrix = view
+            candidate_rows, cosine_scores = self._cosine_hits(matrix, rows, query_vector)
+            # O corte do fuzzy sai do melhor TF-IDF do shard; como ele é no
+            # máximo o global, o corte só descarta quem já não passaria
+            with self._reading(state):
+                matched_rows, final_scores = self._matches(normalized_query, candidate_rows, cosine_scores)
+            return top_k(matched_rows, final_scores, limit) if limit else (matched_rows, final_scores)
+
+        parts = list(search_executor.shard_pool.map(score_shard, self._shard_views(fase)))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate([rows for rows, _ in parts]), np.concatenate([scores for _, scores in parts])
+
+    def _rank(self, normalized_query: str, candidate_rows: np.ndarray, relevance: np.ndarray, limit: int, trace=NO_TRACE) -> List[Tuple[int, float]]:
+        """Top-k (id, score) entre as linhas que passam do corte final."""
+        rows, final_scores = self._matches(normalized_query, candidate_rows, relevance, trace)
+        with trace.stage("top_k"):
+            top_rows, top_scores = top_k(rows, final_scores, limit)
+
+        ids = self.companies.ids
+        return [(int(ids[r]), float(score)) for r, score in zip(top_rows, top_scores)]
+
+    def _matches(self, normalized_query: str, candidate_rows: np.ndarray, relevance: np.ndarray, trace=NO_TRACE) -> Tuple[np.ndarray, np.ndarray]:
+        """Fuzzy em lote sobre os candidatos já filtrados; devolve as linhas (e scores) com score final > MIN_FINAL_SCORE."""
+        company_texts = self.company_texts
+        # Rankers com estado próprio (BM25, campos) são atualizados antes da
+        # publicação do estado: podem já devolver linhas que este ainda não tem
+        in_range = candidate_rows < len(company_texts)
+        if not in_range.all():
+            candidate_rows, relevance = candidate_rows[in_range], relevance[in_range]
+        if len(candidate_rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        tfidf_scores = relevance * self.ranker.weight
+        if not self.ranker.fuzzy:
+            keep = tfidf_scores > MIN_FINAL_SCORE
+            return candidate_rows[keep], tfidf_scores[keep]
+
+        with trace.stage("fuzzy"):
+            fuzzy_scores = batch_fuzzy_scores(
+                normalized_query, [company_texts[r] for r in candidate_rows], tfidf_scores.max()
+            )
+        trace.count("fuzzy_scored", len(candidate_rows))
+        final_scores = tfidf_scores + fuzzy_scores * FUZZY_WEIGHT
+
+        keep = final_scores > MIN_FINAL_SCORE
+        return candidate_rows[keep], final_scores[keep]
+
+    def _candidates(self, query_vector, fase: Optional[str] = None):
+        """
+        Linhas com cosseno >= RELEVANCE_THRESHOLD e seus scores. Com `fase`,
+        só a sub-matriz daquela fase é multiplicada pela query.
+        """
+        if fase:
+            rows = self._fase_rows.get(fase)
+            if rows is None or len(rows) == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0)
+            matrix = self._fase_matrix(fase)
+        else:
+            rows = None
+            matrix = self.company_vectors
+
+        return self._cosine_hits(matrix, rows, query_vector)
+
+    @staticmethod
+    def _cosine_hits(matrix, rows: Optional[np.ndarray], query_vector):
+        # Linhas e query já estão normalizadas (L2): o produto esparso é o cosseno.
+        cosine_scores = matrix.dot(query_vector.T).toarray().ravel()
+        hits = np.flatnonzero(cosine_scores >= RELEVANCE_THRESHOLD)
+        return (hits if rows is None else rows[hits]), cosine_scores[hits]
+
+
+def batch_fuzzy_scores(normalized_query: str, processed_texts: List[str], best_tfidf_score: float) -> np.ndarray:
+    """
+    token_set_ratio da query contra todos os candidatos numa única chamada.
+
+    O score_cutoff é o menor fuzzy que ainda permite ao melhor candidato passar
+    de MIN_FINAL_SCORE; abaixo dele o RapidFuzz devolve 0 sem terminar a conta.
+    """
+    score_cutoff = max(0.0, (MIN_FINAL_SCORE - best_tfidf_score) / FUZZY_WEIGHT)
+    if score_cutoff > 100:
+        return np.zeros(len(processed_texts))
+
+    processed_query = default_process(normalized_query)
+    large = len(processed_texts) >= FUZZY_PARALLEL_MIN_CANDIDATES
+
+    # Pool de processos opcional (SEARCH_FUZZY_PROCESSES) para conjuntos grandes
+    process_pool = search_executor.fuzzy_process_pool if large else None
+    if process_pool is not None:
+        chunk_size = -(-len(processed_texts) // search_executor.fuzzy_processes)
+        futures = [
+            process_pool.submit(fuzzy_chunk_scores, processed_query, processed_texts[i:i + chunk_size], score_cutoff)
+            for i in range(0, len(processed_texts), chunk_size)
+        ]
+        return np.concatenate([f.result() for f in futures])
+
+    return process.cdist(
+        [processed_query],
+        processed_texts,
+        scorer=fuzz.token_set_ratio,
+        score_cutoff=score_cutoff,
+        workers=-1 if large else 1,
+    )[0]
+
+
+def top_k(rows: np.ndarray, scores: np.ndarray, limit: int):
+    """
+    Seleciona as `limit` linhas de maior score em O(n) com argpartition e
+    ordena apenas essas (score decrescente, empate pela menor linha).
+    """
+    if len(rows) > limit:
+        kth_score = scores[np.argpartition(-scores, limit - 1)[limit - 1]]
+        selected = scores >= kth_score
+        rows, scores = rows[selected], scores[selected]
 
-            company_raw_text = f"{company.nome_da_empresa} {company.solucao} {company.setor_principal} {company.setor_secundario}"
-            fuzzy_tolerance_score = fuzz.token_set_ratio(unidecode(company_raw_text).lower(), normalized_query)
-            
-            tf_idf_weighted = score * 400
-            fuzzy_bonus = fuzzy_tolerance_score * 0.50 
-            final_score = tf_idf_weighted + fuzzy_bonus
-            
-            if final_score > 70.0: 
-                scored_companies.append({'company': company, 'score': final_score})
-        
-        scored_companies.sort(key=lambda x: x['score'], reverse=True)
-        
-        return [item['company'] for item in scored_companies[:limit]]
\ No newline at end of file
+    order = np.lexsort((rows, -scores))[:limit]
+    return rows[order], scores[order]
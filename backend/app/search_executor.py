@@ -0,0 +1,166 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# Executor exclusivo da busca: o trabalho pesado (NumPy/RapidFuzz) não disputa
+# o threadpool padrão do Starlette com os endpoints /empresa/* e de login.
+SEARCH_EXECUTOR_THREADS = int(os.getenv("SEARCH_EXECUTOR_THREADS", "4"))
+# > 0 liga um pool de processos para o estágio fuzzy de candidatos grandes
+SEARCH_FUZZY_PROCESSES = int(os.getenv("SEARCH_FUZZY_PROCESSES", "0"))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "5"))
+# Buscas esperando thread além deste número são recusadas na hora (503)
+SEARCH_MAX_QUEUE = int(os.getenv("SEARCH_MAX_QUEUE", "64"))
+# Threads que pontuam os shards de uma busca em paralelo (SEARCH_SHARDS > 1)
+SEARCH_SHARD_THREADS = int(os.getenv("SEARCH_SHARD_THREADS", str(os.cpu_count() or 1)))
+
+
+class SearchQueueFull(Exception):
+    """A fila do executor de busca está cheia."""
+
+
+def fuzzy_chunk_scores(processed_query: str, processed_texts: List[str], score_cutoff: float) -> np.ndarray:
+    """Um pedaço do estágio fuzzy; roda no processo filho (por isso fica neste módulo leve)."""
+    return process.cdist(
+        [processed_query], processed_texts, scorer=fuzz.token_set_ratio, score_cutoff=score_cutoff, workers=1
+    )[0]
+
+
+class SearchExecutor:
+
+    def __init__(
+        self,
+        threads: int = SEARCH_EXECUTOR_THREADS,
+        fuzzy_processes: int = SEARCH_FUZZY_PROCESSES,
+        max_queue: int = SEARCH_MAX_QUEUE,
+        timeout_seconds: float = SEARCH_TIMEOUT_SECONDS,
+        shard_threads: int = SEARCH_SHARD_THREADS,
+    ):
+        self.threads = threads
+        self.fuzzy_processes = fuzzy_processes
+        self.shard_threads = shard_threads
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+        # Os pools são criados no primeiro uso e recriados depois de um shutdown:
+        # o executor é global ao módulo e sobrevive a mais de um lifespan (testes, reload)
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._shards: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.max_queue_seen = 0
+        self._queue_wait_seconds = 0.0
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="search")
+        return self._threads
+
+    @property
+    def fuzzy_process_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Pool de processos do fuzzy, criado no primeiro uso (None se desligado)."""
+        if self.fuzzy_processes <= 0:
+            return None
+        with self._lock:
+            if self._processes is None:
+                # spawn: não herda as threads nem os locks do processo da API
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.fuzzy_processes, mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._processes
+
+    @property
+    def shard_pool(self) -> ThreadPoolExecutor:
+        """
+        Pool dos shards, separado das threads de busca: uma busca esperando os
+        próprios shards não pode ocupar as threads de que eles precisam.
+        """
+        with self._lock:
+            if self._shards is None:
+                self._shards = ThreadPoolExecutor(max_workers=self.shard_threads, thread_name_prefix="search-shard")
+        return self._shards
+
+    def _run_tracked(self, submitted_at: float, fn: Callable, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._queue_wait_seconds += time.perf_counter() - submitted_at
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+        with self._lock:
+            self.completed += 1
+        return result
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Executa `fn` numa thread de busca. Levanta SearchQueueFull se a fila
+        estiver cheia e asyncio.TimeoutError se passar do timeout. No timeout,
+        uma busca que ainda estava na fila é descartada; uma que já começou
+        termina em segundo plano, mas a requisição é liberada.
+        """
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise SearchQueueFull()
+            self.queued += 1
+            self.max_queue_seen = max(self.max_queue_seen, self.queued)
+
+        future = self.thread_pool.submit(self._run_tracked, time.perf_counter(), fn, args, kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout or self.timeout_seconds)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+                # Se ainda não começou, sai da fila; se já está rodando, termina sozinha
+                if future.cancel():
+                    self.queued -= 1
+            raise
+
+    def stats(self) -> dict:
+        started = self.completed + self.failed + self.running
+        return {
+            "threads": self.threads,
+            "fuzzy_processes": self.fuzzy_processes,
+            "shard_threads": self.shard_threads,
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "max_queue_seen": self.max_queue_seen,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": 1000 * self._queue_wait_seconds / started if started else 0.0,
+        }
+
+    def shutdown(self):
+        """Encerra os pools; o próximo uso cria outros (um novo lifespan volta a funcionar)."""
+        with self._lock:
+            pools = (self._threads, self._shards, self._processes)
+            self._threads = self._shards = self._processes = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+search_executor = SearchExecutor()
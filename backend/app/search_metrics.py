@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Métricas por estágio da busca, em memória e por processo: cada busca grava
+# um SearchTrace (durações e contagens de linhas) e, no fim, o trace inteiro
+# entra no registro com um único lock. Os histogramas têm buckets fixos, então
+# o custo não cresce com o número de buscas.
+
+SEARCH_METRICS_ENABLED = os.getenv("SEARCH_METRICS_ENABLED", "1") == "1"
+
+# Limites superiores dos buckets: durações em ms e contagens de linhas
+DURATION_BUCKETS_MS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+ROW_BUCKETS = [0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000]
+
+
+class Histogram:
+    """Contagem por bucket (o último é +inf), soma e máximo. Não é thread-safe: o registro serializa."""
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Limite superior do bucket que contém o quantil (o máximo observado no último bucket)."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for position, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[position] if position < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.total,
+            "mean": self.sum / self.total if self.total else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max if self.total else None,
+            "buckets": {
+                **{str(bound): count for bound, count in zip(self.bounds, self.counts)},
+                "+inf": self.counts[-1],
+            },
+        }
+
+
+class SearchTrace:
+    """Durações (ms) e contagens de linhas de uma busca; `kind` separa as métricas por endpoint."""
+
+    def __init__(self, kind: str = "optimized_search"):
+        self.kind = kind
+        self.started_at = time.perf_counter()
+        self.stages_ms: Dict[str, float] = {}
+        self.rows: Dict[str, int] = {}
+        self.cache_hit = False
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def count(self, name: str, rows: int):
+        self.rows[name] = self.rows.get(name, 0) + int(rows)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def server_timing(self) -> str:
+        """Valor do header Server-Timing (aparece no DevTools do navegador)."""
+        parts = [f"{name};dur={ms:.3f}" for name, ms in self.stages_ms.items()]
+        parts.append(f"total;dur={self.total_ms():.3f}")
+        if self.cache_hit:
+            parts.append("cache;desc=hit")
+        return ", ".join(parts)
+
+    def rows_header(self) -> str:
+        return ", ".join(f"{name}={count}" for name, count in self.rows.items())
+
+
+class _NoTrace:
+    """Trace que não grava nada (threads dos shards, chamadas internas)."""
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+    def count(self, name: str, rows: int):
+        pass
+
+
+NO_TRACE = _NoTrace()
+
+
+class MetricsRegistry:
+
+    def __init__(self, enabled: bool = SEARCH_METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, Histogram]] = {}
+        self._rows: Dict[str, Dict[str, Histogram]] = {}
+        self._searches: Dict[str, int] = {}
+        self._cache_hits: Dict[str, int] = {}
+
+    def record(self, trace: SearchTrace):
+        if not self.enabled:
+            return
+        total_ms = trace.total_ms()
+        with self._lock:
+            stages = self._stages.setdefault(trace.kind, {})
+            for name, ms in trace.stages_ms.items():
+                stages.setdefault(name, Histogram(DURATION_BUCKETS_MS)).observe(ms)
+            stages.setdefault("total", Histogram(DURATION_BUCKETS_MS)).observe(total_ms)
+
+            rows = self._rows.setdefault(trace.kind, {})
+            for name, count in trace.rows.items():
+                rows.setdefault(name, Histogram(ROW_BUCKETS)).observe(count)
+
+            self._searches[trace.kind] = self._searches.get(trace.kind, 0) + 1
+            if trace.cache_hit:
+                self._cache_hits[trace.kind] = self._cache_hits.get(trace.kind, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                kind: {
+                    "searches": searches,
+                    "cache_hits": self._cache_hits.get(kind, 0),
+                    "stages_ms": {name: h.snapshot() for name, h in self._stages.get(kind, {}).items()},
+                    "rows": {name: h.snapshot() for name, h in self._rows.get(kind, {}).items()},
+                }
+                for kind, searches in self._searches.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._rows.clear()
+            self._searches.clear()
+            self._cache_hits.clear()
+
+
+search_metrics = MetricsRegistry()
@@ -0,0 +1,194 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Optional
+
+from .search_engine import SearchEngine
+from .search_snapshot import current_snapshot_path, load_or_build_rows, load_published
+
+# Rebuild agendado do índice de busca; 0 desliga (continua disponível pelo endpoint)
+SEARCH_REBUILD_INTERVAL_SECONDS = float(os.getenv("SEARCH_REBUILD_INTERVAL_SECONDS", "0"))
+
+
+class RebuildInProgress(Exception):
+    """Já existe um rebuild do índice em andamento."""
+
+
+def rebuild_snapshot(base_dir: str) -> int:
+    """
+    Roda no processo filho: lê as empresas do banco em streaming e publica um
+    snapshot novo em base_dir (ou reaproveita o atual, se o banco não mudou).
+    Com um snapshot novo, regrava também os vetores LSA em startup_embeddings.
+    Retorna o número de empresas indexadas.
+    """
+    from . import crud
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        previous = current_snapshot_path(base_dir)
+        engine = load_or_build_rows(crud.stream_empresas_for_index(db), base_dir)
+        semantic_index = engine.semantic_index
+        if engine.snapshot_path != previous and semantic_index is not None:
+            alive = engine.companies.alive()
+            crud.replace_empresa_embeddings(db, engine.companies.ids[alive], semantic_index.embeddings[alive])
+        return engine.row_count
+    finally:
+        db.close()
+
+
+class SearchIndexRebuilder:
+    """
+    Reconstrói o índice de busca em segundo plano e troca o engine servido de
+    uma vez só (uma atribuição), sem nunca deixá-lo vazio: a geração antiga
+    atende as buscas até a nova ficar pronta, e requisições em andamento
+    terminam com a referência que já pegaram.
+
+    Com snapshot_dir, o fit roda num processo separado (não disputa o GIL com
+    as buscas) e a troca só mapeia o snapshot publicado, o que também avisa os
+    outros workers. Sem snapshot_dir, o fit roda numa thread própria.
+    """
+
+    def __init__(
+        self,
+        load_companies: Callable[[], Iterable[Any]],
+        on_swap: Callable[[Optional[SearchEngine]], None],
+        snapshot_dir: Optional[str] = None,
+    ):
+        self.load_companies = load_companies
+        self.on_swap = on_swap
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self.running = False
+        self.generation = 0
+        self.row_count = 0
+        self.last_build_seconds: Optional[float] = None
+        self.last_started_at: Optional[str] = None
+        self.last_swapped_at: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.rebuilds = 0
+        self.failures = 0
+
+    def install(self, engine: Optional[SearchEngine], build_seconds: Optional[float] = None):
+        """Publica o engine para as buscas e registra a nova geração."""
+        self.on_swap(engine)
+        with self._lock:
+            self.generation += 1
+            self.row_count = engine.row_count if engine is not None else 0
+            if build_seconds is not None:
+                self.last_build_seconds = build_seconds
+            self.last_swapped_at = datetime.now(timezone.utc).isoformat()
+
+    async def rebuild(self) -> int:
+        """
+        Constrói um engine novo a partir do banco e faz a troca. Levanta
+        RebuildInProgress se outro rebuild ainda não terminou. Retorna a geração
+        instalada.
+        """
+        self._claim()
+        return await self._rebuild()
+
+    def _claim(self):
+        # Verificar e marcar running juntos, sob o lock: duas chamadas nunca passam as duas
+        with self._lock:
+            if self.running:
+                raise RebuildInProgress()
+            self.running = True
+            self.last_started_at = datetime.now(timezone.utc).isoformat()
+
+    async def _rebuild(self) -> int:
+        """O rebuild em si; quem chama já marcou running com _claim."""
+        start = time.perf_counter()
+        try:
+            if self.snapshot_dir:
+                indexed = await asyncio.get_running_loop().run_in_executor(self._process_pool(), rebuild_snapshot, self.snapshot_dir)
+                # Tabela vazia: nada a mapear
+                engine = await asyncio.to_thread(self._open_snapshot) if indexed else None
+            else:
+                engine = await asyncio.to_thread(self._build)
+            self.install(engine, time.perf_counter() - start)
+            with self._lock:
+                self.rebuilds += 1
+                self.last_error = None
+                return self.generation
+        except Exception as e:
+            with self._lock:
+                if isinstance(e, BrokenProcessPool):
+                    # O filho morreu (ex.: OOM); o próximo rebuild cria outro pool
+                    self._processes = None
+                self.failures += 1
+                self.last_error = str(e)
+            print(f"Erro no rebuild do índice de busca: {e}")
+            raise
+        finally:
+            with self._lock:
+                self.running = False
+
+    def start(self) -> "asyncio.Task":
+        """Dispara o rebuild sem esperar por ele (para o endpoint de admin)."""
+        # Marca running já aqui: um segundo start antes de a task rodar recebe RebuildInProgress
+        self._claim()
+        task = asyncio.create_task(self._rebuild())
+        # O erro já fica registrado em last_error
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def run_periodically(self, interval_seconds: float = SEARCH_REBUILD_INTERVAL_SECONDS):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.rebuild()
+            except RebuildInProgress:
+                pass
+            except Exception:
+                pass  # já registrado; tenta de novo no próximo intervalo
+
+    def _build(self) -> Optional[SearchEngine]:
+        # load_companies pode devolver um cursor: o engine lê as linhas uma vez só
+        engine = SearchEngine(self.load_companies())
+        if not engine.row_count:
+            return None
+        # Ainda fora do caminho das buscas: o engine só é instalado pronto
+        engine.fit_semantic_index()
+        return engine
+
+    def _open_snapshot(self) -> Optional[SearchEngine]:
+        # O snapshot vale pelo que o processo filho leu: escritas no banco
+        # durante o build ficam para o próximo rebuild, não o invalidam
+        engine = load_published(self.snapshot_dir, self.load_companies())
+        if engine is None:
+            raise RuntimeError("O rebuild terminou sem snapshot publicado.")
+        return engine
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._processes is None:
+                # spawn: o filho não herda conexões do banco nem threads da API
+                self._processes = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return self._processes
+
+    def stats(self) -> dict:
+        return {
+            "generation": self.generation,
+            "running": self.running,
+            "row_count": self.row_count,
+            "last_build_seconds": self.last_build_seconds,
+            "last_started_at": self.last_started_at,
+            "last_swapped_at": self.last_swapped_at,
+            "last_error": self.last_error,
+            "rebuilds": self.rebuilds,
+            "failures": self.failures,
+        }
+
+    def shutdown(self):
+        # Como no SearchExecutor: o próximo rebuild cria outro pool
+        with self._lock:
+            processes, self._processes = self._processes, None
+        if processes is not None:
+            processes.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,416 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from .search_engine import SearchEngine, make_tfidf_vectorizer, stem_cache, STEM_CACHE_PATH
+from .company_store import CompanyRecord, CompanyStore
+from .mapped_texts import MappedTexts, map_file
+from .semantic_index import SemanticIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+# Snapshot do índice de busca em disco: o boot (e cada worker) abre os
+# arrays com mmap em vez de refazer o fit do TF-IDF.
+#
+# Layout de SEARCH_SNAPSHOT_DIR:
+#   CURRENT                 -> nome do snapshot ativo (trocado com os.replace)
+#   .build.lock             -> garante um único build entre workers
+#   stems.json              -> tabela de stems (ver StemCache)
+#   snapshot-<timestamp>/
+#       manifest.json       -> versão do formato, fingerprint, tamanhos
+#       vocabulary.json     -> termos na ordem das colunas
+#       idf.npy, document_frequencies.npy
+#       data.npy, indices.npy, indptr.npy   -> CSR de company_vectors
+#       company_ids.npy     -> linha -> id da empresa
+#       texts.bin, text_offsets.npy         -> textos pré-processados do fuzzy
+#       semantic_*.npy      -> índice semântico (LSA + IVF), ajustado no build
+
+SNAPSHOT_FORMAT_VERSION = 2
+SEARCH_SNAPSHOT_DIR = os.getenv("SEARCH_SNAPSHOT_DIR")
+# Quantos snapshots antigos manter além do ativo (workers ainda podem estar lendo)
+SNAPSHOTS_TO_KEEP = 2
+# Intervalo com que cada worker confere se CURRENT aponta para outro snapshot
+SEARCH_SNAPSHOT_POLL_SECONDS = float(os.getenv("SEARCH_SNAPSHOT_POLL_SECONDS", "5"))
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+STEMS_FILE = "stems.json"
+BUILD_LOCK_FILE = ".build.lock"
+# Arrays do SemanticIndex, na ordem do construtor
+SEMANTIC_ARRAYS = ("projection", "embeddings", "centroids", "assignments")
+
+
+def corpus_fingerprint(companies: List[Any]) -> str:
+    """Hash dos campos indexados de todas as empresas; muda se o snapshot ficou velho."""
+    digest = hashlib.sha1()
+    for c in sorted(companies, key=lambda c: c.id):
+        _update_fingerprint(digest, c)
+    return digest.hexdigest()
+
+
+def _update_fingerprint(digest, c):
+    digest.update(
+        f"{c.id}\x1f{c.nome_da_empresa}\x1f{c.solucao}\x1f{c.setor_principal}\x1f{c.setor_secundario}\x1e".encode("utf-8")
+    )
+
+
+class FingerprintedRows:
+    """
+    Repassa as empresas de um cursor calculando, no caminho, o mesmo
+    corpus_fingerprint (que ordena por id: as linhas já precisam vir assim).
+    """
+
+    def __init__(self, rows: Iterable[Any]):
+        self._rows = rows
+        self._digest = hashlib.sha1()
+
+    def __iter__(self) -> Iterator[Any]:
+        last_id = None
+        for c in self._rows:
+            if last_id is not None and c.id <= last_id:
+                raise ValueError("As empresas do build em streaming precisam vir em ordem crescente de id.")
+            last_id = c.id
+            _update_fingerprint(self._digest, c)
+            yield c
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def current_snapshot_path(base_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(base_dir, CURRENT_FILE), encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(base_dir, name)
+    return path if name and os.path.isdir(path) else None
+
+
+def save_snapshot(engine: SearchEngine, base_dir: str, fingerprint: str) -> str:
+    """
+    Grava o estado ajustado do engine num novo diretório e o publica em
+    CURRENT de forma atômica. Retorna o caminho do snapshot.
+    """
+    with engine._write_lock:
+        if engine.tfidf_vectorizer is None:
+            raise ValueError("Não há índice ajustado para salvar.")
+        if engine._removed_rows:
+            engine.compact()
+
+        os.makedirs(base_dir, exist_ok=True)
+        previous = current_snapshot_path(base_dir)
+        previous_manifest = read_manifest(previous) if previous else None
+        generation = (previous_manifest or {}).get("generation", 0) + 1
+        name = f"snapshot-{time.time_ns()}"
+        tmp_path = os.path.join(base_dir, f".{name}.tmp")
+        os.makedirs(tmp_path)
+
+        vectorizer = engine.tfidf_vectorizer
+        vectors = engine.company_vectors
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, column in vectorizer.vocabulary_.items():
+            terms[column] = term
+
+        encoded_texts = [t.encode("utf-8") for t in engine.company_texts]
+        text_offsets = np.zeros(len(encoded_texts) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in encoded_texts], out=text_offsets[1:])
+
+        np.save(os.path.join(tmp_path, "idf.npy"), np.asarray(vectorizer.idf_, dtype=np.float64))
+        np.save(os.path.join(tmp_path, "document_frequencies.npy"), np.asarray(engine.document_frequencies, dtype=np.int64))
+        np.save(os.path.join(tmp_path, "data.npy"), vectors.data)
+        np.save(os.path.join(tmp_path, "indices.npy"), vectors.indices)
+        np.save(os.path.join(tmp_path, "indptr.npy"), vectors.indptr)
+        np.save(os.path.join(tmp_path, "company_ids.npy"), engine.companies.ids)
+        np.save(os.path.join(tmp_path, "text_offsets.npy"), text_offsets)
+        with open(os.path.join(tmp_path, "texts.bin"), "wb") as f:
+            f.write(b"".join(encoded_texts))
+        with open(os.path.join(tmp_path, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        semantic_index = engine.semantic_index
+        if semantic_index is not None:
+            for array_name in SEMANTIC_ARRAYS:
+                np.save(os.path.join(tmp_path, f"semantic_{array_name}.npy"), getattr(semantic_index, array_name))
+
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "fingerprint": fingerprint,
+            "generation": generation,
+            "n_rows": vectors.shape[0],
+            "n_terms": vectors.shape[1],
+            "semantic": semantic_index is not None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+    path = os.path.join(base_dir, name)
+    os.rename(tmp_path, path)
+    _publish(base_dir, name)
+    _prune(base_dir, keep=name)
+    engine.snapshot_path = path
+    engine.snapshot_generation = generation
+    return path
+
+
+def _publish(base_dir: str, name: str):
+    tmp_current = os.path.join(base_dir, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp_current, os.path.join(base_dir, CURRENT_FILE))
+
+
+def _prune(base_dir: str, keep: str):
+    snapshots = sorted(n for n in os.listdir(base_dir) if n.startswith("snapshot-") and n != keep)
+    for name in snapshots[:max(0, len(snapshots) - SNAPSHOTS_TO_KEEP)]:
+        # Processos que ainda mapeiam estes arquivos continuam lendo normalmente
+        shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+
+
+def read_manifest(snapshot_path: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(snapshot_path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(base_dir: str, companies: List[Any], fingerprint: Optional[str] = None) -> Optional[SearchEngine]:
+    """
+    Abre o snapshot ativo com np.load(mmap_mode='r'). Retorna None se não houver
+    snapshot, se o formato for de outra versão ou se ele estiver velho em
+    relação às empresas informadas (fingerprint ou ids divergentes).
+    """
+    path = current_snapshot_path(base_dir)
+    if path is None:
+        return None
+
+    manifest = read_manifest(path)
+    if manifest is None or manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        return None
+    if fingerprint is not None and manifest.get("fingerprint") != fingerprint:
+        return None
+
+    company_ids = np.load(os.path.join(path, "company_ids.npy"))
+    companies_by_id = {c.id: c for c in companies}
+    ordered_companies = [companies_by_id.get(int(company_id)) for company_id in company_ids]
+    if len(companies_by_id) != len(ordered_companies) or any(c is None for c in ordered_companies):
+        return None
+
+    engine = SearchEngine.from_state(
+        ordered_companies, _read_texts(path), *_read_arrays(path, manifest), semantic_index=_read_semantic(path, manifest)
+    )
+    engine.snapshot_path = path
+    engine.snapshot_generation = manifest.get("generation", 0)
+    return engine
+
+
+def load_published(base_dir: str, rows: Iterable[Any]) -> Optional[SearchEngine]:
+    """
+    Adota a geração apontada por CURRENT como ela foi publicada, sem conferir o
+    fingerprint: linhas, ordem e textos vêm do próprio snapshot (company_ids.npy,
+    texts.bin) e das empresas lidas só os campos das linhas dele. Uma escrita no
+    banco depois da publicação não impede a troca; empresas apagadas nesse meio
+    tempo entram como linhas removidas, e o próximo rebuild alinha o resto.
+    Retorna None se não houver snapshot ou se o formato for de outra versão.
+    """
+    path = current_snapshot_path(base_dir)
+    if path is None:
+        return None
+    manifest = read_manifest(path)
+    if manifest is None or manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        return None
+
+    company_ids = np.load(os.path.join(path, "company_ids.npy")).tolist()
+    published_ids = set(company_ids)
+    companies_by_id = {c.id: c for c in rows if c.id in published_ids}
+    ordered_companies = [
+        companies_by_id.get(company_id) or CompanyRecord(company_id, None, None, None, None) for company_id in company_ids
+    ]
+    engine = SearchEngine.from_state(
+        ordered_companies, _read_texts(path), *_read_arrays(path, manifest), semantic_index=_read_semantic(path, manifest)
+    )
+    for company_id in published_ids - companies_by_id.keys():
+        engine.remove(company_id)
+    engine.snapshot_path = path
+    engine.snapshot_generation = manifest.get("generation", 0)
+    return engine
+
+
+def _read_texts(path: str) -> MappedTexts:
+    """Textos do fuzzy com texts.bin mapeado: cada um só é decodificado quando lido."""
+    return MappedTexts(map_file(os.path.join(path, "texts.bin")), np.load(os.path.join(path, "text_offsets.npy"), mmap_mode="r"))
+
+
+def _read_arrays(path: str, manifest: dict):
+    """(vetorizador, matriz mapeada, frequências de documento mapeadas) de um snapshot."""
+    with open(os.path.join(path, "vocabulary.json"), encoding="utf-8") as f:
+        terms = json.load(f)
+    # vocabulary_ atribuído direto, como no fit_tfidf: o parâmetro `vocabulary` guardaria uma segunda cópia
+    tfidf_vectorizer = make_tfidf_vectorizer(
+        {term: column for column, term in enumerate(terms)}, np.load(os.path.join(path, "idf.npy"))
+    )
+    del terms
+
+    company_vectors = sp.csr_matrix(
+        (
+            np.load(os.path.join(path, "data.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "indices.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "indptr.npy"), mmap_mode="r"),
+        ),
+        shape=(manifest["n_rows"], manifest["n_terms"]),
+        copy=False,
+    )
+    return tfidf_vectorizer, company_vectors, np.load(os.path.join(path, "document_frequencies.npy"), mmap_mode="r")
+
+
+def _read_semantic(path: str, manifest: dict) -> Optional[SemanticIndex]:
+    """Índice semântico salvo com o snapshot (arrays mapeados), ou None se o build não o ajustou."""
+    if not manifest.get("semantic"):
+        return None
+    return SemanticIndex(
+        *(np.load(os.path.join(path, f"semantic_{array_name}.npy"), mmap_mode="r") for array_name in SEMANTIC_ARRAYS)
+    )
+
+
+def _read_rows(rows: Iterable[Any]) -> Tuple[SearchEngine, CompanyStore, List[str], str]:
+    """Lê as empresas uma vez: engine ainda sem fit, store, textos normalizados e fingerprint."""
+    engine = SearchEngine.__new__(SearchEngine)
+    engine._init_runtime()
+    fingerprinted = FingerprintedRows(rows)
+    companies, company_texts = engine._read_rows(fingerprinted)
+    return engine, companies, company_texts, fingerprinted.hexdigest()
+
+
+def _install_snapshot(engine: SearchEngine, companies: CompanyStore, company_texts: List[str], base_dir: str, fingerprint: str) -> bool:
+    """
+    Instala no engine os arrays do snapshot ativo se ele for destas empresas,
+    na mesma ordem de linhas. Os textos lidos do banco são os mesmos do
+    snapshot (mesmo fingerprint), mas o engine fica com os de texts.bin,
+    mapeados e compartilhados entre os workers; `company_texts` só serve ao
+    fit quando não há snapshot.
+    """
+    path = current_snapshot_path(base_dir)
+    if path is None:
+        return False
+    manifest = read_manifest(path)
+    if manifest is None or manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION or manifest.get("fingerprint") != fingerprint:
+        return False
+    if not np.array_equal(np.load(os.path.join(path, "company_ids.npy")), companies.ids):
+        return False
+
+    engine._install(companies, _read_texts(path), *_read_arrays(path, manifest), semantic_index=_read_semantic(path, manifest))
+    engine.snapshot_path = path
+    engine.snapshot_generation = manifest.get("generation", 0)
+    return True
+
+
+def load_snapshot_rows(base_dir: str, rows: Iterable[Any]) -> Optional[SearchEngine]:
+    """Como load_snapshot, lendo as empresas em streaming (em ordem de id, ver crud.stream_empresas_for_index)."""
+    engine, companies, company_texts, fingerprint = _read_rows(rows)
+    return engine if _install_snapshot(engine, companies, company_texts, base_dir, fingerprint) else None
+
+
+@contextmanager
+def build_lock(base_dir: str):
+    """Lock exclusivo entre processos: só um worker faz o fit, os outros esperam e abrem o snapshot."""
+    os.makedirs(base_dir, exist_ok=True)
+    with open(os.path.join(base_dir, BUILD_LOCK_FILE), "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def snapshot_changed(engine: Optional[SearchEngine], base_dir: str) -> bool:
+    """True se CURRENT aponta para um snapshot diferente do que este engine está servindo."""
+    current = current_snapshot_path(base_dir)
+    return current is not None and (engine is None or current != engine.snapshot_path)
+
+
+def load_or_build(companies: List[Any], base_dir: Optional[str] = SEARCH_SNAPSHOT_DIR) -> SearchEngine:
+    """
+    Abre o snapshot se ele corresponder às empresas do banco; senão refaz o
+    fit (com a tabela de stems aquecida) e grava um snapshot novo.
+    """
+    if not base_dir:
+        return _build(lambda: SearchEngine(companies), None, None)
+
+    fingerprint = corpus_fingerprint(companies)
+    # Com vários workers, o primeiro a pegar o lock faz o fit e publica o
+    # snapshot; os demais encontram o snapshot pronto e só o mapeiam.
+    with build_lock(base_dir):
+        start = time.perf_counter()
+        engine = load_snapshot(base_dir, companies, fingerprint)
+        if engine is not None:
+            print(f"Índice de busca carregado do snapshot em {time.perf_counter() - start:.2f}s.")
+            return engine
+        print("Snapshot do índice ausente ou desatualizado; refazendo o fit.")
+        engine = _build(lambda: SearchEngine(companies), base_dir, fingerprint)
+        # Reabre o que acabou de salvar para também servir das páginas
+        # mapeadas, compartilhadas com os outros workers.
+        return load_snapshot(base_dir, companies, fingerprint) or engine
+
+
+def load_or_build_rows(rows: Iterable[Any], base_dir: Optional[str] = SEARCH_SNAPSHOT_DIR) -> SearchEngine:
+    """
+    Como load_or_build, lendo as empresas de um cursor em ordem de id (ver
+    crud.stream_empresas_for_index): as linhas passam uma vez e só o store e
+    os textos normalizados ficam. Sem snapshot válido, o fit usa esses textos.
+    O engine volta sem linhas se a tabela estiver vazia.
+    """
+    if not base_dir:
+        return _build(lambda: SearchEngine(rows), None, None)
+
+    with build_lock(base_dir):
+        start = time.perf_counter()
+        engine, companies, company_texts, fingerprint = _read_rows(rows)
+        if not len(companies):
+            engine._fit_texts(companies, company_texts)
+            return engine
+        if _install_snapshot(engine, companies, company_texts, base_dir, fingerprint):
+            print(f"Índice de busca carregado do snapshot em {time.perf_counter() - start:.2f}s.")
+            return engine
+        print("Snapshot do índice ausente ou desatualizado; refazendo o fit.")
+
+        def fit():
+            engine._fit_texts(companies, company_texts)
+            return engine
+
+        _build(fit, base_dir, fingerprint)
+        _install_snapshot(engine, companies, company_texts, base_dir, fingerprint)
+        return engine
+
+
+def _build(fit: Callable[[], SearchEngine], base_dir: Optional[str], fingerprint: Optional[str]) -> SearchEngine:
+    stems_path = STEM_CACHE_PATH or (os.path.join(base_dir, STEMS_FILE) if base_dir else None)
+    if stems_path:
+        print(f"Stems pré-carregados: {stem_cache.load(stems_path)}")
+
+    engine = fit()
+    print(f"Cache de stems: {stem_cache.stats()}")
+    # O LSA + IVF leva segundos: ajustado aqui e salvo no snapshot, a busca só o mapeia
+    start = time.perf_counter()
+    engine.fit_semantic_index()
+    print(f"Índice semântico ajustado em {time.perf_counter() - start:.2f}s.")
+
+    if base_dir and engine.tfidf_vectorizer is not None:
+        print(f"Snapshot do índice salvo em {save_snapshot(engine, base_dir, fingerprint)}")
+    if stems_path:
+        os.makedirs(os.path.dirname(os.path.abspath(stems_path)), exist_ok=True)
+        stem_cache.save(stems_path)
+    return engine
@@ -0,0 +1,126 @@
+import os
+import warnings
+from typing import Optional, Tuple
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+
+# Busca densa: LSA (TruncatedSVD sobre a matriz TF-IDF) + índice IVF em memória.
+#
+# Cada empresa vira um vetor float32 de SEMANTIC_DIMENSIONS posições (L2 = 1).
+# O IVF agrupa esses vetores com k-means em SEMANTIC_NLIST listas; a busca só
+# visita as SEMANTIC_NPROBE listas cujos centróides estão mais perto da query,
+# então o custo cresce com n / nlist * nprobe e não com n.
+
+SEMANTIC_DIMENSIONS = int(os.getenv("SEMANTIC_DIMENSIONS", "128"))
+# 0 = sqrt(número de empresas)
+SEMANTIC_NLIST = int(os.getenv("SEMANTIC_NLIST", "0"))
+# Listas visitadas por busca: mais listas, mais recall e mais latência
+SEMANTIC_NPROBE = int(os.getenv("SEMANTIC_NPROBE", "8"))
+# Similaridade mínima (cosseno no espaço LSA) para entrar no resultado
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.10"))
+
+
+class SemanticIndexUnavailable(Exception):
+    """O engine não tem índice semântico: ele é ajustado no build/rebuild, não na busca."""
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class SemanticIndex:
+
+    def __init__(self, projection: np.ndarray, embeddings: np.ndarray, centroids: np.ndarray, assignments: np.ndarray):
+        # (termos x dimensões), contígua por termo: projetar uma query só lê
+        # as linhas dos termos presentes nela
+        self.projection = projection
+        # (linhas x dimensões), mesma numeração de linhas do SearchEngine
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.assignments = assignments
+        self._lists = None
+
+    @classmethod
+    def fit(cls, company_vectors, dimensions: int = SEMANTIC_DIMENSIONS, nlist: int = SEMANTIC_NLIST, random_state: int = 0):
+        """Ajusta o SVD e o k-means do IVF sobre a matriz TF-IDF (linhas zeradas ficam com vetor nulo)."""
+        n_rows, n_terms = company_vectors.shape
+        dimensions = max(1, min(dimensions, n_terms - 1, n_rows))
+        svd = TruncatedSVD(n_components=dimensions, random_state=random_state)
+        svd.fit(company_vectors)
+        projection = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+        embeddings = normalize_rows(company_vectors.astype(np.float32).dot(projection))
+
+        nlist = max(1, min(nlist or int(round(np.sqrt(n_rows))), n_rows))
+        with warnings.catch_warnings():
+            # Corpus pequeno com pontos repetidos: menos grupos distintos que nlist
+            warnings.simplefilter("ignore")
+            kmeans = MiniBatchKMeans(n_clusters=nlist, n_init=3, batch_size=2048, random_state=random_state)
+            assignments = kmeans.fit_predict(embeddings)
+        return cls(projection, embeddings, normalize_rows(kmeans.cluster_centers_), assignments.astype(np.int64))
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def project(self, tfidf_vectors) -> np.ndarray:
+        # float32 dos dois lados: com float64 o SciPy copiaria a projeção inteira a cada query
+        return normalize_rows(tfidf_vectors.astype(np.float32).dot(self.projection))
+
+    def add(self, tfidf_row):
+        """Acrescenta uma linha nova (mesma numeração do engine) na lista do centróide mais próximo."""
+        embedding = self.project(tfidf_row)
+        self.embeddings = np.vstack([self.embeddings, embedding])
+        self.assignments = np.append(self.assignments, int(np.argmax(self.centroids @ embedding[0])))
+        self._lists = None
+
+    def remove(self, row: int):
+        # Vetor nulo: similaridade 0, nunca passa de SEMANTIC_MIN_SCORE
+        if not self.embeddings.flags.writeable:
+            self.embeddings = np.array(self.embeddings)
+        self.embeddings[row] = 0.0
+
+    def compact(self, alive: np.ndarray) -> "SemanticIndex":
+        """Novo índice só com as linhas de `alive`, renumeradas como no engine; projeção e centróides iguais."""
+        return SemanticIndex(self.projection, self.embeddings[alive], self.centroids, self.assignments[alive])
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Linhas agrupadas por lista + offsets (formato CSR), refeitos após um add
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.assignments, minlength=self.nlist), out=offsets[1:])
+            self._lists = (order, offsets)
+        return self._lists
+
+    def search(
+        self,
+        query_vector,
+        nprobe: int = SEMANTIC_NPROBE,
+        allowed_rows: Optional[np.ndarray] = None,
+        min_score: float = SEMANTIC_MIN_SCORE,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Linhas candidatas e similaridades (>= min_score) visitando as `nprobe`
+        listas mais próximas da query. Com nprobe >= nlist a busca é exata.
+        """
+        query_embedding = self.project(query_vector)[0]
+        if not query_embedding.any():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        order, offsets = self._inverted_lists()
+        nprobe = max(1, min(nprobe, self.nlist))
+        if nprobe == self.nlist:
+            rows = np.arange(len(self.embeddings), dtype=np.int64)
+        else:
+            probed = np.argpartition(-(self.centroids @ query_embedding), nprobe - 1)[:nprobe]
+            rows = np.concatenate([order[offsets[i]:offsets[i + 1]] for i in probed])
+
+        if allowed_rows is not None:
+            rows = rows[np.isin(rows, allowed_rows)]
+        scores = self.embeddings[rows] @ query_embedding
+        keep = scores >= min_score
+        return rows[keep], scores[keep]
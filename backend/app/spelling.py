@@ -0,0 +1,97 @@
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from rapidfuzz.distance import OSA
+
+# Correção de erros de digitação na query, no estilo SymSpell: cada termo do
+# vocabulário do TF-IDF é indexado por todas as variações com até
+# `max_distance` letras apagadas. Um token fora do vocabulário gera as próprias
+# deleções e procura nesse dicionário; o custo depende do tamanho do token, não
+# do número de empresas.
+#
+# Só os `prefix_length` primeiros caracteres entram nas deleções (como no
+# SymSpell), o que limita o tamanho do índice para termos longos.
+
+SPELLING_MAX_DISTANCE = int(os.getenv("SEARCH_SPELLING_MAX_DISTANCE", "2"))
+SPELLING_PREFIX_LENGTH = int(os.getenv("SEARCH_SPELLING_PREFIX_LENGTH", "7"))
+# Tokens curtos demais geram correções arbitrárias ("ia" -> "da")
+SPELLING_MIN_LENGTH = int(os.getenv("SEARCH_SPELLING_MIN_LENGTH", "4"))
+
+
+def deletes(word: str, max_distance: int) -> set:
+    """Todas as strings obtidas apagando até `max_distance` caracteres de `word` (inclusive ela mesma)."""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+class SpellingIndex:
+
+    def __init__(self, terms: List[str], frequencies: np.ndarray, max_distance: int = SPELLING_MAX_DISTANCE,
+                 prefix_length: int = SPELLING_PREFIX_LENGTH, min_length: int = SPELLING_MIN_LENGTH):
+        self.terms = terms
+        self.frequencies = frequencies
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+        self._known = set(terms)
+
+        self._deletes: Dict[str, List[int]] = {}
+        for position, term in enumerate(terms):
+            for variant in deletes(term[:prefix_length], max_distance):
+                self._deletes.setdefault(variant, []).append(position)
+
+    @classmethod
+    def from_vocabulary(cls, vocabulary: Dict[str, int], document_frequencies: np.ndarray, **kwargs):
+        """Índice sobre os unigramas alfabéticos do vocabulário, com a frequência de documento de cada um."""
+        entries = [(term, column) for term, column in vocabulary.items() if term.isalpha()]
+        terms = [term for term, _ in entries]
+        columns = np.array([column for _, column in entries], dtype=np.int64)
+        frequencies = np.asarray(document_frequencies)[columns] if len(columns) else np.empty(0, dtype=np.int64)
+        return cls(terms, frequencies, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._deletes)
+
+    def correct(self, token: str) -> Optional[str]:
+        """
+        Termo do vocabulário mais próximo de `token` (distância de edição com
+        transposição), desempatando pela maior frequência de documento. None se
+        nenhum estiver a até `max_distance`. Termos conhecidos voltam iguais.
+        """
+        if token in self._known:
+            return token
+        if len(token) < self.min_length or not token.isalpha():
+            return None
+
+        candidates = set()
+        for variant in deletes(token[:self.prefix_length], self.max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+        if not candidates:
+            return None
+
+        best, best_key = None, None
+        for position in candidates:
+            term = self.terms[position]
+            distance = OSA.distance(token, term, score_cutoff=self.max_distance)
+            if distance > self.max_distance:
+                continue
+            key = (distance, -self.frequencies[position], term)
+            if best_key is None or key < best_key:
+                best, best_key = term, key
+        return best
+
+    def correct_all(self, tokens: Sequence[str]) -> List[str]:
+        """Substitui os tokens fora do vocabulário pela correção (mantém os que não têm)."""
+        corrected = []
+        for token in tokens:
+            replacement = self.correct(token)
+            corrected.append(replacement if replacement is not None else token)
+        return corrected
+
+    def stats(self) -> dict:
+        return {"terms": len(self.terms), "deletes": len(self._deletes), "max_distance": self.max_distance}
@@ -0,0 +1,44 @@
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+# Vetores densos (embeddings) gravados como float32 little-endian em bytea/BLOB.
+# O tipo vale só para as colunas que o declaram; listas comuns em outros
+# parâmetros continuam indo ao driver sem conversão nenhuma.
+
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+def encode_vector(value, dimensions: Optional[int] = None) -> bytes:
+    vector = np.asarray(value, dtype=VECTOR_DTYPE)
+    if vector.ndim != 1:
+        raise ValueError(f"Esperado um vetor 1-D, recebido shape {vector.shape}.")
+    if dimensions is not None and len(vector) != dimensions:
+        raise ValueError(f"Esperado um vetor com {dimensions} dimensões, recebido {len(vector)}.")
+    return vector.tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=VECTOR_DTYPE)
+
+
+class Vector(TypeDecorator):
+    """Coluna de vetor float32 (np.ndarray na leitura; lista ou array na escrita)."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, dimensions: Optional[int] = None):
+        super().__init__()
+        self.dimensions = dimensions
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return encode_vector(value, self.dimensions)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decode_vector(value)
@@ -0,0 +1,208 @@
+"""
+Benchmark do SearchEngine sobre corpora sintéticos (ver corpus.py): tempo de
+build, memória, latência p50/p95/p99 e linhas pontuadas por query, com e sem
+filtro de fase, para consultas amplas e estreitas.
+
+Uso:
+    python -m backend.benchmarks.bench_search --sizes 1000 10000 100000
+    python -m backend.benchmarks.bench_search --output atual.json --compare base.json
+    python -m backend.benchmarks.bench_search --ranker bm25 --compare tfidf.json
+    python -m backend.benchmarks.bench_search --shards 4 --compare 1shard.json
+    python -m backend.benchmarks.bench_search --retrieval maxscore --compare exhaustive.json
+
+O JSON de --output guarda o commit e os parâmetros, para comparar execuções
+entre commits com --compare.
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from ..app.block_max import RETRIEVAL_MODES, SEARCH_RETRIEVAL
+from ..app.rankers import SEARCH_RANKER
+from ..app.search_engine import SEARCH_SHARDS, SearchEngine
+from ..app.search_metrics import SearchTrace
+from .corpus import FASES, QUERIES, make_companies
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+FILTER_FASE = FASES[2]
+
+
+def rss_bytes() -> int:
+    """Memória residente atual do processo (Linux); fora dele, o pico."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def index_bytes(engine: SearchEngine) -> int:
+    """Tamanho dos arrays do índice (matriz TF-IDF, frequências, textos do fuzzy, store de empresas, estruturas do ranker e do block-max)."""
+    vectors = engine.company_vectors
+    total = vectors.data.nbytes + vectors.indices.nbytes + vectors.indptr.nbytes
+    total += np.asarray(engine.document_frequencies).nbytes
+    total += sum(len(text) for text in engine.company_texts)
+    total += engine.companies.memory_bytes()
+    total += engine.ranker.memory_bytes()
+    if engine.block_max_index is not None:
+        total += engine.block_max_index.memory_bytes()
+    return total
+
+
+def percentiles(latencies_ms):
+    values = np.asarray(latencies_ms)
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "queries": int(len(values)),
+    }
+
+
+def bench(n: int, repeat: int, seed: int = 42, ranker: str = SEARCH_RANKER, shards: int = SEARCH_SHARDS,
+          retrieval: str = SEARCH_RETRIEVAL) -> dict:
+    companies = make_companies(n, seed)
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    engine = SearchEngine(companies, ranker=ranker, shards=shards, retrieval=retrieval)
+    if engine._block_max():
+        # Montado sob demanda na primeira busca; aqui entra no build, não na latência
+        engine._block_max_index()
+    build_seconds = time.perf_counter() - start
+
+    result = {
+        "companies": n,
+        "build_seconds": build_seconds,
+        "rss_delta_mb": (rss_bytes() - rss_before) / 2**20,
+        "index_mb": index_bytes(engine) / 2**20,
+        "vocabulary": len(engine.tfidf_vectorizer.vocabulary_),
+        "scenarios": {},
+    }
+
+    for kind, queries in QUERIES.items():
+        for fase in (None, FILTER_FASE):
+            latencies, hits, evaluated = [], 0, 0
+            for _ in range(repeat):
+                for query in queries:
+                    # Mede o caminho completo, não o cache de resultados
+                    engine.result_cache.clear()
+                    trace = SearchTrace("bench")
+                    start = time.perf_counter()
+                    hits += len(engine.scored_search(query, fase=fase, trace=trace))
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    # Linhas cujo score foi calculado (só o ranker tfidf conta)
+                    evaluated += trace.rows.get("evaluated", 0)
+            scenario = f"{kind}_{'filtered' if fase else 'unfiltered'}"
+            result["scenarios"][scenario] = {
+                **percentiles(latencies),
+                "avg_results": hits / len(latencies),
+                "avg_evaluated": evaluated / len(latencies),
+            }
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+def print_result(result: dict):
+    print(
+        f"\n{result['companies']} empresas: build {result['build_seconds']:.2f}s, "
+        f"índice {result['index_mb']:.1f} MB, RSS +{result['rss_delta_mb']:.1f} MB, vocabulário {result['vocabulary']}"
+    )
+    print(f"  {'cenário':<20} | {'p50':>9} | {'p95':>9} | {'p99':>9} | {'resultados':>10} | {'pontuadas':>10}")
+    for name, scenario in result["scenarios"].items():
+        print(
+            f"  {name:<20} | {scenario['p50_ms']:>7.2f}ms | {scenario['p95_ms']:>7.2f}ms | "
+            f"{scenario['p99_ms']:>7.2f}ms | {scenario['avg_results']:>10.1f} | {scenario.get('avg_evaluated', 0):>10.0f}"
+        )
+
+
+def delta(new: float, old: float) -> float:
+    return 100 * (new - old) / old if old else 0.0
+
+
+def compare(current: dict, baseline: dict):
+    """Variação percentual do build, dos p50/p99 e das linhas pontuadas em relação a uma execução anterior."""
+    meta = baseline["meta"]
+    print(
+        f"\nComparação com {meta['commit']} ({meta.get('ranker', 'tfidf')}, {meta.get('retrieval', 'exhaustive')}) "
+        f"(negativo = mais rápido):"
+    )
+    base_by_size = {r["companies"]: r for r in baseline["results"]}
+    for result in current["results"]:
+        base = base_by_size.get(result["companies"])
+        if base is None:
+            continue
+        print(f"  {result['companies']} empresas: build {delta(result['build_seconds'], base['build_seconds']):+.1f}%")
+        for name, scenario in result["scenarios"].items():
+            old = base["scenarios"].get(name)
+            if old:
+                line = (
+                    f"    {name:<20} p50 {delta(scenario['p50_ms'], old['p50_ms']):+6.1f}%  "
+                    f"p99 {delta(scenario['p99_ms'], old['p99_ms']):+6.1f}%"
+                )
+                if scenario.get("avg_evaluated") and old.get("avg_evaluated"):
+                    line += f"  pontuadas {delta(scenario['avg_evaluated'], old['avg_evaluated']):+6.1f}%"
+                print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="ex.: 1000 10000 100000 1000000")
+    parser.add_argument("--repeat", type=int, default=10, help="repetições de cada query por cenário")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ranker", default=SEARCH_RANKER, choices=["tfidf", "bm25", "fields"])
+    parser.add_argument("--shards", type=int, default=SEARCH_SHARDS, help="shards pontuados em paralelo (só tfidf)")
+    parser.add_argument("--retrieval", default=SEARCH_RETRIEVAL, choices=list(RETRIEVAL_MODES),
+                        help="maxscore: top-k com poda por blocos (só tfidf)")
+    parser.add_argument("--output", help="grava os resultados em JSON")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "filter_fase": FILTER_FASE,
+            "ranker": args.ranker,
+            "shards": args.shards,
+            "retrieval": args.retrieval,
+        },
+        "results": [],
+    }
+    for n in args.sizes:
+        result = bench(n, args.repeat, args.seed, args.ranker, args.shards, args.retrieval)
+        print_result(result)
+        report["results"].append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados gravados em {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
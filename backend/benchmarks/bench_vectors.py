@@ -0,0 +1,77 @@
+"""
+Benchmark da gravação de embeddings: o caminho antigo (um INSERT por vetor,
+com o literal montado por str(list)) contra crud.replace_empresa_embeddings
+(lotes binários via COPY/executemany).
+
+Usa o banco de DATABASE_URL; para um teste local:
+    DATABASE_URL=sqlite:////tmp/bench_vectors.db python -m backend.benchmarks.bench_vectors --sizes 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine, table_registry
+
+LEGACY_TABLE = "bench_embeddings_legacy"
+
+
+def legacy_literal(vector) -> str:
+    # O que o adaptador global de list fazia: str() e troca de colchetes
+    return str(list(vector)).replace('[', '(').replace(']', ')')
+
+
+def bench(n: int, dimensions: int):
+    rng = np.random.default_rng(0)
+    ids = np.arange(1, n + 1)
+    vectors = rng.standard_normal((n, dimensions)).astype(np.float32)
+
+    db = SessionLocal()
+    try:
+        db.execute(text(f"DROP TABLE IF EXISTS {LEGACY_TABLE}"))
+        db.execute(text(f"CREATE TABLE {LEGACY_TABLE} (empresa_id BIGINT PRIMARY KEY, vetor TEXT)"))
+        db.commit()
+        start = time.perf_counter()
+        for empresa_id, vector in zip(ids, vectors):
+            db.execute(text(f"INSERT INTO {LEGACY_TABLE} VALUES ({int(empresa_id)}, '{legacy_literal(vector.tolist())}')"))
+        db.commit()
+        legacy_seconds = time.perf_counter() - start
+        db.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+        db.commit()
+
+        start = time.perf_counter()
+        crud.replace_empresa_embeddings(db, ids, vectors)
+        bulk_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, loaded = crud.get_empresa_embeddings(db)
+        load_seconds = time.perf_counter() - start
+        assert np.array_equal(loaded, vectors)
+        db.execute(models.EmpresaEmbedding.__table__.delete())
+        db.commit()
+    finally:
+        db.close()
+
+    print(
+        f"{n:>9} | {legacy_seconds:>9.2f}s | {bulk_seconds:>9.2f}s | {legacy_seconds / bulk_seconds:>6.1f}x | {load_seconds:>9.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--dimensions", type=int, default=128)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "sqlite":
+        print("Atenção: o benchmark apaga e regrava a tabela startup_embeddings.")
+    table_registry.metadata.create_all(bind=engine, tables=[models.EmpresaEmbedding.__table__])
+    print(f"{'vetores':>9} | {'literal':>10} | {'em lote':>10} | {'ganho':>7} | {'leitura':>10}")
+    for n in args.sizes:
+        bench(n, args.dimensions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Corpus sintético de startups com o formato de models.Empresa, para os
+benchmarks da busca. Determinístico para um mesmo (n, seed).
+"""
+import random
+from types import SimpleNamespace
+
+FASES = ["Ideação", "Validação", "Operação", "Tração", "Scale-up"]
+
+# Setor -> vocabulário típico das descrições de solução daquele setor
+SETORES = {
+    "Agrotech": [
+        "agricultura de precisão", "monitoramento de pragas", "drones de pulverização", "sensores de solo",
+        "irrigação inteligente", "rastreabilidade de grãos", "logística agrícola", "gestão de fazendas",
+        "previsão de safra", "pecuária leiteira",
+    ],
+    "Fintech": [
+        "pagamentos instantâneos", "crédito para pequenas empresas", "antifraude", "conta digital",
+        "gestão financeira", "open finance", "antecipação de recebíveis", "cobrança automatizada",
+        "seguros sob demanda", "investimentos",
+    ],
+    "Healthtech": [
+        "telemedicina", "prontuário eletrônico", "agendamento de consultas", "diagnóstico por imagem",
+        "monitoramento remoto de pacientes", "gestão hospitalar", "saúde mental", "farmácia digital",
+        "exames laboratoriais", "triagem com inteligência artificial",
+    ],
+    "Edtech": [
+        "cursos online", "ensino de programação", "plataforma de aprendizagem adaptativa", "gestão escolar",
+        "reforço escolar", "formação de professores", "idiomas", "avaliação educacional",
+        "ensino técnico", "microcertificações",
+    ],
+    "Logística": [
+        "roteirização de entregas", "rastreamento de cargas", "entregas de última milha", "gestão de frotas",
+        "armazenagem", "frete rodoviário", "logística reversa", "torre de controle",
+        "otimização de estoques", "cadeia de suprimentos",
+    ],
+    "Varejo": [
+        "marketplace", "comércio eletrônico", "análise de clientes", "programas de fidelidade",
+        "precificação dinâmica", "frente de caixa", "gestão de estoque", "autoatendimento",
+        "vitrine virtual", "recomendação de produtos",
+    ],
+    "Energia": [
+        "energia solar", "eficiência energética", "mercado livre de energia", "baterias",
+        "mobilidade elétrica", "geração distribuída", "medição inteligente", "hidrogênio verde",
+        "créditos de carbono", "biogás",
+    ],
+    "Segurança da Informação": [
+        "segurança de dados", "detecção de intrusão", "gestão de identidades", "proteção de endpoints",
+        "conformidade com a LGPD", "resposta a incidentes", "criptografia", "análise de vulnerabilidades",
+        "autenticação multifator", "segurança em nuvem",
+    ],
+    "Indústria 4.0": [
+        "manutenção preditiva", "automação industrial", "impressão 3D", "prototipagem rápida",
+        "gêmeo digital", "visão computacional", "robótica colaborativa", "controle de qualidade",
+        "internet das coisas industrial", "chão de fábrica conectado",
+    ],
+    "Construtech": [
+        "gestão de obras", "orçamento de obras", "materiais de construção", "modelagem BIM",
+        "locação de equipamentos", "vistoria de imóveis", "construção modular", "compra de imóveis",
+        "gestão de condomínios", "crédito imobiliário",
+    ],
+}
+
+TECNOLOGIAS = [
+    "inteligência artificial", "machine learning", "visão computacional", "internet das coisas",
+    "blockchain", "análise de dados", "aplicativo móvel", "software como serviço", "computação em nuvem",
+    "automação", "big data", "processamento de linguagem natural",
+]
+
+PUBLICOS = [
+    "pequenos produtores", "pequenas e médias empresas", "hospitais", "escolas", "varejistas",
+    "transportadoras", "indústrias", "cooperativas", "prefeituras", "consumidores finais",
+]
+
+MODELOS = [
+    "Plataforma de {area} com {tecnologia} para {publico}",
+    "Solução de {area} baseada em {tecnologia}",
+    "Software de {area} e {area2} para {publico}",
+    "{tecnologia} aplicada a {area} e {area2}",
+    "Serviço de {area} para {publico} usando {tecnologia}",
+]
+
+PREFIXOS = ["Agro", "Fin", "Med", "Edu", "Log", "Shop", "Volt", "Cyber", "Fab", "Build", "Data", "Smart", "Bio", "Neo"]
+SUFIXOS = ["Tech", "Sense", "Labs", "Hub", "Flow", "Mind", "Pay", "Go", "Link", "Box", "Pro", "IA", "Net", "Way"]
+UFS = ["SP", "RJ", "MG", "RS", "PR", "SC", "BA", "PE", "CE", "GO", "DF", "AM"]
+
+# Consultas por tipo: amplas casam com boa parte do corpus, estreitas com poucas empresas
+QUERIES = {
+    "broad": ["plataforma", "gestão", "inteligência artificial", "software para empresas"],
+    "narrow": [
+        "monitoramento de pragas com drones",
+        "antecipação de recebíveis para pequenas empresas",
+        "triagem com inteligência artificial em hospitais",
+        "manutenção preditiva na indústria",
+    ],
+}
+
+
+def make_company(i: int, rng: random.Random) -> SimpleNamespace:
+    setor_principal = rng.choice(list(SETORES))
+    setor_secundario = rng.choice([s for s in SETORES if s != setor_principal] + ["Inteligência Artificial", "SaaS"])
+    areas = SETORES[setor_principal]
+    solucao = rng.choice(MODELOS).format(
+        area=rng.choice(areas),
+        area2=rng.choice(areas if rng.random() < 0.7 else SETORES.get(setor_secundario, areas)),
+        tecnologia=rng.choice(TECNOLOGIAS),
+        publico=rng.choice(PUBLICOS),
+    )
+    if rng.random() < 0.4:
+        solucao += ", com " + rng.choice(areas) + " e " + rng.choice(TECNOLOGIAS)
+
+    return SimpleNamespace(
+        id=i + 1,
+        nome_da_empresa=f"{rng.choice(PREFIXOS)}{rng.choice(SUFIXOS)} {i + 1}",
+        endereco=f"Rua {rng.randint(1, 999)}, {rng.choice(UFS)}",
+        cnpj=f"{i + 1:08d}/0001-{rng.randint(10, 99)}",
+        ano_de_fundacao=rng.randint(2005, 2025),
+        site=f"https://startup{i + 1}.com.br",
+        rede_social=f"@startup{i + 1}",
+        cadastrado_por="benchmark",
+        cargo=rng.choice(["CEO", "CTO", "COO", "Fundador(a)"]),
+        email=f"contato@startup{i + 1}.com.br",
+        setor_principal=setor_principal,
+        setor_secundario=setor_secundario,
+        fase_da_startup=rng.choice(FASES),
+        colaboradores=rng.choice(["1-5", "6-10", "11-50", "51-200", "200+"]),
+        publico_alvo=rng.choice(["B2B", "B2C", "B2B2C", "B2G"]),
+        modelo_de_negocio=rng.choice(["SaaS", "Marketplace", "Licenciamento", "Assinatura", "Transacional"]),
+        recebeu_investimento=rng.choice(["Sim", "Não"]),
+        negocios_no_exterior=rng.choice(["Sim", "Não"]),
+        faturamento=rng.choice(["Pré-receita", "Até R$ 360 mil", "Até R$ 4,8 milhões", "Acima de R$ 4,8 milhões"]),
+        patente=rng.choice(["Sim", "Não"]),
+        ja_pivotou=rng.choice(["Sim", "Não"]),
+        comunidades=rng.choice(["Nenhuma", "Hub local", "Aceleradora", "Incubadora universitária"]),
+        solucao=solucao,
+        link_apresentacao=None,
+        link_video=None,
+        telefone_contato=None,
+    )
+
+
+def make_companies(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [make_company(i, rng) for i in range(n)]
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ..app import crud, database, models
+from ..app.database import table_registry
+from ..app.search_engine import SearchEngine
+from ..app.search_rebuild import rebuild_snapshot
+from ..app.search_snapshot import load_snapshot_rows
+from ..app.vector_type import Vector, decode_vector, encode_vector
+from .test_search_simple import MOCK_COMPANIES_DATA, build_mock_company
+
+
+@pytest.fixture()
+def db_session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    table_registry.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    for data in MOCK_COMPANIES_DATA:
+        session.add(build_mock_company(data))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_vector_encoding_round_trip_and_dimension_check():
+    vector = [0.5, -1.25, 3.0]
+    assert np.array_equal(decode_vector(encode_vector(vector)), np.array(vector, dtype=np.float32))
+    assert len(encode_vector(vector)) == 3 * 4
+
+    with pytest.raises(ValueError):
+        Vector(dimensions=4).process_bind_param(vector, None)
+    with pytest.raises(ValueError):
+        encode_vector([[1.0, 2.0]])
+
+
+def test_replace_embeddings_bulk_writes_and_reads_back(db_session, monkeypatch):
+    monkeypatch.setattr(crud, "EMBEDDINGS_BATCH_SIZE", 2)
+    vectors = np.arange(9, dtype=np.float32).reshape(3, 3)
+
+    assert crud.replace_empresa_embeddings(db_session, [3, 1, 2], vectors) == 3
+    ids, loaded = crud.get_empresa_embeddings(db_session)
+    assert ids.tolist() == [1, 2, 3]
+    assert np.array_equal(loaded, vectors[[1, 2, 0]])
+
+    # Regravação completa: o que não veio no refresh sai da tabela
+    crud.replace_empresa_embeddings(db_session, [2], vectors[:1])
+    ids, loaded = crud.get_empresa_embeddings(db_session)
+    assert ids.tolist() == [2] and np.array_equal(loaded, vectors[:1])
+
+    orm_row = db_session.get(models.EmpresaEmbedding, 2)
+    assert orm_row.vetor.dtype == np.float32
+
+
+def test_rebuild_with_new_snapshot_rewrites_lsa_vectors(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", lambda: db_session)
+
+    assert rebuild_snapshot(str(tmp_path)) == 3
+    ids, vectors = crud.get_empresa_embeddings(db_session)
+    published = load_snapshot_rows(str(tmp_path), crud.stream_empresas_for_index(db_session))
+    assert ids.tolist() == [1, 2, 3]
+    assert np.array_equal(vectors, published.semantic_index.embeddings)
+
+    # Banco igual: o snapshot é reaproveitado e a tabela não é regravada
+    db_session.execute(models.EmpresaEmbedding.__table__.delete())
+    db_session.commit()
+    rebuild_snapshot(str(tmp_path))
+    assert crud.get_empresa_embeddings(db_session)[0].tolist() == []
+
+
+def test_plain_lists_are_not_adapted_globally():
+    psycopg2_extensions = pytest.importorskip("psycopg2.extensions")
+    # Sem o adaptador global, uma lista volta a virar ARRAY e não um literal montado com str()
+    assert psycopg2_extensions.adapt([1, 2]).getquoted() == b"ARRAY[1,2]"
+
+
+def test_get_empresas_by_ids_keeps_requested_order(db_session):
+    empresas = crud.get_empresas_by_ids(db_session, [3, 99, 1])
+    assert [e.id for e in empresas] == [3, 1]
+    assert empresas[0].solucao == MOCK_COMPANIES_DATA[2]["solucao"]
+    assert crud.get_empresas_by_ids(db_session, []) == []
+
+
+def test_stream_empresas_for_index_feeds_engine(db_session):
+    rows = crud.stream_empresas_for_index(db_session, batch_size=2)
+    streamed = SearchEngine(rows)
+    reference = SearchEngine([build_mock_company(data) for data in MOCK_COMPANIES_DATA])
+
+    assert streamed.companies.ids.tolist() == [1, 2, 3]
+    for query in ("Plataforma de IA para fazendas", "agrotech", "impressão industrial"):
+        assert streamed.scored_search(query) == reference.scored_search(query)
+    # Só as colunas indexadas, sem objetos do ORM na sessão
+    assert not hasattr(next(iter(crud.stream_empresas_for_index(db_session))), "cnpj")
+    assert len(db_session.identity_map) == 0
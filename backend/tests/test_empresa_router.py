@@ -7,7 +7,7 @@ from typing import Generator
 # Importar a app principal e as dependências
 from ..app.main import app
 from ..app.database import get_db, table_registry
-from ..app import models
+from ..app import models, security
 
 # --- Configuração do Banco de Dados de Teste (SQLite em memória) ---
 # (Exatamente o mesmo setup do test_upload_endpoint.py)
@@ -186,4 +186,19 @@ def test_update_empresa_midia_not_found(client: TestClient, db_session: Session)
     )
     
     assert response.status_code == 404
-    assert response.json()["detail"] == "Empresa não encontrada"
\ No newline at end of file
+    assert response.json()["detail"] == "Empresa não encontrada"
+
+# --- Rebuild do índice de busca (só administradores) ---
+
+def test_reindex_requires_admin(client: TestClient, monkeypatch):
+    """
+    Testa o POST /optimized_search/reindex com um usuário fora de ADMIN_EMAILS
+    """
+    user = models.Usuario(email="usuario@teste.com", senha_hash="x")
+    app.dependency_overrides[security.get_current_user] = lambda: user
+    monkeypatch.setattr(security, "ADMIN_EMAILS", {"admin@teste.com"})
+
+    response = client.post("/optimized_search/reindex")
+
+    assert response.status_code == 403
+    assert security.get_current_admin_user(models.Usuario(email="Admin@Teste.com", senha_hash="x")).email == "Admin@Teste.com"
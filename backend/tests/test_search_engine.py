@@ -0,0 +1,1049 @@
+import asyncio
+import os
+import threading
+import time
+
+import nltk
+import numpy as np
+import pytest
+from typing import Any, Dict, List
+
+from rapidfuzz import fuzz
+from rapidfuzz.utils import default_process
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from ..app.search_engine import SearchEngine, StemCache, batch_fuzzy_scores, build_company_text, custom_tokenizer, fit_tfidf, normalize_query, top_k
+from ..app import search_cache, search_engine
+from ..app.search_executor import SearchExecutor, SearchQueueFull
+from ..app.search_cache import QueryResultCache
+from ..app.nlp_resources import NLPResourceError, NLPResources, nlp_resources
+from ..app.autocomplete import PrefixIndex
+from ..app.mapped_texts import MappedTexts
+from ..app.semantic_index import SemanticIndex, SemanticIndexUnavailable
+from ..app.rankers import INDEXED_FIELDS
+from ..app.spelling import SpellingIndex, deletes
+from ..app.search_metrics import Histogram, MetricsRegistry, SearchTrace
+from ..app.company_store import CompanyRecord, CompanyStore
+from ..app.block_max import BlockMaxIndex
+from ..benchmarks.corpus import make_companies
+from ..app.search_rebuild import RebuildInProgress, SearchIndexRebuilder
+from ..app.search_snapshot import (
+    corpus_fingerprint, load_or_build, load_or_build_rows, load_published, load_snapshot, load_snapshot_rows, save_snapshot, snapshot_changed,
+)
+from .test_search_simple import MOCK_COMPANIES_DATA, SEARCH_TEST_CASES, build_mock_company
+
+
+EXTRA_COMPANY_DATA = {
+    **MOCK_COMPANIES_DATA[0],
+    "id": 4, "nome_da_empresa": "AquaVida",
+    "solucao": "Sensores para monitoramento da qualidade da água em aquicultura",
+    "setor_principal": "Agrotech", "setor_secundario": "Internet das Coisas",
+    "fase_da_startup": "Seed", "cnpj": "44.444.444/0001-44",
+}
+
+
+def make_engine(extra: List[Dict[str, Any]] = (), ranker: str = "tfidf") -> SearchEngine:
+    companies = [build_mock_company(data) for data in [*MOCK_COMPANIES_DATA, *extra]]
+    return SearchEngine(companies, ranker=ranker)
+
+
+def result_ids(engine: SearchEngine, query: str, **kwargs) -> List[int]:
+    return [company.id for company in engine.optimized_search(query=query, **kwargs)]
+
+
+# --- Atualização incremental ---
+
+def test_add_makes_company_searchable_without_refit():
+    engine = make_engine()
+    vocabulary_before = engine.tfidf_vectorizer.vocabulary_
+
+    new_company = build_mock_company(EXTRA_COMPANY_DATA)
+    engine.add(new_company)
+
+    assert engine.tfidf_vectorizer.vocabulary_ is vocabulary_before
+    assert 4 in result_ids(engine, "sensores de água para aquicultura agrotech")
+
+    # A linha incremental deve ser idêntica ao transform do vetorizador congelado,
+    # sobre o mesmo texto pré-processado que o fit tokeniza
+    expected = engine.tfidf_vectorizer.transform([default_process(build_company_text(new_company))]).toarray()
+    np.testing.assert_allclose(engine.company_vectors[-1].toarray(), expected)
+
+    # "_" separa palavras só depois do default_process: tokenizado cru, o texto não teria termo nenhum
+    underscored = build_mock_company({
+        **EXTRA_COMPANY_DATA, "id": 5, "nome_da_empresa": "plataforma_fazendas", "solucao": "plataforma_fazendas",
+        "setor_principal": "agro_tech", "setor_secundario": "agro_tech",
+    })
+    engine.add(underscored)
+    assert engine.company_vectors[-1].nnz > 0
+    assert 5 in result_ids(engine, "plataforma fazendas")
+
+
+def test_remove_hides_company_from_results():
+    engine = make_engine()
+    assert 1 in result_ids(engine, "Plataforma de IA para fazendas")
+
+    assert engine.remove(1) is True
+    assert engine.remove(1) is False
+    assert 1 not in result_ids(engine, "Plataforma de IA para fazendas")
+
+
+def test_update_replaces_indexed_text():
+    engine = make_engine()
+    data = {**MOCK_COMPANIES_DATA[2], "solucao": "Drones para pulverização agrícola"}
+    engine.update(build_mock_company(data))
+
+    assert 3 not in result_ids(engine, "impressão industrial e prototipagem rápida")
+    assert 3 in result_ids(engine, "drones pulverização agrícola")
+
+
+def test_concurrent_writes_never_expose_half_written_rows():
+    engine = SearchEngine(make_companies(300, seed=17))
+    errors = []
+    stop = threading.Event()
+
+    def search():
+        while not stop.is_set():
+            try:
+                engine.result_cache.clear()
+                assert None not in engine.optimized_search("plataforma de gestão para varejo", limit=20)
+                engine.faceted_search("plataforma de gestão", limit=5)
+                engine.autocomplete("plat")
+            except Exception as exc:  # noqa: BLE001 - qualquer erro da busca falha o teste
+                errors.append(exc)
+
+    readers = [threading.Thread(target=search) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        for i in range(120):
+            engine.add(build_mock_company({
+                **EXTRA_COMPANY_DATA, "id": 10000 + i, "nome_da_empresa": f"Plataforma {i}",
+                "solucao": "Plataforma de gestão para varejo",
+            }))
+            if i % 4 == 3:
+                engine.remove(10000 + i - 2)
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    assert errors == []
+    assert engine.row_count == 300 + 120 - 30
+
+
+def test_update_never_hides_the_company_from_a_concurrent_search():
+    engine = make_engine()
+    missing = []
+    stop = threading.Event()
+
+    def watch():
+        while not stop.is_set():
+            with engine._reading():
+                if 1 not in engine._row_by_id:
+                    missing.append(engine.generation)
+
+    reader = threading.Thread(target=watch)
+    reader.start()
+    try:
+        for i in range(200):
+            engine.update(build_mock_company({**MOCK_COMPANIES_DATA[0], "solucao": f"Plataforma de IA versão {i}"}))
+    finally:
+        stop.set()
+        reader.join()
+
+    assert missing == []
+    assert 1 in result_ids(engine, "Plataforma de IA versão 199")
+
+
+def test_compact_matches_full_refit():
+    engine = make_engine([EXTRA_COMPANY_DATA])
+    engine.remove(2)
+    engine.compact()
+    assert len(engine.companies) == 3
+
+    refit = make_engine([EXTRA_COMPANY_DATA])
+    refit.remove(2)
+    refit.refit()
+
+    # O vocabulário compactado continua congelado, mas o IDF dos termos ativos
+    # deve coincidir com o de um fit completo.
+    vocabulary = engine.tfidf_vectorizer.vocabulary_
+    for term, column in refit.tfidf_vectorizer.vocabulary_.items():
+        assert engine.tfidf_vectorizer.idf_[vocabulary[term]] == pytest.approx(refit.tfidf_vectorizer.idf_[column])
+
+    query = "Plataforma de IA para fazendas"
+    assert result_ids(engine, query) == result_ids(refit, query)
+
+
+# --- Top-k vetorizado ---
+
+def test_top_k_orders_by_score_and_breaks_ties_by_row():
+    rows = np.array([10, 11, 12, 13, 14])
+    scores = np.array([80.0, 95.0, 80.0, 70.5, 80.0])
+
+    top_rows, top_scores = top_k(rows, scores, 3)
+
+    assert top_rows.tolist() == [11, 10, 12]
+    assert top_scores.tolist() == [95.0, 80.0, 80.0]
+    assert top_k(rows, scores, 10)[0].tolist() == [11, 10, 12, 14, 13]
+
+
+def test_limit_is_respected():
+    engine = make_engine([EXTRA_COMPANY_DATA])
+    assert len(engine.optimized_search("agrotech", limit=1)) <= 1
+    assert engine.optimized_search("agrotech", limit=0) == []
+
+
+# --- Fuzzy em lote ---
+
+def test_batch_fuzzy_matches_pairwise_scores_above_cutoff():
+    texts = [default_process(build_company_text(build_mock_company(d))) for d in MOCK_COMPANIES_DATA]
+    query = "plataforma de ia para fazendas"
+
+    pairwise = [fuzz.token_set_ratio(default_process(query), t) for t in texts]
+    np.testing.assert_allclose(batch_fuzzy_scores(query, texts, best_tfidf_score=100.0), pairwise, rtol=1e-5)
+
+    # Com tf-idf 0, só fuzzy acima de 140 passaria: nenhum candidato é pontuado
+    assert not batch_fuzzy_scores(query, texts, best_tfidf_score=0.0).any()
+
+
+# --- Memo de stems ---
+
+def test_stem_cache_counts_hits_and_persists(tmp_path):
+    cache = StemCache(maxsize=10)
+    assert cache.get("agricola") == cache.get("agricola")
+    assert cache.get("de") is None  # stop word continua descartada
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+    path = str(tmp_path / "stems.json")
+    cache.save(path)
+    warm = StemCache(maxsize=10)
+    assert warm.load(path) == 2
+    warm.get("agricola")
+    assert warm.stats()["misses"] == 0
+
+
+def test_stem_cache_is_bounded():
+    cache = StemCache(maxsize=3)
+    for token in ["alfa", "beta", "gama", "delta"]:
+        cache.get(token)
+    assert cache.stats()["size"] == 3
+
+
+# --- Pré-filtro por fase ---
+
+def test_fase_filter_scores_only_matching_rows():
+    engine = make_engine([EXTRA_COMPANY_DATA])
+    query = "agrotech"
+
+    assert set(result_ids(engine, query)) == {1, 4}
+    assert result_ids(engine, query, fase="Seed") == [4]
+    assert result_ids(engine, query, fase="Inexistente") == []
+    assert engine._fase_matrix("Seed").shape[0] == 2
+
+
+def test_fase_index_follows_incremental_writes():
+    engine = make_engine()
+    engine.add(build_mock_company(EXTRA_COMPANY_DATA))
+    # 'agrotech' já está no vocabulário congelado (empresa 1, Scale-up)
+    assert result_ids(engine, "agrotech", fase="Seed") == [4]
+
+    engine.update(build_mock_company({**EXTRA_COMPANY_DATA, "fase_da_startup": "Growth"}))
+    assert result_ids(engine, "agrotech", fase="Seed") == []
+    assert result_ids(engine, "agrotech", fase="Growth") == [4]
+
+
+# --- Cache de resultados ---
+
+def test_result_cache_hits_on_normalized_query():
+    engine = make_engine()
+    first = engine.scored_search("Plataforma de IA para fazendas")
+    again = engine.scored_search("  PLATAFORMA de ia para   fazendas")
+
+    assert again == first
+    stats = engine.result_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_result_cache_is_invalidated_by_index_writes():
+    engine = make_engine()
+    assert 1 in result_ids(engine, "Plataforma de IA para fazendas")
+
+    engine.remove(1)
+    assert 1 not in result_ids(engine, "Plataforma de IA para fazendas")
+    assert engine.result_cache.stats()["invalidations"] == 1
+
+
+def test_query_result_cache_evicts_by_size_and_ttl(monkeypatch):
+    cache = QueryResultCache(maxsize=2, ttl_seconds=10)
+    cache.put("a", 1, ("A",))
+    cache.put("b", 1, ("B",))
+    cache.get("a", 1)
+    cache.put("c", 1, ("C",))  # "b" é o menos usado recentemente
+
+    assert cache.get("b", 1) is None
+    assert cache.stats()["evictions"] == 1
+
+    now = time.monotonic()
+    monkeypatch.setattr(search_cache.time, "monotonic", lambda: now + 11)
+    assert cache.get("a", 1) is None
+    assert cache.stats()["expirations"] == 1
+
+
+# --- Snapshot em disco ---
+
+def test_snapshot_round_trip_uses_mmap_and_matches_results(tmp_path):
+    companies = [build_mock_company(d) for d in [*MOCK_COMPANIES_DATA, EXTRA_COMPANY_DATA]]
+    engine = SearchEngine(companies)
+    fingerprint = corpus_fingerprint(companies)
+    save_snapshot(engine, str(tmp_path), fingerprint)
+
+    loaded = load_snapshot(str(tmp_path), companies, fingerprint)
+
+    assert loaded is not None
+    assert not loaded.company_vectors.data.flags.writeable  # arrays mapeados do disco
+    # Uma cópia só do vocabulário (vocabulary_), sem o parâmetro `vocabulary`
+    assert loaded.tfidf_vectorizer.vocabulary is None
+    assert loaded.tfidf_vectorizer.vocabulary_ == engine.tfidf_vectorizer.vocabulary_
+    for case in ["Plataforma de IA para fazendas", "Segurança de dados e Machine Learning", "agrotech"]:
+        assert loaded.scored_search(case) == engine.scored_search(case)
+    assert loaded.scored_search("agrotech", fase="Seed") == engine.scored_search("agrotech", fase="Seed")
+
+    # Textos do fuzzy mapeados do texts.bin, decodificados só no acesso
+    assert isinstance(loaded.company_texts, MappedTexts)
+    assert list(loaded.company_texts) == engine.company_texts
+
+    # Escritas depois do load passam a usar uma cópia em memória
+    loaded.remove(1)
+    assert 1 not in result_ids(loaded, "Plataforma de IA para fazendas")
+    assert isinstance(loaded.company_texts, MappedTexts) and loaded.company_texts[0] == ""
+    # A segunda remoção passa do limite de compactação: os textos viram uma lista só das linhas vivas
+    loaded.update(build_mock_company({**EXTRA_COMPANY_DATA, "solucao": "Drones para pulverização"}))
+    assert loaded.company_texts[-1] == "aquavida drones para pulverizacao agrotech internet das coisas"
+    assert 4 in result_ids(loaded, "aquavida internet das coisas")
+
+
+def test_stale_snapshot_is_rejected(tmp_path):
+    companies = [build_mock_company(d) for d in MOCK_COMPANIES_DATA]
+    save_snapshot(SearchEngine(companies), str(tmp_path), corpus_fingerprint(companies))
+
+    edited = [build_mock_company({**d, "solucao": d["solucao"] + " com blockchain"}) for d in MOCK_COMPANIES_DATA]
+    assert load_snapshot(str(tmp_path), edited, corpus_fingerprint(edited)) is None
+
+    more = [*companies, build_mock_company(EXTRA_COMPANY_DATA)]
+    assert load_snapshot(str(tmp_path), more) is None
+
+
+def test_published_generation_is_observed_by_other_workers(tmp_path):
+    companies = [build_mock_company(d) for d in MOCK_COMPANIES_DATA]
+    base_dir = str(tmp_path)
+    worker_a = load_or_build(companies, base_dir)
+    worker_b = load_or_build(companies, base_dir)
+
+    # O segundo worker só mapeia o snapshot que o primeiro publicou
+    assert worker_b.snapshot_path == worker_a.snapshot_path
+    assert not snapshot_changed(worker_b, base_dir)
+
+    more = [*companies, build_mock_company(EXTRA_COMPANY_DATA)]
+    save_snapshot(SearchEngine(more), base_dir, corpus_fingerprint(more))
+
+    assert snapshot_changed(worker_b, base_dir)
+    reloaded = load_snapshot(base_dir, more)
+    assert reloaded.snapshot_generation == worker_b.snapshot_generation + 1
+
+
+def test_published_generation_is_adopted_after_db_changes(tmp_path):
+    companies = [build_mock_company(d) for d in [*MOCK_COMPANIES_DATA, EXTRA_COMPANY_DATA]]
+    base_dir = str(tmp_path)
+    published = load_or_build(companies, base_dir)
+
+    # Depois da publicação: uma empresa apagada, uma editada e uma nova
+    edited = [build_mock_company({**d, "nome_da_empresa": d["nome_da_empresa"] + " SA"}) for d in MOCK_COMPANIES_DATA[1:]]
+    rows = [*edited, build_mock_company(EXTRA_COMPANY_DATA), build_mock_company({**EXTRA_COMPANY_DATA, "id": 99})]
+    assert load_snapshot_rows(base_dir, iter(rows)) is None
+
+    adopted = load_published(base_dir, iter(rows))
+
+    assert adopted.snapshot_generation == published.snapshot_generation
+    assert adopted.row_count == published.row_count - 1
+    assert 1 not in result_ids(adopted, "Plataforma de IA para fazendas")
+    assert 99 not in adopted._row_by_id
+    assert result_ids(adopted, "agrotech") == [c for c in result_ids(published, "agrotech") if c != 1]
+
+
+# --- Executor dedicado ---
+
+def test_search_executor_times_out_and_rejects_when_full():
+    executor = SearchExecutor(threads=1, max_queue=1, timeout_seconds=0.05)
+    release = threading.Event()
+
+    async def scenario():
+        slow = asyncio.ensure_future(executor.run(release.wait, timeout=1))
+        await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(executor.run(lambda: "fila"))
+        await asyncio.sleep(0.01)
+        # A única thread está ocupada e a fila (tamanho 1) está cheia
+        with pytest.raises(SearchQueueFull):
+            await executor.run(lambda: "recusada")
+        # A busca que esperava na fila estoura o timeout e é descartada
+        with pytest.raises(asyncio.TimeoutError):
+            await queued
+        release.set()
+        await slow
+        return await executor.run(lambda: "ok")
+
+    assert asyncio.run(scenario()) == "ok"
+    stats = executor.stats()
+    assert stats["timeouts"] == 1
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+    assert stats["queue_depth"] == 0
+    executor.shutdown()
+
+
+def test_search_executor_works_again_after_shutdown():
+    # Um segundo lifespan no mesmo processo (TestClient, reload) reaproveita o executor global
+    executor = SearchExecutor(threads=1)
+    assert asyncio.run(executor.run(lambda: "primeiro")) == "primeiro"
+    executor.shutdown()
+    assert asyncio.run(executor.run(lambda: "segundo")) == "segundo"
+    executor.shutdown()
+
+
+def test_fuzzy_process_pool_matches_thread_path(monkeypatch):
+    texts = [default_process(build_company_text(build_mock_company(d))) for d in MOCK_COMPANIES_DATA] * 4
+    expected = batch_fuzzy_scores("plataforma de ia", texts, best_tfidf_score=60.0)
+
+    executor = SearchExecutor(threads=1, fuzzy_processes=2)
+    monkeypatch.setattr(search_engine, "search_executor", executor)
+    monkeypatch.setattr(search_engine, "FUZZY_PARALLEL_MIN_CANDIDATES", 1)
+    try:
+        np.testing.assert_allclose(batch_fuzzy_scores("plataforma de ia", texts, best_tfidf_score=60.0), expected)
+    finally:
+        executor.shutdown()
+
+
+# --- Busca em lote ---
+
+def test_batch_search_matches_individual_searches():
+    engine = make_engine([EXTRA_COMPANY_DATA])
+    items = [
+        ("Plataforma de IA para fazendas", None, 5),
+        ("Software Machine Learning", "Seed", 5),
+        ("agrotech", "Seed", 1),
+        ("agrotech", None, 5),
+        ("nada a ver", None, 5),
+    ]
+    reference = make_engine([EXTRA_COMPANY_DATA])
+
+    assert engine.batch_search(items) == [reference.scored_search(q, fase=f, limit=l) for q, f, l in items]
+    # A segunda rodada sai inteira do cache
+    engine.batch_search(items)
+    assert engine.result_cache.stats()["hits"] == len(items)
+
+
+# --- Rebuild em segundo plano ---
+
+def test_rebuild_keeps_old_generation_serving_until_swap():
+    old_engine = make_engine()
+    served = {"engine": old_engine}
+    companies = [build_mock_company(data) for data in MOCK_COMPANIES_DATA + [EXTRA_COMPANY_DATA]]
+    release_build = threading.Event()
+
+    def load_companies():
+        release_build.wait(5)
+        return companies
+
+    rebuilder = SearchIndexRebuilder(load_companies, lambda engine: served.update(engine=engine))
+    rebuilder.install(old_engine, 0.1)
+
+    async def scenario():
+        task = rebuilder.start()
+        await asyncio.sleep(0.05)
+        # Durante o build: a geração antiga continua servindo e um segundo rebuild é recusado
+        assert rebuilder.running
+        assert served["engine"] is old_engine
+        assert 4 not in result_ids(served["engine"], "agrotech")
+        with pytest.raises(RebuildInProgress):
+            rebuilder.start()
+        release_build.set()
+        return await task
+
+    assert asyncio.run(scenario()) == 2
+    assert served["engine"] is not old_engine
+    assert 4 in result_ids(served["engine"], "agrotech")
+    stats = rebuilder.stats()
+    assert stats["running"] is False
+    assert stats["row_count"] == 4
+    assert stats["rebuilds"] == 1 and stats["last_build_seconds"] > 0
+
+
+def test_second_start_is_rejected_before_the_first_task_runs():
+    served = {}
+    companies = [build_mock_company(data) for data in MOCK_COMPANIES_DATA]
+    rebuilder = SearchIndexRebuilder(lambda: companies, lambda engine: served.update(engine=engine))
+
+    async def scenario():
+        task = rebuilder.start()
+        # Sem nenhum await no meio: a primeira task ainda nem começou
+        assert rebuilder.running and rebuilder.last_started_at is not None
+        with pytest.raises(RebuildInProgress):
+            rebuilder.start()
+        return await task
+
+    assert asyncio.run(scenario()) == 1
+    assert rebuilder.stats()["rebuilds"] == 1 and rebuilder.stats()["failures"] == 0
+    assert rebuilder.running is False
+
+
+def test_failed_rebuild_keeps_current_engine():
+    old_engine = make_engine()
+    served = {"engine": old_engine}
+
+    def load_companies():
+        raise RuntimeError("banco indisponível")
+
+    rebuilder = SearchIndexRebuilder(load_companies, lambda engine: served.update(engine=engine))
+    rebuilder.install(old_engine)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(rebuilder.rebuild())
+    assert served["engine"] is old_engine
+    assert rebuilder.stats()["failures"] == 1
+    assert rebuilder.stats()["last_error"] == "banco indisponível"
+    assert rebuilder.generation == 1
+
+
+# --- Busca semântica (LSA + IVF) ---
+
+def test_semantic_search_finds_related_company_and_follows_writes():
+    engine = make_engine()
+    # A busca nunca ajusta o índice: sem o build, não há índice semântico
+    with pytest.raises(SemanticIndexUnavailable):
+        engine.semantic_search("logística agrícola com IA")
+    engine.fit_semantic_index()
+
+    assert engine.semantic_search("logística agrícola com IA")[0][0] == 1
+    assert {company_id for company_id, _ in engine.semantic_search("logística agrícola com IA", fase="Seed")} <= {2}
+
+    engine.remove(1)
+    assert 1 not in [company_id for company_id, _ in engine.semantic_search("logística agrícola com IA")]
+
+
+def test_consecutive_snapshots_with_semantic_index_are_published_and_loaded(tmp_path):
+    base_dir = str(tmp_path)
+    companies = [build_mock_company(d) for d in MOCK_COMPANIES_DATA]
+    more = [*companies, build_mock_company(EXTRA_COMPANY_DATA)]
+    paths = []
+    for corpus in (companies, more):
+        engine = SearchEngine(corpus)
+        engine.fit_semantic_index()
+        paths.append(save_snapshot(engine, base_dir, corpus_fingerprint(corpus)))
+
+        loaded = load_snapshot(base_dir, corpus, corpus_fingerprint(corpus))
+        assert loaded.snapshot_path == paths[-1]
+        assert loaded.semantic_index is not None
+        assert loaded.semantic_search("logística agrícola com IA") == engine.semantic_search("logística agrícola com IA")
+
+    assert [os.path.basename(path).startswith("snapshot-") for path in paths] == [True, True]
+    assert paths[0] != paths[1]
+    assert not [name for name in os.listdir(base_dir) if name.endswith(".tmp")]
+
+
+def test_semantic_index_is_saved_with_the_snapshot_and_survives_compaction(tmp_path):
+    companies = [build_mock_company(d) for d in [*MOCK_COMPANIES_DATA, EXTRA_COMPANY_DATA]]
+    built = load_or_build(companies, str(tmp_path))
+
+    # Reaberto do snapshot: o índice vem mapeado do disco, sem refazer o fit
+    loaded = load_snapshot(str(tmp_path), companies, corpus_fingerprint(companies))
+    assert not loaded.semantic_index.embeddings.flags.writeable
+    query = "logística agrícola com IA"
+    assert loaded.semantic_search(query) == built.semantic_search(query)
+
+    projection = loaded.semantic_index.projection
+    loaded.remove(2)
+    loaded.compact()
+    assert loaded.semantic_index.projection is projection
+    assert len(loaded.semantic_index.embeddings) == loaded.row_count == 3
+    assert [company_id for company_id, _ in loaded.semantic_search(query)] == [
+        company_id for company_id, _ in built.semantic_search(query) if company_id != 2
+    ]
+
+
+def test_ivf_with_all_lists_probed_matches_exhaustive_search():
+    companies = make_companies(400)
+    engine = SearchEngine(companies)
+    index = SemanticIndex.fit(engine.company_vectors, dimensions=32, nlist=16)
+    query_vector = engine.tfidf_vectorizer.transform(["antecipação de recebíveis e crédito para pequenas empresas"])
+
+    rows, scores = index.search(query_vector, nprobe=index.nlist)
+    exhaustive = index.embeddings @ index.project(query_vector)[0]
+    expected = np.flatnonzero(exhaustive >= 0.10)
+    assert sorted(rows.tolist()) == expected.tolist()
+
+    # Menos listas visitadas: subconjunto dos candidatos exatos
+    probed_rows, _ = index.search(query_vector, nprobe=2)
+    assert set(probed_rows.tolist()) <= set(expected.tolist())
+    assert len(probed_rows) < len(rows)
+
+
+# --- Autocomplete ---
+
+def test_autocomplete_matches_word_prefixes_and_ranks_name_start_first():
+    engine = make_engine([EXTRA_COMPANY_DATA])
+
+    assert engine.autocomplete("cyber") == [("empresa", "CyberGuard Pro", 2)]
+    # "pro" casa com o começo de ProtoMesh e com a segunda palavra de CyberGuard Pro
+    assert engine.autocomplete("PRO") == [("empresa", "ProtoMesh 3D", 3), ("empresa", "CyberGuard Pro", 2)]
+    # Setores: o mais popular (Agrotech, 2 empresas) primeiro, sem acento na chave
+    assert engine.autocomplete("a")[0] == ("setor", "Agrotech", None)
+    assert ("setor", "Inteligência Artificial", None) in engine.autocomplete("intelig")
+    assert engine.autocomplete("   ") == []
+    assert len(engine.autocomplete("a", limit=1)) == 1
+
+
+def test_autocomplete_follows_incremental_writes():
+    engine = make_engine()
+    assert engine.autocomplete("aqua") == []
+
+    engine.add(build_mock_company(EXTRA_COMPANY_DATA))
+    assert engine.autocomplete("aqua") == [("empresa", "AquaVida", 4)]
+
+    engine.remove(4)
+    assert engine.autocomplete("aqua") == []
+
+
+def test_prefix_index_is_updated_by_writes_not_rebuilt():
+    engine = SearchEngine(make_companies(200, seed=5))
+    for i in range(30):
+        engine.add(build_mock_company({**EXTRA_COMPANY_DATA, "id": 5000 + i, "nome_da_empresa": f"Nova Empresa {i}"}))
+    for company_id in engine.companies.ids[:40:3].tolist():
+        engine.remove(company_id)
+    engine.update(build_mock_company({**EXTRA_COMPANY_DATA, "id": 5001, "setor_principal": "Setor Inédito"}))
+    before_compact = engine.prefix_index
+    engine.compact()
+
+    # Ids não mudam na compactação: o índice passa para o estado novo como está
+    assert engine.prefix_index is before_compact
+    rebuilt = PrefixIndex.from_companies(engine.companies.records())
+    incremental = engine.prefix_index
+    assert incremental.keys == rebuilt.keys
+    assert sorted(zip(incremental.keys, incremental.scores.tolist(), incremental.suggestions)) == sorted(
+        zip(rebuilt.keys, rebuilt.scores.tolist(), rebuilt.suggestions)
+    )
+    assert incremental.sector_counts == rebuilt.sector_counts
+    assert ("setor", "Setor Inédito", None) in engine.autocomplete("setor ined")
+
+
+# --- Facetas ---
+
+def test_faceted_search_counts_every_match_not_only_the_page():
+    engine = make_engine([EXTRA_COMPANY_DATA])
+
+    results, total, facets = engine.faceted_search("Agrotech", limit=1)
+    assert len(results) == 1 and total == 2
+    assert results == engine.scored_search("Agrotech", limit=1)
+    assert facets["setor_principal"] == {"Agrotech": 2}
+    assert facets["fase_da_startup"] == {"Scale-up": 1, "Seed": 1}
+    assert facets["setor_secundario"] == {"Inteligência Artificial": 1, "Internet das Coisas": 1}
+
+    _, total, facets = engine.faceted_search("Agrotech", fase="Seed")
+    assert total == 1 and facets["fase_da_startup"] == {"Seed": 1}
+
+
+def test_facets_follow_incremental_writes():
+    engine = make_engine()
+    assert engine.faceted_search("Agrotech")[1] == 1
+
+    engine.add(build_mock_company(EXTRA_COMPANY_DATA))
+    assert engine.faceted_search("Agrotech")[2]["fase_da_startup"] == {"Scale-up": 1, "Seed": 1}
+
+    engine.remove(1)
+    assert engine.faceted_search("Agrotech")[2]["fase_da_startup"] == {"Seed": 1}
+    engine.compact()
+    assert engine.faceted_search("Agrotech")[2]["setor_principal"] == {"Agrotech": 1}
+
+
+# --- Ranker BM25 ---
+
+@pytest.mark.parametrize("ranker", ["bm25", "fields"])
+@pytest.mark.parametrize("case", SEARCH_TEST_CASES, ids=[c["description"] for c in SEARCH_TEST_CASES])
+def test_alternative_rankers_find_the_same_companies(case, ranker):
+    fase = case.get("fase_filter")
+    tfidf_ids = result_ids(make_engine(), case["query"], fase=fase)
+    assert result_ids(make_engine(ranker=ranker), case["query"], fase=fase) == tfidf_ids
+
+
+def test_bm25_follows_incremental_writes():
+    engine = make_engine(ranker="bm25")
+    engine.add(build_mock_company(EXTRA_COMPANY_DATA))
+    assert result_ids(engine, "agrotech", fase="Seed") == [4]
+    assert set(result_ids(engine, "agrotech")) == {1, 4}
+
+    engine.remove(1)
+    assert result_ids(engine, "agrotech") == [4]
+    engine.compact()
+    assert result_ids(engine, "agrotech") == [4]
+    assert engine.batch_search([("agrotech", None, 5)]) == [engine.scored_search("agrotech")]
+
+
+@pytest.mark.parametrize("ranker, structure", [("bm25", "_postings"), ("fields", "_matrix")])
+def test_ranker_structures_are_built_on_load_and_writes_not_on_search(ranker, structure):
+    companies = make_companies(200, seed=5)
+    built = SearchEngine(companies, ranker=ranker)
+    engine = SearchEngine.from_state(
+        companies, built.company_texts, built.tfidf_vectorizer, built.company_vectors, built.document_frequencies, ranker=ranker,
+    )
+    assert getattr(engine.ranker, structure) is not None
+
+    extra = build_mock_company({**EXTRA_COMPANY_DATA, "id": 1000})
+    engine.add(extra)
+    assert getattr(engine.ranker, structure) is not None
+    engine.remove(companies[0].id)
+    assert getattr(engine.ranker, structure) is not None
+    engine.compact()
+    assert getattr(engine.ranker, structure) is not None
+    assert 1000 in result_ids(engine, "aquavida internet das coisas")
+
+
+def test_bm25_postings_match_bruteforce_scores():
+    companies = make_companies(300, seed=3)
+    engine = SearchEngine(companies, ranker="bm25")
+    ranker = engine.ranker
+    query = search_engine.normalize_query("monitoramento de pragas com drones")
+
+    rows, relevance = ranker.candidates(engine, engine._query_terms(query), None)
+
+    counts = ranker._counts.toarray()
+    lengths = counts.sum(axis=1)
+    idf = np.log(1 + (len(counts) - (counts > 0).sum(axis=0) + 0.5) / ((counts > 0).sum(axis=0) + 0.5))
+    vocabulary = engine.tfidf_vectorizer.vocabulary_
+    terms = [vocabulary[t] for t in engine._analyzer(query) if t in vocabulary]
+    tf = counts[:, terms]
+    norm = ranker.k1 * (1 - ranker.b + ranker.b * lengths / lengths.mean())
+    expected = (idf[terms] * tf * (ranker.k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+    expected /= (idf[terms] * (ranker.k1 + 1)).sum()
+
+    np.testing.assert_allclose(relevance, expected[rows], rtol=1e-5)
+    assert set(rows) == set(np.flatnonzero(expected >= ranker.min_relevance))
+
+
+# --- Ranker por campo ---
+
+def test_field_ranker_sums_weighted_per_field_cosines():
+    engine = make_engine([EXTRA_COMPANY_DATA], ranker="fields")
+    ranker = engine.ranker
+    query = "sensores agrotech"
+
+    rows, relevance = ranker.candidates(engine, engine._query_terms(query), None)
+
+    expected = np.zeros(engine.row_count)
+    query_vector = engine.tfidf_vectorizer.transform([query])
+    for field in INDEXED_FIELDS:
+        texts = [ranker.field_text(build_mock_company(data), field) for data in [*MOCK_COMPANIES_DATA, EXTRA_COMPANY_DATA]]
+        cosines = engine.tfidf_vectorizer.transform(texts).dot(query_vector.T).toarray().ravel()
+        expected += ranker.field_weights[field] * cosines
+    np.testing.assert_allclose(relevance, expected[rows])
+    assert set(rows) == set(np.flatnonzero(expected >= ranker.min_relevance))
+
+
+def test_field_ranker_compaction_reweights_the_matrix_like_a_fresh_transform():
+    companies = make_companies(300, seed=11)
+    engine = SearchEngine(companies, ranker="fields")
+    for company in companies[:100]:
+        engine.remove(company.id)
+    engine.compact()
+
+    ranker = engine.ranker
+    fresh = ranker._field_rows(engine, ranker._texts)
+    assert ranker._matrix.shape == fresh.shape == (200, len(INDEXED_FIELDS) * len(engine.tfidf_vectorizer.vocabulary_))
+    np.testing.assert_allclose(ranker._matrix.toarray(), fresh.toarray(), atol=1e-12)
+
+
+def test_field_ranker_restricts_search_to_requested_fields():
+    engine = make_engine([EXTRA_COMPANY_DATA], ranker="fields")
+
+    assert set(result_ids(engine, "agrotech", fields=["setor_principal"])) == {1, 4}
+    assert result_ids(engine, "agrotech", fields=["nome_da_empresa", "solucao"]) == []
+    assert result_ids(engine, "cyberguard", fields=["nome_da_empresa"]) == [2]
+    assert result_ids(engine, "agrotech", fase="Seed", fields=["setor_principal"]) == [4]
+    with pytest.raises(ValueError, match="telefone"):
+        engine.scored_search("agrotech", fields=["telefone"])
+
+
+def test_field_ranker_follows_incremental_writes():
+    engine = make_engine(ranker="fields")
+    assert result_ids(engine, "agrotech") == [1]
+
+    engine.add(build_mock_company(EXTRA_COMPANY_DATA))
+    assert result_ids(engine, "agrotech", fase="Seed") == [4]
+    engine.remove(1)
+    assert result_ids(engine, "agrotech") == [4]
+    engine.compact()
+    assert result_ids(engine, "agrotech", fields=["setor_principal"]) == [4]
+
+
+def test_unknown_ranker_is_rejected():
+    with pytest.raises(ValueError, match="SEARCH_RANKER"):
+        make_engine(ranker="pagerank")
+
+
+# --- Correção de digitação ---
+
+def test_spelling_index_picks_closest_then_most_frequent_term():
+    index = SpellingIndex(["fazend", "seguranc", "segur", "dron", "carg", "prag"], np.array([5, 3, 9, 1, 7, 2]))
+
+    assert index.correct("fazend") == "fazend"
+    assert index.correct("fazned") == "fazend"  # transposição conta como 1
+    assert index.correct("segurnac") == "seguranc"
+    assert index.correct("parg") == "carg"  # empate em distância 1: maior frequência
+    assert index.correct("xyzwvu") is None
+    assert index.correct("ai") is None  # curto demais para corrigir
+    assert index.correct_all(["dornn", "ia"]) == ["dron", "ia"]
+    assert deletes("abc", 1) == {"abc", "bc", "ac", "ab"}
+
+
+def test_spelling_option_recovers_misspelled_queries():
+    engine = make_engine()
+
+    for query, expected in [("segurnaça de dados", 2), ("mahcine learnig", 2), ("agrotehc", 1)]:
+        assert engine.scored_search(query) == []
+        assert [company_id for company_id, _ in engine.scored_search(query, spelling=True)] == [expected]
+
+    # Sem erros, a query analisada é a mesma com ou sem correção
+    query = "plataforma de ia para fazendas"
+    assert sorted(engine._query_terms(query, spelling=True)) == sorted(engine._query_terms(query))
+
+
+def test_spelling_index_is_built_with_the_index_and_rebuilt_only_on_refit():
+    engine = make_engine()
+    index = engine.spelling_index
+    assert index is not None
+
+    engine.add(build_mock_company(EXTRA_COMPANY_DATA))
+    engine.compact()
+    assert engine.spelling_index is index
+
+    engine.refit()
+    assert engine.spelling_index is not index
+    assert set(result_ids(engine, "agrotehc", spelling=True)) == {1, 4}
+
+
+# --- Shards ---
+
+def test_sharded_engine_returns_identical_results(monkeypatch):
+    monkeypatch.setattr(search_engine, "SHARD_MIN_ROWS", 0)
+    companies = make_companies(2000, seed=11)
+    plain = SearchEngine(companies, shards=1)
+    sharded = SearchEngine(companies, shards=5)
+    queries = ["plataforma", "gestão de frotas", "inteligência artificial para hospitais", "energia solar", "nada a ver"]
+
+    def check():
+        for query in queries:
+            for fase in (None, "Tração", "Inexistente"):
+                for limit in (1, 5, 50):
+                    assert sharded.scored_search(query, fase=fase, limit=limit) == plain.scored_search(query, fase=fase, limit=limit)
+                assert sharded.faceted_search(query, fase=fase) == plain.faceted_search(query, fase=fase)
+
+    assert sharded._sharded() and len(sharded._shard_views(None)) == 5
+    check()
+
+    for engine in (plain, sharded):
+        engine.add(build_mock_company({**EXTRA_COMPANY_DATA, "id": 5000, "fase_da_startup": "Tração"}))
+        engine.remove(7)
+        engine.remove(1500)
+    check()
+
+
+# --- Top-k com poda (block-max MaxScore) ---
+
+def test_block_max_bounds_and_scores_match_the_sparse_product():
+    engine = SearchEngine(make_companies(1000, seed=5))
+    index = BlockMaxIndex(engine.company_vectors, block_rows=64)
+    query_vector = engine._terms_vector(engine._query_terms(normalize_query("gestão de estoque para varejo")))
+    columns, weights = query_vector.indices, query_vector.data
+    exact = engine.company_vectors.dot(query_vector.T).toarray().ravel()
+
+    blocks, bounds = index.block_bounds(columns, weights)
+    rows, cosine_scores = index.score_blocks(columns, weights, blocks)
+    assert np.array_equal(rows, np.flatnonzero(exact))
+    # Mesma soma, na mesma ordem: igualdade exata, não aproximada
+    assert np.array_equal(cosine_scores, exact[rows])
+    assert np.all(bounds[np.searchsorted(blocks, rows // 64)] >= cosine_scores - 1e-12)
+
+
+def test_maxscore_retrieval_returns_exhaustive_top_k_with_fewer_rows():
+    companies = make_companies(3000, seed=13)
+    plain = SearchEngine(companies, retrieval="exhaustive")
+    pruned = SearchEngine(companies, retrieval="maxscore")
+    queries = ["plataforma", "gestão de frotas", "inteligência artificial para hospitais", "energia solar", "nada a ver"]
+
+    def check():
+        for query in queries:
+            for fase in (None, "Tração", "Inexistente"):
+                for limit in (1, 5, 50):
+                    assert pruned.scored_search(query, fase=fase, limit=limit) == plain.scored_search(query, fase=fase, limit=limit)
+
+    check()
+    plain_trace, pruned_trace = SearchTrace(), SearchTrace()
+    plain.result_cache.clear()
+    pruned.result_cache.clear()
+    plain.scored_search("plataforma", trace=plain_trace)
+    pruned.scored_search("plataforma", trace=pruned_trace)
+    assert plain_trace.rows["evaluated"] == 3000
+    assert pruned_trace.rows["evaluated"] < 3000 / 5
+
+    for engine in (plain, pruned):
+        engine.add(build_mock_company({**EXTRA_COMPANY_DATA, "id": 5000, "fase_da_startup": "Tração"}))
+        engine.remove(7)
+    assert pruned.block_max_index is None
+    check()
+    for engine in (plain, pruned):
+        engine.compact()
+    check()
+
+    with pytest.raises(ValueError):
+        SearchEngine(companies[:10], retrieval="wand")
+
+
+# --- Métricas por estágio ---
+
+def test_search_trace_records_stages_and_row_counts(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(search_engine, "search_metrics", registry)
+    engine = make_engine([EXTRA_COMPANY_DATA])
+
+    trace = SearchTrace()
+    companies = engine.optimized_search("agrotech", trace=trace)
+    assert {c.id for c in companies} == {1, 4}
+    assert {"normalize", "analyze", "vectorize", "cosine", "fuzzy", "top_k", "hydrate"} <= set(trace.stages_ms)
+    assert trace.rows == {"evaluated": 4, "candidates": 2, "fuzzy_scored": 2, "returned": 2}
+    assert "total;dur=" in trace.server_timing()
+
+    cached = SearchTrace()
+    engine.optimized_search("agrotech", trace=cached)
+    assert cached.cache_hit and "cache;desc=hit" in cached.server_timing()
+
+    engine.batch_search([("agrotech", None, 5), ("software", None, 5)])
+    snapshot = registry.snapshot()
+    assert snapshot["optimized_search"]["searches"] == 2
+    assert snapshot["optimized_search"]["cache_hits"] == 1
+    assert snapshot["optimized_search"]["rows"]["candidates"]["count"] == 1
+    assert snapshot["batch_search"]["stages_ms"]["total"]["count"] == 1
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = Histogram([1, 10, 100])
+    for value in [0.5] * 50 + [5] * 45 + [50] * 4 + [500]:
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.95) == 10
+    assert histogram.quantile(0.99) == 100
+    assert histogram.quantile(1.0) == 500  # último bucket: o máximo observado
+    assert histogram.snapshot()["buckets"] == {"1": 50, "10": 45, "100": 4, "+inf": 1}
+
+
+# --- Store compacto ---
+
+def test_store_keeps_only_search_columns():
+    engine = make_engine([EXTRA_COMPANY_DATA])
+
+    record = engine.optimized_search("sensores de água para aquicultura agrotech")[0]
+    assert isinstance(record, CompanyRecord)
+    assert (record.id, record.nome_da_empresa, record.fase_da_startup) == (4, "AquaVida", "Seed")
+    assert not hasattr(record, "solucao")
+    # Agrotech aparece em duas empresas mas é guardado uma vez só
+    assert engine.companies.values["setor_principal"].count("Agrotech") == 1
+
+
+def test_store_codes_follow_remove_and_compact():
+    engine = make_engine([EXTRA_COMPANY_DATA])
+    engine.remove(1)
+    assert engine._company_by_id(1) is None
+    assert engine.facet_counts(np.arange(len(engine.companies)))["setor_principal"]["Agrotech"] == 1
+
+    engine.compact()
+    fresh = CompanyStore.from_companies(
+        build_mock_company(data) for data in [*MOCK_COMPANIES_DATA[1:], EXTRA_COMPANY_DATA]
+    )
+    assert engine.companies.ids.tolist() == fresh.ids.tolist() == [2, 3, 4]
+    for field in fresh.codes:
+        assert engine.companies.values[field] == fresh.values[field]
+        assert engine.companies.codes[field].tolist() == fresh.codes[field].tolist()
+    assert {fase: rows.tolist() for fase, rows in engine._fase_rows.items()} == {
+        fase: rows.tolist() for fase, rows in fresh.rows_by_value("fase_da_startup").items()
+    }
+
+
+def test_refit_uses_stored_texts():
+    engine = make_engine([EXTRA_COMPANY_DATA], ranker="fields")
+    engine.remove(2)
+    engine.refit()
+
+    fresh = SearchEngine(
+        [build_mock_company(data) for data in [MOCK_COMPANIES_DATA[0], MOCK_COMPANIES_DATA[2], EXTRA_COMPANY_DATA]],
+        ranker="fields",
+    )
+    assert engine.tfidf_vectorizer.vocabulary_ == fresh.tfidf_vectorizer.vocabulary_
+    for query in ("agrotech", "sensores de água", "impressão industrial"):
+        assert result_ids(engine, query) == result_ids(fresh, query)
+
+
+# --- Build em streaming ---
+
+def test_fit_tfidf_matches_sklearn_fit_transform():
+    texts = [build_company_text(c) for c in make_companies(300, seed=3)] + [""]
+    reference = TfidfVectorizer(tokenizer=custom_tokenizer, ngram_range=(1, 2))
+    expected = reference.fit_transform(texts)
+
+    vectorizer, vectors, document_frequencies = fit_tfidf(texts)
+
+    assert vectorizer.vocabulary_ == reference.vocabulary_
+    np.testing.assert_allclose(vectorizer.idf_, reference.idf_)
+    np.testing.assert_allclose(vectors.toarray(), expected.toarray(), atol=1e-12)
+    assert document_frequencies.tolist() == np.bincount(expected.indices, minlength=expected.shape[1]).tolist()
+    np.testing.assert_allclose(vectorizer.transform(texts[:3]).toarray(), expected[:3].toarray(), atol=1e-12)
+
+
+def test_streaming_build_reads_rows_once_and_reuses_snapshot(tmp_path):
+    companies = [build_mock_company(d) for d in [*MOCK_COMPANIES_DATA, EXTRA_COMPANY_DATA]]
+    reference = SearchEngine(companies)
+
+    built = load_or_build_rows(iter(companies), str(tmp_path))
+    reopened = load_or_build_rows(iter(companies), str(tmp_path))
+
+    assert reopened.snapshot_path == built.snapshot_path is not None
+    assert not reopened.company_vectors.data.flags.writeable
+    for query in ["Plataforma de IA para fazendas", "agrotech", "sensores de água"]:
+        assert reopened.scored_search(query) == built.scored_search(query) == reference.scored_search(query)
+    # O snapshot gravado pelo caminho em streaming também serve para o da lista
+    assert load_snapshot(str(tmp_path), companies, corpus_fingerprint(companies)) is not None
+
+    edited = [*companies[:-1], build_mock_company({**EXTRA_COMPANY_DATA, "solucao": "Drones agrícolas"})]
+    assert load_snapshot_rows(str(tmp_path), iter(edited)) is None
+    with pytest.raises(ValueError, match="ordem crescente"):
+        load_snapshot_rows(str(tmp_path), reversed(companies))
+
+
+# --- Recursos do NLTK ---
+
+def test_nlp_resources_fail_fast_without_downloading(tmp_path, monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("nltk.download não deve ser chamado")
+
+    monkeypatch.setattr(nltk, "download", no_network)
+
+    with pytest.raises(NLPResourceError, match="stopwords, rslp"):
+        NLPResources(paths=[str(tmp_path)]).check()
+    with pytest.raises(NLPResourceError, match=str(tmp_path)):
+        NLPResources(paths=[str(tmp_path)]).get()
+
+
+def test_nlp_resources_load_once_from_declared_paths():
+    stop_words, stemmer = nlp_resources.get()
+    assert "empresa" in stop_words and "de" in stop_words
+    assert nlp_resources.get()[1] is stemmer
+    assert nlp_resources.stats()["loaded"] and nlp_resources.stats()["init_seconds"] is not None
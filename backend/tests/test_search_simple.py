@@ -30,7 +30,16 @@ MOCK_COMPANIES_DATA = [
     },
 ]
 
-MOCK_COMPANIES: List[models_app.Empresa] = [models_app.Empresa(**data) for data in MOCK_COMPANIES_DATA]
+def build_mock_company(data: Dict[str, Any]) -> models_app.Empresa:
+    # 'id' é init=False no modelo, então é atribuído depois da construção
+    data = dict(data)
+    company_id = data.pop("id")
+    company = models_app.Empresa(**data)
+    company.id = company_id
+    return company
+
+
+MOCK_COMPANIES: List[models_app.Empresa] = [build_mock_company(data) for data in MOCK_COMPANIES_DATA]
 
 
 SEARCH_TEST_CASES = [
@@ -106,7 +115,7 @@ def get_ground_truth_ids_direct(all_companies: List[models_app.Empresa], case: D
 @pytest.mark.parametrize("case", SEARCH_TEST_CASES, ids=[c["description"] for c in SEARCH_TEST_CASES])
 def test_optimized_search_logic_metrics(case: Dict[str, Any]):
     
-    expected_ids = get_ground_truth_ids_direct(TEST_ENGINE.all_companies_list, case)
+    expected_ids = get_ground_truth_ids_direct(MOCK_COMPANIES, case)
     
     if not expected_ids:
         pytest.skip(f"Ground Truth VAZIO para o caso: {case['description']}. Pulando teste.")